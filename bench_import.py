@@ -0,0 +1,62 @@
+"""
+导入耗时基准：在全新的解释器里反复执行导入语句，统计耗时中位数。
+
+    python bench_import.py            # 默认每条语句 10 次
+    python bench_import.py 20
+
+同时检查 `from database import ...` 之后 pandas / duckdb 是否仍未被加载、
+数据库是否仍未打开，批量计算的工作进程和 notebook 启动都依赖这一点。
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+STATEMENTS = {
+    "python 启动": "pass",
+    "import database": "import database",
+    "from database import stock": "from database import stock",
+    "from database import *": "from database import *",
+    "首次查询": "from database import stock; stock.query_df('SELECT 1')",
+}
+
+CHECK = """
+import sys
+from database import connection, csindex, indicator, shenwan, stock
+loaded = [m for m in ("pandas", "duckdb", "pyarrow") if m in sys.modules]
+print(",".join(loaded) or "-", connection.is_open)
+"""
+
+
+def _timeit(statement: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(repeat: int = 10):
+    print(f"\n{'=' * 50}\n导入耗时（中位数，{repeat} 次）")
+    baseline = None
+    for name, statement in STATEMENTS.items():
+        elapsed = _timeit(statement, repeat)
+        baseline = elapsed if baseline is None else baseline
+        extra = (elapsed - baseline) * 1000
+        print(f"{name:<28} {elapsed * 1000:8.1f} ms  (+{extra:.1f})")
+
+    out = subprocess.run(
+        [sys.executable, "-c", CHECK], check=True, capture_output=True, text=True
+    ).stdout.split()
+    loaded, opened = out[0], out[1] == "True"
+    if loaded == "-" and not opened:
+        print("✅ 导入 database 未加载 pandas / duckdb / pyarrow，也未打开数据库")
+    else:
+        print(f"❌ 导入 database 时已加载: {loaded}，数据库已打开: {opened}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -1,67 +1,177 @@
+import os
 from datetime import timedelta
 from functools import partial
+from typing import Iterator, Optional, Sequence, Union
 
+import numpy as np
 import pandas as pd
 
-from calculate.my_talib import (
-    calculate_adx,
-    calculate_atr,
-    calculate_bbands,
-    calculate_ma,
-    calculate_ma_power_ratio,
-    calculate_macd,
-    calculate_mavol,
+from calculate.incremental import (
+    STATE_INDICATORS,
+    STATE_INPUTS,
+    advance_state,
+    extract_state,
+    load_new_bars,
 )
-from common import batch_processor
-from database import indicator, stock
+from calculate.panel import iter_panels
+from calculate.registry import registry
+from calculate.segments import Panel, panel_from_frame
+from common import BackgroundWriter, batch_processor
+from database import (
+    ensure_schema,
+    indicator,
+    indicator_state,
+    indicator_wide,
+    stock,
+)
+
+# 指标长表的列，与 calc_indicator 表一致
+LONG_COLUMNS = ["date", "symbol", "indicator", "value"]
+
+
+def _query_start_date(start_date: str, lookback_days: int) -> str:
+    """指标预热需要往前多取的数据起点"""
+    return (
+        pd.to_datetime(start_date) - timedelta(days=lookback_days * 1.5 + 80)
+    ).strftime("%Y-%m-%d")
 
 
 def calculate(
-    symbol: str, start_date: str, end_date: str, lookback_days: int
+    symbol: str,
+    start_date: str,
+    end_date: str,
+    lookback_days: int,
+    indicators: Optional[Sequence[str]] = None,
 ) -> pd.DataFrame:
     """
     计算指定股票在某个日期范围内的技术指标。
     """
-    query_start_date = (
-        pd.to_datetime(start_date) - timedelta(days=lookback_days * 1.5 + 80)
-    ).strftime("%Y-%m-%d")
+    query_start_date = _query_start_date(start_date, lookback_days)
 
     data = stock.query(symbol=symbol, start_date=query_start_date, end_date=end_date)
 
-    if data.empty:
-        return pd.DataFrame()
-
-    data = data.set_index("date").sort_index()
-
-    ma = calculate_ma(data)
-    # 指标计算逻辑不变
-    indicators = pd.concat(
-        [
-            ma,
-            calculate_ma_power_ratio(ma),
-            calculate_atr(data),
-            calculate_mavol(data),
-            calculate_macd(data),
-            calculate_adx(data),
-            calculate_bbands(data),
-        ],
-        axis=1,
+    return calculate_frame(symbol, data, start_date, end_date, indicators)
+
+
+def load_frames(
+    symbols: list[str], start_date: str, end_date: str, lookback_days: int
+) -> dict[str, pd.DataFrame]:
+    """一次查询取出一批股票的行情（含预热区间），按 symbol 拆分"""
+    df = stock.query_many(
+        symbols, _query_start_date(start_date, lookback_days), end_date
+    )
+    return {
+        symbol: group.reset_index()
+        for symbol, group in df.groupby(level="symbol", sort=False)
+    }
+
+
+def calculate_frame(
+    symbol: str,
+    data: pd.DataFrame | None,
+    start_date: str,
+    end_date: str,
+    indicators: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """
+    用已经取好的行情数据计算技术指标，data 需包含预热区间，按日期升序。
+    单只股票当作只有一个区间的面板，与 panel 模式走同一套注册表。
+    """
+    if data is None or data.empty:
+        return pd.DataFrame(columns=LONG_COLUMNS)
+
+    panel = panel_from_frame(data.sort_values("date"), symbol=symbol)
+    return panel_to_long(
+        panel, calculate_panel_indicators(panel, indicators), start_date, end_date
+    )
+
+
+def calculate_panel_indicators(
+    panel: Panel, indicators: Union[None, str, Sequence[str]] = None
+) -> dict[str, np.ndarray]:
+    """
+    在整个面板上一次性计算指标，indicators 的写法见 IndicatorRegistry.resolve，
+    默认计算全部默认启用的指标。
+    """
+    return registry.compute(panel, indicators)
+
+
+def iter_panel_long(
+    panel: Panel, indicators: dict[str, np.ndarray], start_date: str, end_date: str
+) -> Iterator[pd.DataFrame]:
+    """
+    逐个指标生成 (date, symbol, indicator, value) 长表，
+    只保留 [start_date, end_date] 内的非空值，数值保留两位小数。
+    """
+    if len(panel) == 0:
+        return
+
+    in_range = (panel.dates >= np.datetime64(start_date)) & (
+        panel.dates <= np.datetime64(end_date)
+    )
+    symbol_col = np.asarray(panel.symbols, dtype=object)[panel.symbol_ids()]
+
+    for name, values in indicators.items():
+        values = np.round(values, 2)
+        mask = in_range & ~np.isnan(values)
+        yield pd.DataFrame(
+            {
+                "date": panel.dates[mask],
+                "symbol": symbol_col[mask],
+                "indicator": name,
+                "value": values[mask],
+            }
+        )
+
+
+def panel_to_long(
+    panel: Panel, indicators: dict[str, np.ndarray], start_date: str, end_date: str
+) -> pd.DataFrame:
+    """把面板上的指标数组转换成一张长表"""
+    frames = list(iter_panel_long(panel, indicators, start_date, end_date))
+    if not frames:
+        return pd.DataFrame(columns=LONG_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def panel_to_wide(
+    panel: Panel, indicators: dict[str, np.ndarray], start_date: str, end_date: str
+) -> pd.DataFrame:
+    """
+    把面板上的指标数组转换成 (symbol, date, 指标列...) 宽表，
+    只保留 [start_date, end_date] 内至少有一个非空指标的行。
+    """
+    in_range = (panel.dates >= np.datetime64(start_date)) & (
+        panel.dates <= np.datetime64(end_date)
     )
+    values = {name: np.round(v, 2) for name, v in indicators.items()}
+    if values:
+        any_value = ~np.all(np.isnan(np.column_stack(list(values.values()))), axis=1)
+        in_range &= any_value
 
-    # 保留需要插入数据库的日期范围 [start_date, end_date]
-    indicators = indicators.loc[start_date:end_date]
-    indicators = indicators.reset_index().rename(columns={"index": "date"})
-    indicators["symbol"] = symbol
+    symbol_col = np.asarray(panel.symbols, dtype=object)[panel.symbol_ids()]
+    return pd.DataFrame(
+        {
+            "symbol": symbol_col[in_range],
+            "date": panel.dates[in_range],
+            **{name: v[in_range] for name, v in values.items()},
+        }
+    )
 
-    indicators = indicators.copy()
-    numeric_cols = indicators.select_dtypes(include="number").columns
-    indicators[numeric_cols] = indicators[numeric_cols].round(2)
 
-    return indicators.melt(
-        id_vars=["date", "symbol"],
-        var_name="indicator",
-        value_name="value",
-    ).dropna(subset=["value"])
+def calculate_panel(
+    panel: Panel,
+    start_date: str,
+    end_date: str,
+    indicators: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """
+    计算整个面板的技术指标，返回与 calculate 相同格式的长表
+    (date, symbol, indicator, value)。
+    """
+    return panel_to_long(
+        panel, calculate_panel_indicators(panel, indicators), start_date, end_date
+    )
 
 
 def run_indicator_calculate(
@@ -69,10 +179,138 @@ def run_indicator_calculate(
     chunk_size: int = 500,
     max_workers: int = 8,
     lookback_days: int = 300,
+    mode: str = "panel",
+    incremental: bool = True,
+    storage: str = "long",
+    start_method: Optional[str] = None,
+    max_pending: int = 2,
+    indicators: Union[None, str, Sequence[str]] = None,
 ):
     """
     执行指标计算和更新。
+
+    mode:
+        - "panel": 一次扫描 v_qfq_stocks，按 chunk_size 只股票一组在面板上整体计算
+        - "symbol": 逐只股票查询，在进程池中计算
+    incremental:
+        仅 panel 模式有效。计算时把递推状态写入 calc_indicator_state，
+        之后的更新对有状态的股票只推进新增的 K 线，不再重新预热。
+    storage:
+        - "long": 写入长表 calc_indicator
+        - "wide": 写入宽表 calc_indicator_wide，仅 panel 模式
+        - "both": 两张表都写
+    start_method:
+        仅 symbol 模式有效，进程池的启动方式 "fork" / "forkserver" / "spawn"。
+    max_pending:
+        计算与入库流水线并行：后台线程负责写入，最多积压 max_pending 批未写入的结果，
+        队列满时计算方等待。
+    indicators:
+        要计算的指标，写法见 IndicatorRegistry.resolve，如 ["+dkx", "-bb_width"]；
+        为 None 时读取环境变量 INDICATORS（逗号分隔），都没有则计算默认指标。
+        启用了无法沿状态递推的指标时，incremental 不生效。
     """
+    if mode not in ("panel", "symbol"):
+        raise ValueError(f"不支持的计算模式: {mode}")
+    if storage not in ("long", "wide", "both"):
+        raise ValueError(f"不支持的存储方式: {storage}")
+    if storage != "long" and mode != "panel":
+        raise ValueError("宽表存储仅支持 panel 模式")
+    if indicators is None:
+        indicators = os.environ.get("INDICATORS") or None
+    names = registry.resolve(indicators)
+    use_state = incremental and mode == "panel"
+    if use_state and not set(names) <= set(STATE_INDICATORS):
+        print("启用的指标中有无法增量递推的指标，改为窗口重算")
+        use_state = False
+    # 状态提取需要的指标即使未启用也要算出来，只是不写入
+    compute_names = registry.resolve(names + STATE_INPUTS) if use_state else names
+    write_long = storage in ("long", "both")
+    write_wide = storage in ("wide", "both")
+    ensure_schema()
+    if write_wide:
+        indicator_wide.ensure_columns(names)
+
+    def save(panel, values, start, end, state=None) -> int:
+        """
+        按存储方式写入，返回写入的行数。
+
+        指标和递推状态在同一个事务里提交，任一步失败整体回滚：不会出现指标已写入、
+        状态还停在旧日期的情况，重算时也就不会重复写入同一天的指标。
+        """
+        values = {name: values[name] for name in names}
+        n_rows = 0
+        cursor = indicator.conn.cursor()
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            if write_long:
+                n_rows += indicator.insert_many(
+                    iter_panel_long(panel, values, start, end), cursor=cursor
+                )
+            if write_wide:
+                wide_df = panel_to_wide(panel, values, start, end)
+                indicator_wide.insert(wide_df, cursor=cursor)
+                n_rows += len(wide_df)
+            if state is not None:
+                indicator_state.save(state, cursor=cursor)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+        return n_rows
+
+    def save_panel(i, panel, values, start, end):
+        try:
+            state = extract_state(panel, values) if use_state else None
+            n_rows = save(panel, values, start, end, state)
+            print(f"第 {i + 1} 批已写入 {n_rows} 行指标")
+            print("✅ 插入成功。")
+        except Exception as e:
+            print(f"❌ 插入失败: {e}")
+
+    def execute_panel(symbols_to_process, start, end):
+        panels = iter_panels(
+            symbols=symbols_to_process,
+            start_date=_query_start_date(start, lookback_days),
+            end_date=end,
+            chunk_size=chunk_size,
+        )
+        # 主线程计算下一批的同时，后台线程写入上一批
+        with BackgroundWriter(save_panel, max_pending=max_pending) as writer:
+            for i, panel in enumerate(panels):
+                try:
+                    values = calculate_panel_indicators(panel, compute_names)
+                except Exception as e:
+                    print(f"❌ 第 {i + 1} 批计算失败: {e}")
+                    continue
+                print(
+                    f"第 {i + 1} 批计算完成，{panel.n_symbols} 只股票，准备入库..."
+                )
+                writer.submit(i, panel, values, start, end)
+
+    def execute_state(symbols_to_process, start, end) -> set[str]:
+        """
+        用已保存的状态推进，返回已推进的股票。
+
+        失败时指标和状态都已回滚，返回空集合，全部改走窗口重算。
+        """
+        state = indicator_state.load(symbols_to_process)
+        if state.empty:
+            return set()
+
+        print(f"{len(state)} 只股票使用递推状态增量计算")
+        bars = load_new_bars(state["symbol"].tolist(), end)
+        if len(bars) > 0:
+            try:
+                values, new_state = advance_state(state, bars)
+                n_rows = save(bars, values, start, end, new_state)
+                print(f"已写入 {n_rows} 行指标")
+                print("✅ 插入成功。")
+            except Exception as e:
+                print(f"❌ 状态递推失败，改为窗口重算: {e}")
+                return set()
+        return set(state["symbol"])
 
     def execute(symbols_to_process, start, end):
         if not symbols_to_process:
@@ -81,31 +319,47 @@ def run_indicator_calculate(
 
         print(f"处理 {len(symbols_to_process)} 只股票, 日期范围: {start} - {end}")
 
+        if mode == "panel":
+            execute_panel(symbols_to_process, start, end)
+            return
+
         worker = partial(
-            calculate, start_date=start, end_date=end, lookback_days=lookback_days
+            calculate_frame, start_date=start, end_date=end, indicators=names
+        )
+        loader = partial(
+            load_frames, start_date=start, end_date=end, lookback_days=lookback_days
         )
 
-        for i, results_list in enumerate(
-            batch_processor(
-                items=symbols_to_process,
-                worker_func=worker,
-                max_workers=max_workers,
-                chunk_size=chunk_size,
-            )
-        ):
+        def insert(i, results_list):
             try:
-                print(
-                    f"第 {i + 1} 批计算完成，合并 {len(results_list)} 个结果并准备入库..."
-                )
-                combined_df = pd.concat(results_list, ignore_index=True)
-                print(f"正在将 {len(combined_df)} 条指标插入数据库...")
-                indicator.insert(combined_df)
-                print("✅ 插入成功。")
+                indicator.insert_many(results_list)
+                print(f"✅ 第 {i + 1} 批插入成功。")
             except Exception as e:
                 print(f"❌ 插入失败: {e}")
 
+        # 主进程按批读取行情交给工作进程计算，工作进程不访问数据库；
+        # 写入在后台线程进行，与下一批的读取和计算重叠
+        with BackgroundWriter(insert, max_pending=max_pending) as writer:
+            for i, results_list in enumerate(
+                batch_processor(
+                    items=symbols_to_process,
+                    worker_func=worker,
+                    max_workers=max_workers,
+                    chunk_size=chunk_size,
+                    chunksize=max(1, chunk_size // (max_workers * 4)),
+                    start_method=start_method,
+                    load_chunk=loader,
+                )
+            ):
+                print(
+                    f"第 {i + 1} 批计算完成，{len(results_list)} 个结果准备入库..."
+                )
+                writer.submit(i, results_list)
+
     print(f"\n{'=' * 50}\n开始技术指标计算和更新")
-    latest_indicator_date = indicator.get_latest_date()
+    latest_indicator_date = (
+        indicator_wide if storage == "wide" else indicator
+    ).get_latest_date()
     is_full_init = latest_indicator_date is None
     start_date = (
         "1900-01-01"
@@ -128,26 +382,42 @@ def run_indicator_calculate(
 
     if is_full_init:
         print("数据库无指标，将进行全量初始化。")
+        symbols_to_refresh = []
+    else:
+        xdxr_symbols = stock.list_stocks_with_xdxr(start_date=start_date)
+        symbols_to_refresh = list(set(xdxr_symbols) & set(symbols))
+
+    # 除权除息的股票稍后全量重算，这里跳过
+    refresh_set = set(symbols_to_refresh)
+    symbols_to_process = [s for s in symbols if s not in refresh_set]
+
+    if use_state and not is_full_init:
+        advanced = execute_state(symbols_to_process, start_date, end_date)
+        symbols_to_process = [s for s in symbols_to_process if s not in advanced]
 
     execute(
-        symbols_to_process=symbols,
+        symbols_to_process=symbols_to_process,
         start=start_date,
         end=end_date,
     )
 
-    if not is_full_init:
-        xdxr_symbols = stock.list_stocks_with_xdxr(start_date=start_date)
-        symbols_to_refresh = list(set(xdxr_symbols) & set(symbols))
-
-        if symbols_to_refresh:
-            print(f"\n近期有 {len(symbols_to_refresh)} 只股票除权除息")
-            print(f"\n删除 {len(symbols_to_refresh)} 只股票的历史指标")
+    if symbols_to_refresh:
+        print(f"\n近期有 {len(symbols_to_refresh)} 只股票除权除息")
+        print(f"\n删除 {len(symbols_to_refresh)} 只股票的历史指标")
+        if write_long:
             indicator.delete_symbols(symbols_to_refresh)
+        if write_wide:
+            indicator_wide.delete_symbols(symbols_to_refresh)
+        indicator_state.delete_symbols(symbols_to_refresh)
+
+        execute(
+            symbols_to_process=symbols_to_refresh,
+            start="1900-01-01",
+            end=end_date,
+        )
 
-            execute(
-                symbols_to_process=symbols_to_refresh,
-                start="1900-01-01",
-                end=end_date,
-            )
+    if is_full_init and write_wide:
+        print("整理宽表数据顺序...")
+        indicator_wide.recluster()
 
     print(f"🎉 指标更新完成\n{'=' * 50}\n")
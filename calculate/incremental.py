@@ -0,0 +1,282 @@
+"""
+基于持久化递推状态的指标增量计算。
+
+全量计算（面板模式）结束时把每只股票最后一根 K 线的 EMA、Wilder 平滑的 ADX/DI
+累加量以及滚动窗口尾部写入 calc_indicator_state，夜间更新时只需把状态向前推进
+新增的 K 线，复杂度与新增 K 线数量成正比。
+
+与窗口全量重算相比，增量结果在四舍五入前只有浮点误差级别的差异：
+EMA/ADX 的初始值差异按 (1 - alpha) ** n 衰减，预热窗口足够长时可以忽略。
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import talib
+
+from calculate.panel import panel_from_arrow
+from calculate.segments import Panel, segment_true_range
+from database import indicator_state, stock
+
+# 状态需要的最少 K 线数量，不足时走窗口重算
+WARMUP_BARS = 100
+
+CLOSE_TAIL = 60
+VOLUME_TAIL = 20
+TR_TAIL = 14
+RATIO_TAIL = 5
+
+ADX_PERIOD = 14
+MACD_FAST_K = 2 / (12 + 1)
+MACD_SLOW_K = 2 / (26 + 1)
+MACD_SIGNAL_K = 2 / (9 + 1)
+
+# 能沿状态递推的指标，即默认启用的指标
+STATE_INDICATORS = [
+    "ma10", "ma20", "ma60", "ma_power_ratio", "ma_power_slope", "atr",
+    "ma5_vol", "ma10_vol", "ma20_vol", "macd", "signal", "hist",
+    "adx", "pdi", "mdi", "bb_upper", "bb_middle", "bb_lower", "bb_width",
+]  # fmt: skip
+
+# extract_state 从面板计算结果中读取的指标
+STATE_INPUTS = ["ma_power_ratio", "macd", "signal", "adx", "pdi", "mdi"]
+
+STATE_COLUMNS = [
+    "symbol",
+    "date",
+    "n_bars",
+    "ema_fast",
+    "ema_slow",
+    "macd_signal",
+    "prev_high",
+    "prev_low",
+    "prev_close",
+    "tr_smooth",
+    "pdm_smooth",
+    "mdm_smooth",
+    "adx",
+    "close_tail",
+    "volume_tail",
+    "tr_tail",
+    "ratio_tail",
+]
+
+
+def _is_zero(x: np.ndarray) -> np.ndarray:
+    # 与 talib 的 TA_IS_ZERO 相同的阈值
+    return np.abs(x) < 1e-8
+
+
+def extract_state(panel: Panel, indicators: dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    从面板计算结果中提取每只股票最后一根 K 线的递推状态。
+    """
+    lengths = panel.lengths
+    eligible = np.flatnonzero(lengths >= WARMUP_BARS)
+    if len(eligible) == 0:
+        return pd.DataFrame(columns=STATE_COLUMNS)
+
+    close, high, low = panel["close"], panel["high"], panel["low"]
+    volume = panel["volume"]
+    tr = segment_true_range(panel)
+    last = panel.offsets[1:][eligible] - 1
+
+    # talib 不直接暴露 MACD 内部的 EMA，用慢线 EMA 反推快线
+    ema_slow = np.empty(len(eligible))
+    pdm = np.empty(len(eligible))
+    mdm = np.empty(len(eligible))
+    atr = np.empty(len(eligible))
+    for k, i in enumerate(eligible):
+        start, end = panel.offsets[i], panel.offsets[i + 1]
+        h, lo, c = high[start:end], low[start:end], close[start:end]
+        ema_slow[k] = talib.EMA(c, 26)[-1]
+        pdm[k] = talib.PLUS_DM(h, lo, ADX_PERIOD)[-1]
+        mdm[k] = talib.MINUS_DM(h, lo, ADX_PERIOD)[-1]
+        atr[k] = talib.ATR(h, lo, c, ADX_PERIOD)[-1]
+
+    # PLUS_DI = 100 * pdm / tr_smooth，由此还原 ADX 内部平滑后的 TR
+    pdi = indicators["pdi"][last]
+    mdi = indicators["mdi"][last]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tr_smooth = np.where(
+            ~_is_zero(pdi),
+            pdm * 100 / pdi,
+            np.where(~_is_zero(mdi), mdm * 100 / mdi, atr * ADX_PERIOD),
+        )
+
+    def tail(x, n):
+        return list(np.stack([x[e - n + 1 : e + 1] for e in last]))
+
+    return pd.DataFrame(
+        {
+            "symbol": [panel.symbols[i] for i in eligible],
+            "date": panel.dates[last],
+            "n_bars": lengths[eligible].astype(np.int32),
+            "ema_fast": indicators["macd"][last] + ema_slow,
+            "ema_slow": ema_slow,
+            "macd_signal": indicators["signal"][last],
+            "prev_high": high[last],
+            "prev_low": low[last],
+            "prev_close": close[last],
+            "tr_smooth": tr_smooth,
+            "pdm_smooth": pdm,
+            "mdm_smooth": mdm,
+            "adx": indicators["adx"][last],
+            "close_tail": tail(close, CLOSE_TAIL),
+            "volume_tail": tail(volume, VOLUME_TAIL),
+            "tr_tail": tail(tr, TR_TAIL),
+            "ratio_tail": tail(indicators["ma_power_ratio"], RATIO_TAIL),
+        },
+        columns=STATE_COLUMNS,
+    )
+
+
+def advance_state(
+    state: pd.DataFrame, panel: Panel
+) -> tuple[dict[str, np.ndarray], pd.DataFrame]:
+    """
+    把状态沿 panel 中的新 K 线逐根向前推进。
+
+    所有股票同时推进：第 j 步处理每只股票的第 j 根新 K 线，
+    循环次数等于新增 K 线最多的那只股票的 K 线数。
+
+    :return: (STATE_INDICATORS 中各指标的数组, 推进后的状态)
+    """
+    st = state.set_index("symbol").loc[panel.symbols]
+
+    n_bars = st["n_bars"].to_numpy().astype(np.int64)
+    ema_fast = st["ema_fast"].to_numpy(dtype=np.float64).copy()
+    ema_slow = st["ema_slow"].to_numpy(dtype=np.float64).copy()
+    signal = st["macd_signal"].to_numpy(dtype=np.float64).copy()
+    prev_high = st["prev_high"].to_numpy(dtype=np.float64).copy()
+    prev_low = st["prev_low"].to_numpy(dtype=np.float64).copy()
+    prev_close = st["prev_close"].to_numpy(dtype=np.float64).copy()
+    tr_smooth = st["tr_smooth"].to_numpy(dtype=np.float64).copy()
+    pdm = st["pdm_smooth"].to_numpy(dtype=np.float64).copy()
+    mdm = st["mdm_smooth"].to_numpy(dtype=np.float64).copy()
+    adx = st["adx"].to_numpy(dtype=np.float64).copy()
+    closes = np.stack(st["close_tail"].to_numpy())
+    volumes = np.stack(st["volume_tail"].to_numpy())
+    trs = np.stack(st["tr_tail"].to_numpy())
+    ratios = np.stack(st["ratio_tail"].to_numpy())
+    last_dates = st["date"].to_numpy().astype("datetime64[D]")
+
+    out = {name: np.full(len(panel), np.nan) for name in STATE_INDICATORS}
+
+    lengths = panel.lengths
+    starts = panel.offsets[:-1]
+    n_steps = int(lengths.max()) if len(lengths) else 0
+    N = ADX_PERIOD
+
+    for j in range(n_steps):
+        a = np.flatnonzero(lengths > j)
+        rows = starts[a] + j
+        h, lo, c = panel["high"][rows], panel["low"][rows], panel["close"][rows]
+        v = panel["volume"][rows]
+
+        # 滚动窗口
+        closes[a] = np.column_stack([closes[a, 1:], c])
+        volumes[a] = np.column_stack([volumes[a, 1:], v])
+        pc = prev_close[a]
+        tr = np.maximum.reduce([h - lo, np.abs(h - pc), np.abs(lo - pc)])
+        trs[a] = np.column_stack([trs[a, 1:], tr])
+
+        ma10 = closes[a, -10:].mean(axis=1)
+        ma20 = closes[a, -20:].mean(axis=1)
+        ma60 = closes[a, -60:].mean(axis=1)
+        out["ma10"][rows] = ma10
+        out["ma20"][rows] = ma20
+        out["ma60"][rows] = ma60
+
+        ratio = ((ma10 > ma20).astype(int) + (ma10 > ma60) + (ma20 > ma60)) / 3.0
+        out["ma_power_ratio"][rows] = ratio
+        out["ma_power_slope"][rows] = (ratio - ratios[a, 0]) / RATIO_TAIL
+        ratios[a] = np.column_stack([ratios[a, 1:], ratio])
+
+        out["atr"][rows] = trs[a].mean(axis=1)
+        out["ma5_vol"][rows] = volumes[a, -5:].mean(axis=1)
+        out["ma10_vol"][rows] = volumes[a, -10:].mean(axis=1)
+        out["ma20_vol"][rows] = volumes[a, -20:].mean(axis=1)
+
+        # MACD：与 talib 相同的 EMA 递推
+        ema_fast[a] += (c - ema_fast[a]) * MACD_FAST_K
+        ema_slow[a] += (c - ema_slow[a]) * MACD_SLOW_K
+        macd = ema_fast[a] - ema_slow[a]
+        signal[a] += (macd - signal[a]) * MACD_SIGNAL_K
+        out["macd"][rows] = macd
+        out["signal"][rows] = signal[a]
+        out["hist"][rows] = (macd - signal[a]) * 2
+
+        # ADX/DI：Wilder 平滑，分支与 talib 的实现保持一致
+        diff_p = h - prev_high[a]
+        diff_m = prev_low[a] - lo
+        plus = np.where((diff_p > 0) & (diff_p > diff_m), diff_p, 0.0)
+        minus = np.where((diff_m > 0) & (diff_p < diff_m), diff_m, 0.0)
+        pdm[a] += plus - pdm[a] / N
+        mdm[a] += minus - mdm[a] / N
+        tr_smooth[a] += tr - tr_smooth[a] / N
+
+        valid_tr = ~_is_zero(tr_smooth[a])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pdi = np.where(valid_tr, 100 * pdm[a] / tr_smooth[a], 0.0)
+            mdi = np.where(valid_tr, 100 * mdm[a] / tr_smooth[a], 0.0)
+            di_sum = pdi + mdi
+            dx = 100 * np.abs(mdi - pdi) / di_sum
+        update = valid_tr & ~_is_zero(di_sum)
+        adx[a] = np.where(update, (adx[a] * (N - 1) + dx) / N, adx[a])
+        out["adx"][rows] = adx[a]
+        out["pdi"][rows] = pdi
+        out["mdi"][rows] = mdi
+
+        # BBANDS：20 日均值与总体标准差
+        std20 = closes[a, -20:].std(axis=1)
+        out["bb_middle"][rows] = ma20
+        out["bb_upper"][rows] = ma20 + 2 * std20
+        out["bb_lower"][rows] = ma20 - 2 * std20
+        out["bb_width"][rows] = 4 * std20 / ma20
+
+        prev_high[a], prev_low[a], prev_close[a] = h, lo, c
+        n_bars[a] += 1
+        last_dates[a] = panel.dates[rows]
+
+    new_state = pd.DataFrame(
+        {
+            "symbol": panel.symbols,
+            "date": last_dates,
+            "n_bars": n_bars.astype(np.int32),
+            "ema_fast": ema_fast,
+            "ema_slow": ema_slow,
+            "macd_signal": signal,
+            "prev_high": prev_high,
+            "prev_low": prev_low,
+            "prev_close": prev_close,
+            "tr_smooth": tr_smooth,
+            "pdm_smooth": pdm,
+            "mdm_smooth": mdm,
+            "adx": adx,
+            "close_tail": list(closes),
+            "volume_tail": list(volumes),
+            "tr_tail": list(trs),
+            "ratio_tail": list(ratios),
+        },
+        columns=STATE_COLUMNS,
+    )
+    return out, new_state
+
+
+def load_new_bars(symbols: list[str], end_date: str) -> Panel:
+    """一次查询取出所有股票在各自状态日期之后的新 K 线"""
+    query = f"""
+        SELECT q.symbol, q.date, q.open, q.high, q.low, q.close, q.volume
+        FROM {stock.qfq_table_name} q
+        JOIN {indicator_state.table_name} s ON q.symbol = s.symbol
+        WHERE s.symbol IN (SELECT UNNEST(?))
+          AND q.date > s.date AND q.date <= ?
+        ORDER BY q.symbol, q.date
+    """
+    with stock.conn.cursor() as cursor:
+        table: pa.Table = cursor.execute(
+            query, (list(symbols), end_date)
+        ).fetch_arrow_table()
+    return panel_from_arrow(table)
+
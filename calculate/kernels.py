@@ -0,0 +1,295 @@
+"""
+逐根 K 线递推、无法直接向量化的指标内核（ZigZag、SMMA 等）。
+
+安装了 numba 时编译执行；没有 numba 时退化为普通 Python 循环，结果相同。
+内核只接受 NumPy 数组，分段版本按 offsets 在一次调用里处理整个面板。
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# ZigZag 阈值类型
+ZIGZAG_PCT = 0
+ZIGZAG_ABS = 1
+ZIGZAG_ATR = 2
+
+
+def zigzag_threshold(
+    pct: Optional[float] = None,
+    abs_thresh: Optional[float] = None,
+    atr_mult: Optional[float] = None,
+) -> Tuple[int, float]:
+    """按 pct > abs_thresh > atr_mult 的优先级确定阈值类型和数值"""
+    if pct is not None:
+        return ZIGZAG_PCT, float(pct)
+    if abs_thresh is not None:
+        return ZIGZAG_ABS, float(abs_thresh)
+    if atr_mult is not None:
+        return ZIGZAG_ATR, float(atr_mult)
+    raise ValueError("必须提供 pct、abs_thresh 或 atr_mult 之一")
+
+
+@njit(cache=True)
+def _moved(ref_price, cur_price, up, mode, value, atr):
+    if mode == ZIGZAG_PCT:
+        if up:
+            return cur_price >= ref_price * (1 + value)
+        return cur_price <= ref_price * (1 - value)
+    move = cur_price - ref_price if up else ref_price - cur_price
+    if mode == ZIGZAG_ABS:
+        return move >= value
+    return move >= value * atr
+
+
+@njit(cache=True)
+def _zigzag_segment(
+    high, low, close, atr, start, end, mode, value, min_bars, pivots, points
+):
+    last_idx = start
+    last_price = close[start]
+    last_type = 0  # 1: peak, -1: valley
+
+    for i in range(start + 1, end):
+        p_high = high[i]
+        p_low = low[i]
+        far_enough = (i - last_idx) >= min_bars
+
+        if last_type == 0:
+            # 确认初始方向
+            if far_enough and _moved(last_price, p_high, True, mode, value, atr[i]):
+                pivots[i] = 1
+                points[i] = p_high
+                last_idx, last_price, last_type = i, p_high, 1
+            elif far_enough and _moved(last_price, p_low, False, mode, value, atr[i]):
+                pivots[i] = -1
+                points[i] = p_low
+                last_idx, last_price, last_type = i, p_low, -1
+
+        elif last_type == 1:
+            # 更高的高点替换当前峰，否则检查是否回落到足以形成谷
+            if p_high >= last_price:
+                pivots[last_idx] = 0
+                points[last_idx] = np.nan
+                pivots[i] = 1
+                points[i] = p_high
+                last_idx, last_price = i, p_high
+            elif far_enough and _moved(last_price, p_low, False, mode, value, atr[i]):
+                pivots[i] = -1
+                points[i] = p_low
+                last_idx, last_price, last_type = i, p_low, -1
+
+        else:
+            # 更低的低点替换当前谷，否则检查是否反弹到足以形成峰
+            if p_low <= last_price:
+                pivots[last_idx] = 0
+                points[last_idx] = np.nan
+                pivots[i] = -1
+                points[i] = p_low
+                last_idx, last_price = i, p_low
+            elif far_enough and _moved(last_price, p_high, True, mode, value, atr[i]):
+                pivots[i] = 1
+                points[i] = p_high
+                last_idx, last_price, last_type = i, p_high, 1
+
+
+@njit(cache=True)
+def _zigzag_segments(
+    high, low, close, atr, offsets, mode, value, min_bars, pivots, points
+):
+    for k in range(len(offsets) - 1):
+        start, end = offsets[k], offsets[k + 1]
+        if end > start:
+            _zigzag_segment(
+                high, low, close, atr, start, end, mode, value, min_bars, pivots, points
+            )
+
+
+def zigzag_segments(
+    high: NDArray[np.float64],
+    low: NDArray[np.float64],
+    close: NDArray[np.float64],
+    offsets: NDArray[np.int64],
+    atr: Optional[NDArray[np.float64]] = None,
+    pct: Optional[float] = None,
+    abs_thresh: Optional[float] = None,
+    atr_mult: Optional[float] = None,
+    min_bars: int = 3,
+) -> Tuple[NDArray[np.int8], NDArray[np.float64]]:
+    """
+    分段 ZigZag：每只股票占据 [offsets[i], offsets[i + 1]) 区间，各自独立计算。
+
+    返回与输入等长的 (pivots, points)：pivots 为 1（峰）/ -1（谷）/ 0，
+    points 为拐点价格，非拐点为 NaN。使用 ATR 阈值时必须传入 atr。
+    """
+    mode, value = zigzag_threshold(pct, abs_thresh, atr_mult)
+    high = np.ascontiguousarray(high, dtype=np.float64)
+    n = len(high)
+    if atr is None:
+        if mode == ZIGZAG_ATR:
+            raise ValueError("使用 atr_mult 阈值时必须提供 atr")
+        atr = np.full(n, np.nan)
+
+    pivots = np.zeros(n, dtype=np.int8)
+    points = np.full(n, np.nan)
+    _zigzag_segments(
+        high,
+        np.ascontiguousarray(low, dtype=np.float64),
+        np.ascontiguousarray(close, dtype=np.float64),
+        np.ascontiguousarray(atr, dtype=np.float64),
+        np.asarray(offsets, dtype=np.int64),
+        mode,
+        value,
+        min_bars,
+        pivots,
+        points,
+    )
+    return pivots, points
+
+
+def zigzag(
+    high: NDArray[np.float64],
+    low: NDArray[np.float64],
+    close: NDArray[np.float64],
+    atr: Optional[NDArray[np.float64]] = None,
+    pct: Optional[float] = None,
+    abs_thresh: Optional[float] = None,
+    atr_mult: Optional[float] = None,
+    min_bars: int = 3,
+) -> Tuple[NDArray[np.int8], NDArray[np.float64]]:
+    """单只股票的 ZigZag，参数和返回值同 zigzag_segments"""
+    offsets = np.array([0, len(high)], dtype=np.int64)
+    return zigzag_segments(
+        high, low, close, offsets, atr, pct, abs_thresh, atr_mult, min_bars
+    )
+
+
+@njit(cache=True)
+def _smma_segments(x, offsets, alpha, out):
+    for k in range(len(offsets) - 1):
+        start, end = offsets[k], offsets[k + 1]
+        if end > start:
+            value = x[start]
+            out[start] = value
+            for i in range(start + 1, end):
+                value = value + alpha * (x[i] - value)
+                out[i] = value
+
+
+def smma_segments(
+    x: NDArray[np.float64], offsets: NDArray[np.int64], period: int
+) -> NDArray[np.float64]:
+    """
+    分段平滑移动平均 SMMA：y[0] = x[0]，y[t] = y[t-1] + (x[t] - y[t-1]) / period，
+    即系数为 1 / period 的一阶 IIR 滤波，每只股票从自己的第一根 K 线开始递推。
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    out = np.empty(len(x))
+    _smma_segments(x, np.asarray(offsets, dtype=np.int64), 1.0 / period, out)
+    return out
+
+
+@njit(cache=True)
+def _is_zero(x):
+    # 与 talib 的 TA_IS_ZERO 相同的阈值
+    return -1e-8 < x < 1e-8
+
+
+@njit(cache=True)
+def _dmi_segment(high, low, tr, start, end, period, pdi, mdi, adx):
+    plus_dm = 0.0
+    minus_dm = 0.0
+    tr_sum = 0.0
+    dx_sum = 0.0
+    adx_value = 0.0
+    n_dx = 0
+
+    for i in range(start + 1, end):
+        diff_p = high[i] - high[i - 1]
+        diff_m = low[i - 1] - low[i]
+        plus = diff_p if (diff_p > 0 and diff_p > diff_m) else 0.0
+        minus = diff_m if (diff_m > 0 and diff_p < diff_m) else 0.0
+
+        # 前 period - 1 根 K 线直接累加，之后按 Wilder 方式平滑
+        if i - start < period:
+            plus_dm += plus
+            minus_dm += minus
+            tr_sum += tr[i]
+            continue
+        plus_dm = plus_dm - plus_dm / period + plus
+        minus_dm = minus_dm - minus_dm / period + minus
+        tr_sum = tr_sum - tr_sum / period + tr[i]
+
+        if _is_zero(tr_sum):
+            pdi[i] = 0.0
+            mdi[i] = 0.0
+        else:
+            pdi[i] = 100.0 * (plus_dm / tr_sum)
+            mdi[i] = 100.0 * (minus_dm / tr_sum)
+
+        # ADX：前 period 个 DX 取均值，之后同样按 Wilder 方式平滑
+        dx = np.nan
+        if not _is_zero(tr_sum):
+            di_sum = pdi[i] + mdi[i]
+            if not _is_zero(di_sum):
+                dx = 100.0 * (abs(mdi[i] - pdi[i]) / di_sum)
+        if n_dx < period:
+            if not np.isnan(dx):
+                dx_sum += dx
+            n_dx += 1
+            if n_dx == period:
+                adx_value = dx_sum / period
+                adx[i] = adx_value
+        else:
+            if not np.isnan(dx):
+                adx_value = (adx_value * (period - 1) + dx) / period
+            adx[i] = adx_value
+
+
+@njit(cache=True)
+def _dmi_segments(high, low, tr, offsets, period, pdi, mdi, adx):
+    for k in range(len(offsets) - 1):
+        start, end = offsets[k], offsets[k + 1]
+        if end > start:
+            _dmi_segment(high, low, tr, start, end, period, pdi, mdi, adx)
+
+
+def dmi_segments(
+    high: NDArray[np.float64],
+    low: NDArray[np.float64],
+    tr: NDArray[np.float64],
+    offsets: NDArray[np.int64],
+    period: int = 14,
+) -> Tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.float64]]:
+    """
+    分段 DMI：返回 (PLUS_DI, MINUS_DI, ADX)，与 talib 同名函数的结果一致。
+
+    tr 为真实波幅，tr[i] 使用前一根 K 线的收盘价（区间第一行不参与计算），
+    可以直接复用 ATR 的 TR，不必再算一遍。
+    """
+    n = len(high)
+    pdi = np.full(n, np.nan)
+    mdi = np.full(n, np.nan)
+    adx = np.full(n, np.nan)
+    _dmi_segments(
+        np.ascontiguousarray(high, dtype=np.float64),
+        np.ascontiguousarray(low, dtype=np.float64),
+        np.ascontiguousarray(tr, dtype=np.float64),
+        np.asarray(offsets, dtype=np.int64),
+        period,
+        pdi,
+        mdi,
+        adx,
+    )
+    return pdi, mdi, adx
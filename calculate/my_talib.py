@@ -5,6 +5,17 @@ import pandas as pd
 import talib
 from numpy.typing import NDArray
 
+from calculate.kernels import smma_segments, zigzag
+from calculate.patterns import evaluate_patterns
+from calculate.segments import panel_from_frame
+from calculate.williams import (
+    ac_panel,
+    alligator_panel,
+    ao_panel,
+    dkx_panel,
+    fractals_panel,
+)
+
 
 def to_ndarray(x: Any) -> NDArray[np.float64]:
     # 保证传入 talib 的是 np.ndarray[float64]
@@ -186,10 +197,9 @@ def calculate_zigzag(
     返回:
         df: 增加 pivot, zigzagpoint, zigzag 三列
     """
-    high = df["high"].values
-    low = df["low"].values
-    close = df["close"].values
-    n = len(df)
+    high = to_ndarray(df["high"])
+    low = to_ndarray(df["low"])
+    close = to_ndarray(df["close"])
 
     # 计算 ATR
     if atr_mult is not None:
@@ -197,84 +207,19 @@ def calculate_zigzag(
     else:
         df["atr"] = np.nan
 
-    pivots = np.zeros(n, dtype=int)
-    points = np.full(n, np.nan)
-
-    # 阈值检查函数
-    def moved_up(ref_price, cur_price, i):
-        if pct is not None:
-            return cur_price >= ref_price * (1 + pct)
-        elif abs_thresh is not None:
-            return (cur_price - ref_price) >= abs_thresh
-        elif atr_mult is not None:
-            return (cur_price - ref_price) >= atr_mult * df["atr"].iloc[i]
-        else:
-            raise ValueError("必须提供 pct、abs_thresh 或 atr_mult 之一")
-
-    def moved_down(ref_price, cur_price, i):
-        if pct is not None:
-            return cur_price <= ref_price * (1 - pct)
-        elif abs_thresh is not None:
-            return (ref_price - cur_price) >= abs_thresh
-        elif atr_mult is not None:
-            return (ref_price - cur_price) >= atr_mult * df["atr"].iloc[i]
-        else:
-            raise ValueError("必须提供 pct、abs_thresh 或 atr_mult 之一")
-
-    # 初始化
-    last_ext_idx = 0
-    last_ext_price = close[0]
-    last_type = None  # 'peak' / 'valley'
-
-    for i in range(1, n):
-        # 用 high/low 判断
-        p_high, p_low = high[i], low[i]
-
-        if last_type is None:
-            # 确认初始方向
-            if moved_up(last_ext_price, p_high, i) and (i - last_ext_idx) >= min_bars:
-                pivots[i] = 1
-                points[i] = p_high
-                last_ext_idx, last_ext_price, last_type = i, p_high, "peak"
-            elif (
-                moved_down(last_ext_price, p_low, i) and (i - last_ext_idx) >= min_bars
-            ):
-                pivots[i] = -1
-                points[i] = p_low
-                last_ext_idx, last_ext_price, last_type = i, p_low, "valley"
-
-        elif last_type == "peak":
-            # 如果有更高点，替换峰
-            if p_high >= last_ext_price:
-                pivots[last_ext_idx] = 0
-                points[last_ext_idx] = np.nan
-                pivots[i] = 1
-                points[i] = p_high
-                last_ext_idx, last_ext_price = i, p_high
-            # 检查是否跌破阈值，形成 valley
-            elif (
-                moved_down(last_ext_price, p_low, i) and (i - last_ext_idx) >= min_bars
-            ):
-                pivots[i] = -1
-                points[i] = p_low
-                last_ext_idx, last_ext_price, last_type = i, p_low, "valley"
-
-        elif last_type == "valley":
-            # 如果有更低点，替换谷
-            if p_low <= last_ext_price:
-                pivots[last_ext_idx] = 0
-                points[last_ext_idx] = np.nan
-                pivots[i] = -1
-                points[i] = p_low
-                last_ext_idx, last_ext_price = i, p_low
-            # 检查是否突破阈值，形成 peak
-            elif moved_up(last_ext_price, p_high, i) and (i - last_ext_idx) >= min_bars:
-                pivots[i] = 1
-                points[i] = p_high
-                last_ext_idx, last_ext_price, last_type = i, p_high, "peak"
+    pivots, points = zigzag(
+        high,
+        low,
+        close,
+        atr=to_ndarray(df["atr"]),
+        pct=pct,
+        abs_thresh=abs_thresh,
+        atr_mult=atr_mult,
+        min_bars=min_bars,
+    )
 
     # 保存结果到 df
-    df["pivot"] = pivots
+    df["pivot"] = pivots.astype(int)
     df["zigzagpoint"] = points
 
     return df
@@ -316,78 +261,44 @@ def calculate_dmi(data, N=14, M=6):
 
 
 def calculate_dkx(data):
-    m = 10
-    data["mid"] = (3 * data["close"] + data["high"] + data["low"] + data["open"]) / 6
-
-    weights = list(range(20, -1, -1))  # [20, 19, ..., 1, 0]
-    data["dkx"] = sum(data["mid"].shift(i) * w for i, w in enumerate(weights)) / 210
-    data["madkx"] = data["dkx"].rolling(window=m).mean()
-    data = data.drop(columns=["mid"])
+    values = dkx_panel(panel_from_frame(data, ("open", "high", "low", "close")))
+    data["dkx"] = values["dkx"]
+    data["madkx"] = values["madkx"]
     return data
 
 
 # 定义 SMMA（平滑移动平均线）函数
 def smma(series, period):
-    series = series.map(float)
-    smma_values = [series.iloc[0]]  # 初始化第一个值为第一个数据
-    alpha = 1 / period  # 平滑因子
-    for price in series.iloc[1:]:
-        smma_values.append(smma_values[-1] + alpha * (price - smma_values[-1]))
-    return pd.Series(smma_values, index=series.index)
+    values = to_ndarray(series)
+    offsets = np.array([0, len(values)], dtype=np.int64)
+    return pd.Series(smma_segments(values, offsets, period), index=series.index)
 
 
 # 计算鳄鱼线，包括蓝线 (Jaw)、红线 (Teeth)、绿线 (Lips)。
 def calculate_alligator(data):
-    data = data.copy()
-    data["Jaw"] = smma(data["close"], 13).shift(8)
-    data["Teeth"] = smma(data["close"], 8).shift(5)
-    data["Lips"] = smma(data["close"], 5).shift(3)
-    return data
+    return data.assign(**alligator_panel(panel_from_frame(data, ("close",))))
 
 
 # 找到向上分形（Fractal Up）和向下分形（Fractal Down）。
 def calculate_fractals(data):
-    data["Fractal_Up"] = np.nan
-    data["Fractal_Down"] = np.nan
-
-    # 计算向上分形（high 大于前后两天的 high）
-    data["Fractal_Up"] = data["high"][
-        (data["high"] > data["high"].shift(1))
-        & (data["high"] > data["high"].shift(2))
-        & (data["high"] > data["high"].shift(-1))
-        & (data["high"] > data["high"].shift(-2))
-    ]
-
-    # 计算向下分形（low 小于前后两天的 low）
-    data["Fractal_Down"] = data["low"][
-        (data["low"] < data["low"].shift(1))
-        & (data["low"] < data["low"].shift(2))
-        & (data["low"] < data["low"].shift(-1))
-        & (data["low"] < data["low"].shift(-2))
-    ]
-
+    # 向上分形：high 大于前后两天的 high；向下分形：low 小于前后两天的 low
+    panel = panel_from_frame(data, ("high", "low"))
+    for name, values in fractals_panel(panel).items():
+        data[name] = values
     return data
 
 
 # 计算 AO（Awesome Oscillator）动量指标。
 def calculate_ao(data, fast_period=5, slow_period=34):
-    data["Median_Price"] = (data["high"] + data["low"]) / 2
-    data["Fast_SMA"] = data["Median_Price"].rolling(window=fast_period).mean()
-    data["Slow_SMA"] = data["Median_Price"].rolling(window=slow_period).mean()
-    data["AO"] = data["Fast_SMA"] - data["Slow_SMA"]
-
-    data.drop(columns=["Median_Price", "Fast_SMA", "Slow_SMA"], inplace=True)
-
+    panel = panel_from_frame(data, ("high", "low"))
+    data["AO"] = ao_panel(panel, fast_period, slow_period)
     return data
 
 
 # 计算 AC（Accelerator Oscillator，加速震荡指标）。
 def calculate_ac(data, ao_fast_period=5):
-    data["SMA_AO"] = data["AO"].rolling(window=ao_fast_period).mean()
-    data["AC"] = data["SMA_AO"] - data["AO"]
-
-    data.drop(columns=["SMA_AO"], inplace=True)
-
+    panel = panel_from_frame(data, ())
+    data["AC"] = ac_panel(to_ndarray(data["AO"]), panel, ao_fast_period)
     return data
 
 
@@ -550,14 +461,9 @@ def check_bullish_patterns(data: pd.DataFrame) -> bool:
     """判断最近5天内是否出现看涨反转形态"""
     if len(data) < 2:
         return False
-    n = len(data)
-    for i in range(n):
-        if is_bullish_pinbar(data.iloc[i]):
-            return True
-    for i in range(1, n):
-        if is_bullish_engulfing(data.iloc[i - 1], data.iloc[i]):
-            return True
-    for i in range(2, n):
-        if is_morning_star(data.iloc[i - 2], data.iloc[i - 1], data.iloc[i]):
-            return True
-    return False
+    # 与逐行调用 is_bullish_pinbar / is_bullish_engulfing / is_morning_star 等价
+    panel = panel_from_frame(data, ("open", "high", "low", "close"))
+    hits = evaluate_patterns(
+        panel, ["bullish_pinbar", "bullish_engulfing", "morning_star"]
+    )
+    return any(h.any() for h in hits.values())
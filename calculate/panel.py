@@ -0,0 +1,81 @@
+from typing import Iterator, List, Sequence
+
+import numpy as np
+import pyarrow as pa
+
+from calculate.segments import PANEL_COLUMNS, Panel
+from database import stock
+from database.stock import symbol_offsets
+
+
+def panel_from_arrow(table: pa.Table, columns: Sequence[str] = PANEL_COLUMNS) -> Panel:
+    """把按 (symbol, date) 排好序的 Arrow 表转换成 Panel"""
+    if table.num_rows == 0:
+        return Panel(
+            symbols=[],
+            offsets=np.zeros(1, dtype=np.int64),
+            dates=np.array([], dtype="datetime64[D]"),
+            columns={c: np.array([], dtype=np.float64) for c in columns},
+        )
+
+    symbols, offsets = symbol_offsets(table.column("symbol"))
+
+    return Panel(
+        symbols=symbols,
+        offsets=offsets,
+        dates=table.column("date").to_numpy().astype("datetime64[D]"),
+        columns={
+            c: table.column(c).to_numpy().astype(np.float64, copy=False)
+            for c in columns
+        },
+    )
+
+
+def iter_panels(
+    symbols: List[str],
+    start_date: str,
+    end_date: str,
+    chunk_size: int = 500,
+    columns: Sequence[str] = PANEL_COLUMNS,
+    batch_rows: int = 1_000_000,
+) -> Iterator[Panel]:
+    """
+    对 v_qfq_stocks 做一次 Arrow 流式扫描，按每 chunk_size 只股票切分成 Panel 返回。
+
+    整个区间只发起一条查询，内存中最多保留一个 chunk 的数据。
+    """
+    if not symbols:
+        return
+
+    fields = ", ".join(columns)
+    query = f"""
+        SELECT symbol, date, {fields}
+        FROM {stock.qfq_table_name}
+        WHERE symbol IN (SELECT UNNEST(?))
+          AND date >= ? AND date <= ?
+        ORDER BY symbol, date
+    """
+    cursor = stock.conn.cursor()
+    reader = cursor.execute(
+        query, (list(symbols), start_date, end_date)
+    ).fetch_record_batch(batch_rows)
+
+    pending: List[pa.RecordBatch] = []
+    pending_symbols = set()
+    for batch in reader:
+        pending.append(batch)
+        pending_symbols.update(batch.column(0).unique().to_pylist())
+        # 最后一只股票可能还没读完，凑够 chunk_size + 1 只时切出前 chunk_size 只
+        while len(pending_symbols) > chunk_size:
+            table = pa.Table.from_batches(pending)
+            cut_symbol = sorted(pending_symbols)[chunk_size]
+            sym_col = table.column("symbol").to_numpy(zero_copy_only=False)
+            cut = int(np.searchsorted(sym_col, cut_symbol))
+            yield panel_from_arrow(table.slice(0, cut), columns)
+            rest = table.slice(cut)
+            pending = rest.to_batches()
+            pending_symbols = set(rest.column("symbol").unique().to_pylist())
+
+    if pending and sum(b.num_rows for b in pending) > 0:
+        yield panel_from_arrow(pa.Table.from_batches(pending), columns)
+    cursor.close()
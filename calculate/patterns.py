@@ -0,0 +1,207 @@
+"""
+K 线形态扫描：每个形态是作用在整个面板 OHLC 列上的布尔数组表达式。
+
+与 my_talib 中逐行判断的 is_bullish_pinbar / is_bullish_engulfing /
+is_morning_star 条件一致，但一次计算全部股票、全部日期。自定义形态通过
+register_pattern 注册后，scan_patterns / scan_market 会一并输出。
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from calculate.segments import Panel, segment_shift
+
+PatternFunc = Callable[["Bars"], NDArray[np.bool_]]
+
+# 形态名 -> (表达式, 需要往前看的 K 线数)
+PATTERNS: Dict[str, Tuple[PatternFunc, int]] = {}
+
+
+class Bars:
+    """
+    形态表达式的输入：当前 K 线的 open/high/low/close 数组，
+    prev(n) 返回同一只股票 n 根之前的 K 线，区间开头不足 n 根时为 NaN。
+    """
+
+    def __init__(self, panel: Panel, lag: int = 0):
+        self.panel = panel
+        self.lag = lag
+        self._prev: Dict[int, "Bars"] = {}
+        if lag == 0:
+            columns = panel.columns
+        else:
+            columns = {
+                c: segment_shift(panel[c], panel, lag)
+                for c in ("open", "high", "low", "close")
+            }
+        self.open = columns["open"]
+        self.high = columns["high"]
+        self.low = columns["low"]
+        self.close = columns["close"]
+
+    def prev(self, n: int = 1) -> "Bars":
+        lag = self.lag + n
+        if lag not in self._prev:
+            self._prev[lag] = Bars(self.panel, lag)
+        return self._prev[lag]
+
+    @property
+    def body(self) -> NDArray[np.float64]:
+        return np.abs(self.open - self.close)
+
+    @property
+    def amplitude(self) -> NDArray[np.float64]:
+        """振幅（%）"""
+        return (self.high - self.low) / self.low * 100
+
+
+def register_pattern(name: str, lookback: int = 0):
+    """注册形态表达式，lookback 为用到的最早一根 K 线距当前的根数"""
+
+    def decorator(func: PatternFunc) -> PatternFunc:
+        PATTERNS[name] = (func, lookback)
+        return func
+
+    return decorator
+
+
+@register_pattern("bullish_pinbar")
+def bullish_pinbar(bars: Bars) -> NDArray[np.bool_]:
+    """看涨 Pinbar，条件同 is_bullish_pinbar"""
+    body = bars.body
+    upper_shadow = bars.high - np.maximum(bars.open, bars.close)
+    lower_shadow = np.minimum(bars.open, bars.close) - bars.low
+    total = bars.high - bars.low
+    return (
+        (bars.amplitude > 4)
+        & (lower_shadow > 2 * body)
+        & (upper_shadow <= 0.5 * body)
+        & (body < 0.3 * total)
+        & (bars.close >= bars.open)
+    )
+
+
+@register_pattern("bullish_engulfing", lookback=1)
+def bullish_engulfing(bars: Bars) -> NDArray[np.bool_]:
+    """看涨吞没，条件同 is_bullish_engulfing"""
+    prev = bars.prev(1)
+    return (
+        (bars.amplitude > 3)
+        & (prev.close < prev.open)
+        & (bars.close > bars.open)
+        & (bars.open < prev.close)
+        & (bars.close > prev.open)
+        & (bars.high > prev.high)
+        & (bars.low < prev.low)
+    )
+
+
+@register_pattern("morning_star", lookback=2)
+def morning_star(bars: Bars) -> NDArray[np.bool_]:
+    """启明星，条件同 is_morning_star"""
+    first, second = bars.prev(2), bars.prev(1)
+    return (
+        (first.close < first.open)
+        & (second.close < first.close)
+        & (bars.close > bars.open)
+        & (bars.close > first.open)
+    )
+
+
+def _select(patterns: Optional[Sequence[str]]) -> List[str]:
+    names = list(PATTERNS) if patterns is None else list(patterns)
+    unknown = [p for p in names if p not in PATTERNS]
+    if unknown:
+        raise ValueError(f"未注册的形态: {unknown}")
+    return names
+
+
+def evaluate_patterns(
+    panel: Panel, patterns: Optional[Sequence[str]] = None
+) -> Dict[str, NDArray[np.bool_]]:
+    """对面板计算各形态，返回 {形态名: 与面板等长的布尔数组}"""
+    bars = Bars(panel)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {name: PATTERNS[name][0](bars) for name in _select(patterns)}
+
+
+def scan_patterns(
+    panel: Panel,
+    patterns: Optional[Sequence[str]] = None,
+    start_date: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    扫描面板，返回命中的 (symbol, date, pattern) 表；start_date 之前的命中忽略。
+    """
+    symbol_ids = panel.symbol_ids()
+    symbols = np.asarray(panel.symbols, dtype=object)
+    keep = (
+        panel.dates >= np.datetime64(start_date, "D")
+        if start_date
+        else np.ones(len(panel), dtype=bool)
+    )
+
+    frames = []
+    for name, hits in evaluate_patterns(panel, patterns).items():
+        rows = np.flatnonzero(hits & keep)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "symbol": symbols[symbol_ids[rows]],
+                    "date": panel.dates[rows],
+                    "pattern": name,
+                }
+            )
+        )
+    if not frames:
+        return pd.DataFrame(columns=["symbol", "date", "pattern"])
+    return (
+        pd.concat(frames, ignore_index=True)
+        .sort_values(["date", "symbol", "pattern"])
+        .reset_index(drop=True)
+    )
+
+
+def scan_market(
+    days: int = 5,
+    end_date: Optional[str] = None,
+    symbols: Optional[Sequence[str]] = None,
+    patterns: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """
+    对全市场（或指定股票）最近 days 个交易日做一次形态扫描。
+
+    只读取最近 days + lookback 个交易日的行情，一条查询、一次面板计算。
+    """
+    # 推迟到扫描时导入，形态表达式本身不依赖数据库
+    from calculate.panel import panel_from_arrow
+    from database import stock
+
+    names = _select(patterns)
+    lookback = max((PATTERNS[name][1] for name in names), default=0)
+
+    date_filter = f"WHERE date <= '{end_date}'" if end_date else ""
+    dates = stock.query_df(
+        f"""
+        SELECT DISTINCT date FROM {stock.table_name}
+        {date_filter}
+        ORDER BY date DESC
+        LIMIT {days + lookback}
+        """
+    )["date"]
+    if dates.empty:
+        return pd.DataFrame(columns=["symbol", "date", "pattern"])
+
+    dates = pd.to_datetime(dates).sort_values()
+    scan_start = dates.iloc[max(0, len(dates) - days)].strftime("%Y-%m-%d")
+    table = stock.query_many(
+        symbols,
+        start_date=dates.iloc[0].strftime("%Y-%m-%d"),
+        end_date=dates.iloc[-1].strftime("%Y-%m-%d"),
+        columns=["open", "high", "low", "close", "volume"],
+        as_="arrow",
+    )
+    return scan_patterns(panel_from_arrow(table), names, start_date=scan_start)
@@ -0,0 +1,298 @@
+"""
+声明式指标注册表：每个指标声明自己的输入和参数，按依赖关系组成 DAG。
+
+计划器从需要输出的指标出发，只计算它们依赖到的节点。TR、20 日标准差这类
+中间量和 ma20 这类被其他指标复用的结果，在一个面板上都只计算一次；新增指标
+只需注册一个节点并引用已有的输入，不会多扫一遍数据。
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import talib
+from numpy.typing import NDArray
+
+from calculate.kernels import dmi_segments
+from calculate.segments import (
+    PANEL_COLUMNS,
+    Panel,
+    segment_apply,
+    segment_rolling_mean,
+    segment_shift,
+    segment_true_range,
+)
+from calculate.williams import (
+    ac_panel,
+    alligator_panel,
+    ao_panel,
+    dkx_panel,
+    fractals_panel,
+)
+
+IndicatorFunc = Callable[..., Union[NDArray[np.float64], Tuple[NDArray, ...]]]
+
+
+class Node:
+    """
+    DAG 中的一个节点：func(panel, *inputs, **params) 返回一个数组，
+    或与 outputs 等长的数组元组。inputs 可以是面板列名或其他节点的输出名。
+    """
+
+    def __init__(
+        self,
+        outputs: Tuple[str, ...],
+        func: IndicatorFunc,
+        inputs: Tuple[str, ...],
+        params: Dict[str, object],
+        default: bool,
+        intermediate: bool,
+    ):
+        self.outputs = outputs
+        self.func = func
+        self.inputs = inputs
+        self.params = params
+        self.default = default
+        self.intermediate = intermediate
+
+    def __repr__(self) -> str:
+        return f"Node({', '.join(self.outputs)} <- {', '.join(self.inputs)})"
+
+
+class IndicatorRegistry:
+    def __init__(self):
+        # 输出名 -> 产生它的节点，按注册顺序排列
+        self.nodes: Dict[str, Node] = {}
+
+    def register(
+        self,
+        outputs: Union[str, Sequence[str]],
+        inputs: Sequence[str] = ("close",),
+        params: Optional[Dict[str, object]] = None,
+        default: bool = True,
+        intermediate: bool = False,
+    ):
+        """
+        注册一个节点。default=False 的指标需要显式启用；
+        intermediate=True 的节点只作为其他指标的输入，不会写入数据库。
+        """
+        outputs = (outputs,) if isinstance(outputs, str) else tuple(outputs)
+
+        def decorator(func: IndicatorFunc) -> IndicatorFunc:
+            duplicated = [name for name in outputs if name in self.nodes]
+            if duplicated:
+                raise ValueError(f"指标重复注册: {duplicated}")
+            node = Node(
+                outputs, func, tuple(inputs), dict(params or {}), default, intermediate
+            )
+            for name in outputs:
+                self.nodes[name] = node
+            return func
+
+        return decorator
+
+    def indicators(self) -> List[str]:
+        """全部可输出的指标名"""
+        return [name for name, node in self.nodes.items() if not node.intermediate]
+
+    def defaults(self) -> List[str]:
+        """默认启用的指标名"""
+        return [
+            name
+            for name, node in self.nodes.items()
+            if node.default and not node.intermediate
+        ]
+
+    def resolve(self, indicators: Union[None, str, Sequence[str]] = None) -> List[str]:
+        """
+        把配置解析成按注册顺序排列的指标名列表。
+
+        - None：默认启用的指标
+        - ["ma10", "atr"]：只计算列出的指标
+        - ["+dkx", "-bb_width"]：在默认指标的基础上启用 / 停用
+        也可以是逗号分隔的字符串，如 "+dkx,+madkx"。
+        """
+        if indicators is None:
+            return self.defaults()
+        if isinstance(indicators, str):
+            indicators = [s.strip() for s in indicators.split(",") if s.strip()]
+
+        relative = bool(indicators) and all(s[0] in "+-" for s in indicators)
+        chosen = set(self.defaults()) if relative else set()
+        available = set(self.indicators())
+        unknown = [s for s in indicators if s.lstrip("+-") not in available]
+        if unknown:
+            raise ValueError(f"未注册的指标: {unknown}")
+
+        for item in indicators:
+            name = item.lstrip("+-")
+            if item.startswith("-"):
+                chosen.discard(name)
+            else:
+                chosen.add(name)
+        return [name for name in self.indicators() if name in chosen]
+
+    def plan(self, names: Sequence[str]) -> List[Node]:
+        """按拓扑顺序返回计算 names 需要的节点，每个节点只出现一次"""
+        order: List[Node] = []
+        done = set()
+        visiting = set()
+
+        def visit(name: str):
+            if name in PANEL_COLUMNS and name not in self.nodes:
+                return
+            if name not in self.nodes:
+                raise ValueError(f"未注册的指标或中间量: {name}")
+            node = self.nodes[name]
+            if id(node) in done:
+                return
+            if id(node) in visiting:
+                raise ValueError(f"指标依赖存在环: {node}")
+            visiting.add(id(node))
+            for dependency in node.inputs:
+                visit(dependency)
+            visiting.discard(id(node))
+            done.add(id(node))
+            order.append(node)
+
+        for name in names:
+            visit(name)
+        return order
+
+    def compute(
+        self, panel: Panel, indicators: Union[None, str, Sequence[str]] = None
+    ) -> Dict[str, NDArray[np.float64]]:
+        """在面板上按计划计算，返回 {指标名: 与面板等长的数组}"""
+        names = self.resolve(indicators)
+        values: Dict[str, NDArray[np.float64]] = dict(panel.columns)
+        for node in self.plan(names):
+            result = node.func(
+                panel, *(values[name] for name in node.inputs), **node.params
+            )
+            if len(node.outputs) == 1:
+                result = (result,)
+            values.update(zip(node.outputs, result))
+        return {name: values[name] for name in names}
+
+
+registry = IndicatorRegistry()
+register_indicator = registry.register
+
+
+def _ma(panel: Panel, x: NDArray[np.float64], period: int) -> NDArray[np.float64]:
+    return segment_apply(lambda v: talib.MA(v, period), panel, [x])[0]
+
+
+for _period in (10, 20, 60):
+    register_indicator(f"ma{_period}", params={"period": _period})(_ma)
+
+
+@register_indicator(
+    ("ma_power_ratio", "ma_power_slope"),
+    inputs=("ma10", "ma20", "ma60"),
+    params={"ma_max": 60, "slope_window": 5},
+)
+def ma_power(panel, ma10, ma20, ma60, ma_max, slope_window):
+    """均线多头排列比例及其斜率，前 ma_max 行为 NaN"""
+    bull = (ma10 > ma20).astype(int) + (ma10 > ma60) + (ma20 > ma60)
+    ratio = np.where(panel.positions() < ma_max, np.nan, bull / 3.0)
+    slope = (ratio - segment_shift(ratio, panel, slope_window)) / slope_window
+    return ratio, slope
+
+
+@register_indicator("tr", inputs=("high", "low", "close"), intermediate=True)
+def true_range(panel, high, low, close):
+    """真实波幅，ATR 与 DMI 共用"""
+    return segment_true_range(panel)
+
+
+@register_indicator("atr", inputs=("tr",), params={"period": 14})
+def atr(panel, tr, period):
+    return segment_rolling_mean(tr, panel, period, min_periods=1)
+
+
+for _period in (5, 10, 20):
+    register_indicator(
+        f"ma{_period}_vol", inputs=("volume",), params={"period": _period}
+    )(_ma)
+
+
+@register_indicator(
+    ("macd", "signal", "hist"),
+    params={"fast_period": 12, "slow_period": 26, "signal_period": 9},
+)
+def macd(panel, close, fast_period, slow_period, signal_period):
+    """柱状图按国内习惯乘 2"""
+    macd, signal, hist = segment_apply(
+        lambda c: talib.MACD(c, fast_period, slow_period, signal_period),
+        panel,
+        [close],
+        n_outputs=3,
+    )
+    return macd, signal, hist * 2
+
+
+@register_indicator(
+    ("adx", "pdi", "mdi"), inputs=("high", "low", "tr"), params={"period": 14}
+)
+def dmi(panel, high, low, tr, period):
+    pdi, mdi, adx = dmi_segments(high, low, tr, panel.offsets, period)
+    return adx, pdi, mdi
+
+
+@register_indicator("std20", params={"period": 20}, intermediate=True)
+def stddev(panel, close, period):
+    """总体标准差，与 talib.BBANDS 内部的计算一致"""
+    return segment_apply(lambda c: talib.STDDEV(c, period, 1), panel, [close])[0]
+
+
+@register_indicator(
+    ("bb_upper", "bb_middle", "bb_lower", "bb_width"),
+    inputs=("ma20", "std20"),
+    params={"nbdev": 2},
+)
+def bbands(panel, ma20, std20, nbdev):
+    """布林带，中轨直接复用 ma20"""
+    upper = ma20 + std20 * nbdev
+    lower = ma20 - std20 * nbdev
+    return upper, ma20, lower, (upper - lower) / ma20
+
+
+# 以下指标默认不计算，通过配置启用
+
+
+@register_indicator(("jaw", "teeth", "lips"), default=False)
+def alligator(panel, close):
+    return tuple(alligator_panel(panel).values())
+
+
+@register_indicator(
+    ("fractal_up", "fractal_down"), inputs=("high", "low"), default=False
+)
+def fractals(panel, high, low):
+    return tuple(fractals_panel(panel).values())
+
+
+@register_indicator(
+    "ao",
+    inputs=("high", "low"),
+    params={"fast_period": 5, "slow_period": 34},
+    default=False,
+)
+def ao(panel, high, low, fast_period, slow_period):
+    return ao_panel(panel, fast_period, slow_period)
+
+
+@register_indicator("ac", inputs=("ao",), params={"ao_fast_period": 5}, default=False)
+def ac(panel, ao, ao_fast_period):
+    return ac_panel(ao, panel, ao_fast_period)
+
+
+@register_indicator(
+    ("dkx", "madkx"),
+    inputs=("open", "high", "low", "close"),
+    params={"m": 10},
+    default=False,
+)
+def dkx(panel, open_, high, low, close, m):
+    result = dkx_panel(panel, m)
+    return result["dkx"], result["madkx"]
@@ -0,0 +1,214 @@
+"""
+面板数据结构和分段计算工具，只依赖 NumPy / pandas，不访问数据库。
+
+指标计算（my_talib、williams、registry、patterns）都建立在这里的 Panel 和
+segment_* 函数上；从数据库读取面板的 iter_panels / panel_from_arrow 在 calculate.panel。
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from calculate.kernels import zigzag_segments
+
+PANEL_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+class Panel:
+    """
+    全市场面板数据：所有股票的行情按 symbol 连续排列在同一组 NumPy 数组里，
+    第 i 只股票占据 [offsets[i], offsets[i + 1]) 区间，区间内按日期升序。
+    """
+
+    def __init__(
+        self,
+        symbols: List[str],
+        offsets: NDArray[np.int64],
+        dates: NDArray[np.datetime64],
+        columns: Dict[str, NDArray[np.float64]],
+    ):
+        self.symbols = symbols
+        self.offsets = offsets
+        self.dates = dates
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, name: str) -> NDArray[np.float64]:
+        return self.columns[name]
+
+    @property
+    def n_symbols(self) -> int:
+        return len(self.symbols)
+
+    @property
+    def lengths(self) -> NDArray[np.int64]:
+        return np.diff(self.offsets)
+
+    def segments(self) -> Iterator[tuple[int, int]]:
+        """依次返回每只股票的 (start, end) 区间"""
+        for i in range(self.n_symbols):
+            yield int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def symbol_ids(self) -> NDArray[np.int64]:
+        """每一行所属股票在 symbols 中的下标"""
+        return np.repeat(np.arange(self.n_symbols), self.lengths)
+
+    def positions(self) -> NDArray[np.int64]:
+        """每一行在所属股票区间内的序号（从 0 开始）"""
+        return np.arange(len(self)) - np.repeat(self.offsets[:-1], self.lengths)
+
+
+def panel_from_frame(
+    data: pd.DataFrame, columns: Sequence[str] = PANEL_COLUMNS, symbol: str = ""
+) -> Panel:
+    """把单只股票按日期排好序的 DataFrame 包装成只有一个区间的 Panel"""
+    if "date" in data.columns:
+        dates = data["date"].to_numpy()
+    else:
+        dates = data.index.to_numpy()
+    if not np.issubdtype(dates.dtype, np.datetime64):
+        dates = np.zeros(len(data), dtype="datetime64[D]")
+    return Panel(
+        symbols=[symbol],
+        offsets=np.array([0, len(data)], dtype=np.int64),
+        dates=dates.astype("datetime64[D]"),
+        columns={
+            c: np.asarray(data[c], dtype=np.float64) for c in columns if c in data
+        },
+    )
+
+
+def segment_apply(
+    func: Callable[..., Any],
+    panel: Panel,
+    inputs: Sequence[NDArray[np.float64]],
+    n_outputs: int = 1,
+) -> List[NDArray[np.float64]]:
+    """
+    在每只股票的区间上调用 func（通常是 talib 函数），结果写入预分配的整列数组。
+    """
+    outputs = [np.full(len(panel), np.nan) for _ in range(n_outputs)]
+    for start, end in panel.segments():
+        result = func(*(x[start:end] for x in inputs))
+        if n_outputs == 1:
+            result = (result,)
+        for out, values in zip(outputs, result):
+            out[start:end] = values
+    return outputs
+
+
+def segment_shift(
+    x: NDArray[np.float64], panel: Panel, periods: int = 1
+) -> NDArray[np.float64]:
+    """
+    分段平移：每只股票区间内向后平移 periods 行，区间开头补 NaN；
+    periods 为负数时向前平移，区间末尾补 NaN。
+    """
+    out = np.full(len(x), np.nan)
+    if periods == 0:
+        out[:] = x
+        return out
+    if len(x) <= abs(periods):
+        return out
+    if periods > 0:
+        out[periods:] = x[:-periods]
+        out[panel.positions() < periods] = np.nan
+    else:
+        out[:periods] = x[-periods:]
+        remaining = np.repeat(panel.offsets[1:], panel.lengths) - np.arange(len(x))
+        out[remaining <= -periods] = np.nan
+    return out
+
+
+def segment_rolling_mean(
+    x: NDArray[np.float64],
+    panel: Panel,
+    window: int,
+    min_periods: Optional[int] = None,
+) -> NDArray[np.float64]:
+    """
+    分段滚动均值，等价于每只股票单独做 rolling(window, min_periods).mean()：
+    窗口内的 NaN 跳过不计，有效值个数不足 min_periods 时为 NaN。
+
+    按窗口内的每个滞后量逐次累加，不做整列 cumsum，某一行的 NaN 或误差
+    不会传到后面的行和其他股票。
+    """
+    min_periods = window if min_periods is None else min_periods
+    pos = panel.positions()
+    total = np.zeros(len(x))
+    count = np.zeros(len(x), dtype=np.int64)
+    for lag in range(min(window, len(x))):
+        shifted = np.full(len(x), np.nan)
+        shifted[lag:] = x[: len(x) - lag]
+        # 滞后量超过区间内序号时，取到的是上一只股票的数据
+        valid = (pos >= lag) & ~np.isnan(shifted)
+        total[valid] += shifted[valid]
+        count += valid
+
+    out = np.full(len(x), np.nan)
+    enough = count >= max(min_periods, 1)
+    out[enough] = total[enough] / count[enough]
+    return out
+
+
+def segment_true_range(panel: Panel) -> NDArray[np.float64]:
+    """
+    分段真实波幅 TR，区间第一行的昨收取当日收盘价，与 calculate_atr 一致。
+    """
+    high, low, close = panel["high"], panel["low"], panel["close"]
+    prev_close = segment_shift(close, panel, 1)
+    prev_close = np.where(panel.positions() == 0, close, prev_close)
+    return np.maximum.reduce(
+        [high - low, np.abs(high - prev_close), np.abs(low - prev_close)]
+    )
+
+
+def segment_window_mean(
+    x: NDArray[np.float64], panel: Panel, window: int
+) -> NDArray[np.float64]:
+    """
+    分段滚动均值，等价于每只股票单独做 rolling(window).mean()：
+    窗口不满或窗口内有 NaN 时结果为 NaN，适用于本身带前导 NaN 的序列。
+    """
+    out = np.full(len(x), np.nan)
+    if len(x) < window:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(x, window)
+    out[window - 1 :] = windows.mean(axis=1)
+    out[panel.positions() < window - 1] = np.nan
+    return out
+
+
+def segment_zigzag(
+    panel: Panel,
+    pct: Optional[float] = None,
+    abs_thresh: Optional[float] = None,
+    atr_mult: Optional[float] = 2,
+    atr_period: int = 14,
+    min_bars: int = 3,
+) -> tuple[NDArray[np.int8], NDArray[np.float64]]:
+    """
+    整个面板的 ZigZag 拐点，参数与 calculate_zigzag 相同，一次调用处理全部股票。
+
+    返回 (pivots, points)，第 i 只股票的结果在 [offsets[i], offsets[i + 1]) 区间。
+    """
+    atr = None
+    if atr_mult is not None:
+        atr = segment_rolling_mean(
+            segment_true_range(panel), panel, atr_period, min_periods=1
+        )
+    return zigzag_segments(
+        panel["high"],
+        panel["low"],
+        panel["close"],
+        panel.offsets,
+        atr=atr,
+        pct=pct,
+        abs_thresh=abs_thresh,
+        atr_mult=atr_mult,
+        min_bars=min_bars,
+    )
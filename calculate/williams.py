@@ -0,0 +1,78 @@
+"""
+比尔·威廉姆斯系列指标（鳄鱼线、分形、AO、AC）与 DKX 的面板版本。
+
+所有函数接收整个面板，一次计算全部股票，返回与面板等长的数组；
+单只股票的 my_talib.calculate_* 也是通过一个区间的面板调用这里。
+"""
+
+from typing import Dict
+
+import numpy as np
+from numpy.typing import NDArray
+
+from calculate.kernels import smma_segments
+from calculate.segments import Panel, segment_shift, segment_window_mean
+
+# DKX 对最近 21 根 K 线的中间价线性加权：最新一根权重 20，最早一根 0，权重之和 210
+DKX_WINDOW = 21
+DKX_WEIGHTS = np.arange(DKX_WINDOW, dtype=np.float64) / 210
+
+
+def smma_panel(
+    x: NDArray[np.float64], panel: Panel, period: int
+) -> NDArray[np.float64]:
+    """分段 SMMA，每只股票从自己的第一根 K 线开始递推"""
+    return smma_segments(x, panel.offsets, period)
+
+
+def alligator_panel(panel: Panel) -> Dict[str, NDArray[np.float64]]:
+    """鳄鱼线：蓝线 Jaw、红线 Teeth、绿线 Lips"""
+    close = panel["close"]
+    return {
+        "Jaw": segment_shift(smma_panel(close, panel, 13), panel, 8),
+        "Teeth": segment_shift(smma_panel(close, panel, 8), panel, 5),
+        "Lips": segment_shift(smma_panel(close, panel, 5), panel, 3),
+    }
+
+
+def fractals_panel(panel: Panel) -> Dict[str, NDArray[np.float64]]:
+    """向上分形（high 高于前后两天）与向下分形（low 低于前后两天），非分形为 NaN"""
+    result = {}
+    for name, column, compare in (
+        ("Fractal_Up", "high", np.greater),
+        ("Fractal_Down", "low", np.less),
+    ):
+        x = panel[column]
+        mask = np.ones(len(x), dtype=bool)
+        for periods in (1, 2, -1, -2):
+            mask &= compare(x, segment_shift(x, panel, periods))
+        result[name] = np.where(mask, x, np.nan)
+    return result
+
+
+def ao_panel(
+    panel: Panel, fast_period: int = 5, slow_period: int = 34
+) -> NDArray[np.float64]:
+    """AO：中间价的快慢简单均线之差"""
+    median = (panel["high"] + panel["low"]) / 2
+    return segment_window_mean(median, panel, fast_period) - segment_window_mean(
+        median, panel, slow_period
+    )
+
+
+def ac_panel(
+    ao: NDArray[np.float64], panel: Panel, ao_fast_period: int = 5
+) -> NDArray[np.float64]:
+    """AC：AO 的简单均线减去 AO"""
+    return segment_window_mean(ao, panel, ao_fast_period) - ao
+
+
+def dkx_panel(panel: Panel, m: int = 10) -> Dict[str, NDArray[np.float64]]:
+    """DKX 多空线：中间价的 21 日线性加权卷积，MADKX 为其 m 日均线"""
+    mid = (3 * panel["close"] + panel["high"] + panel["low"] + panel["open"]) / 6
+    dkx = np.full(len(mid), np.nan)
+    if len(mid) >= DKX_WINDOW:
+        windows = np.lib.stride_tricks.sliding_window_view(mid, DKX_WINDOW)
+        dkx[DKX_WINDOW - 1 :] = windows @ DKX_WEIGHTS
+        dkx[panel.positions() < DKX_WINDOW - 1] = np.nan
+    return {"dkx": dkx, "madkx": segment_window_mean(dkx, panel, m)}
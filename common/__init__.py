@@ -1,5 +1,13 @@
-from .batch import batch_processor
-from .dowload import download_file
+from .batch import BackgroundWriter, batch_processor
+from .dowload import Download, download_cache, download_file, fetch_url
 from .symbol import generate_symbol
 
-__all__ = ["download_file", "generate_symbol", "batch_processor"]
+__all__ = [
+    "Download",
+    "download_cache",
+    "download_file",
+    "fetch_url",
+    "generate_symbol",
+    "batch_processor",
+    "BackgroundWriter",
+]
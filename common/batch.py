@@ -1,53 +1,157 @@
+import multiprocessing
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import Any, Callable, Iterator, List
+from queue import Queue
+from threading import Thread
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from tqdm import tqdm
 
 
+def _run_task(
+    worker_func: Callable[..., Any],
+    items: List[Any],
+    payloads: Optional[List[Any]] = None,
+) -> List[Tuple[Any, Any, Optional[str]]]:
+    """在工作进程中依次处理一组项目，返回 (项目, 结果, 错误信息) 列表"""
+    outcomes = []
+    for i, item in enumerate(items):
+        try:
+            if payloads is None:
+                result = worker_func(item)
+            else:
+                result = worker_func(item, payloads[i])
+            outcomes.append((item, result, None))
+        except Exception as e:
+            outcomes.append((item, None, str(e)))
+    return outcomes
+
+
 def batch_processor(
     items: List[Any],
     worker_func: Callable[..., Any],
     max_workers: int = 8,
     chunk_size: int = 500,
+    chunksize: int = 1,
+    start_method: Optional[str] = None,
+    load_chunk: Optional[Callable[[List[Any]], Dict[Any, Any]]] = None,
 ) -> Iterator[List[Any]]:
     """
     一个通用的批量并发处理器，它按批次返回结果。
 
+    进程池在所有批次之间复用，只在第一批开始时创建一次。
+
     Args:
         items (List[Any]): 需要处理的项目列表。
         worker_func (Callable[..., Any]): 应用于每个项目的工作函数。
-        ...
+        max_workers (int): 工作进程数。
+        chunk_size (int): 每批的项目数，每批处理完后返回一次结果。
+        chunksize (int): 每个任务包含的项目数，与 ProcessPoolExecutor.map 的
+            chunksize 含义相同；单个项目很轻时调大可以减少进程间通信次数。
+        start_method (str, optional): "fork" / "forkserver" / "spawn"，
+            默认使用平台默认值。
+        load_chunk (Callable[[List[Any]], Dict[Any, Any]], optional): 在主进程中为
+            一批项目加载数据，返回 {项目: 数据}；此时工作函数以 worker_func(项目, 数据)
+            调用，工作进程不需要自己访问数据库。
 
     Yields:
         Iterator[List[Any]]: 为每个处理完成的批次，返回一个包含所有成功结果的列表。
     """
     item_chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+    chunksize = max(1, chunksize)
+    mp_context = multiprocessing.get_context(start_method) if start_method else None
 
     print(
         f"开始处理 {len(items)} 个项目, 共 {len(item_chunks)} 批, 每批最多 {chunk_size} 个。"
     )
 
-    for i, chunk in enumerate(item_chunks):
-        print(f"\n--- 正在处理第 {i + 1}/{len(item_chunks)} 批 ---")
-
-        chunk_results = []
-
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            future_to_item = {
-                executor.submit(worker_func, item): item for item in chunk
-            }
-            progress_bar = tqdm(
-                as_completed(future_to_item),
-                total=len(chunk),
-            )
-            for future in progress_bar:
-                item = future_to_item[future]
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=mp_context
+    ) as executor:
+        for i, chunk in enumerate(item_chunks):
+            print(f"\n--- 正在处理第 {i + 1}/{len(item_chunks)} 批 ---")
+
+            chunk_results = []
+            payloads = load_chunk(chunk) if load_chunk else None
+
+            future_to_items = {}
+            for j in range(0, len(chunk), chunksize):
+                task_items = chunk[j : j + chunksize]
+                task_payloads = (
+                    None
+                    if payloads is None
+                    else [payloads.get(item) for item in task_items]
+                )
+                future = executor.submit(
+                    _run_task, worker_func, task_items, task_payloads
+                )
+                future_to_items[future] = task_items
+            progress_bar = tqdm(total=len(chunk))
+            for future in as_completed(future_to_items):
+                task_items = future_to_items[future]
                 try:
-                    result = future.result()
-                    if result is not None:
-                        chunk_results.append(result)
+                    outcomes = future.result()
                 except Exception as e:
-                    print(f"❌ 项目 {item} 处理失败: {e}")
+                    outcomes = [(item, None, str(e)) for item in task_items]
+                for item, result, error in outcomes:
+                    if error is not None:
+                        print(f"❌ 项目 {item} 处理失败: {error}")
+                    elif result is not None:
+                        chunk_results.append(result)
+                progress_bar.update(len(task_items))
+            progress_bar.close()
+
+            if chunk_results:
+                yield chunk_results
+
+
+class BackgroundWriter:
+    """
+    后台写入线程：计算方把结果放进有界队列，写入线程依次取出交给 write_func。
+
+    队列满时 submit 会阻塞，内存中最多积压 max_pending 批未写入的结果，
+    计算和写入可以重叠进行，总耗时接近两者中较慢的一方。
+    """
+
+    _STOP = object()
+
+    def __init__(self, write_func: Callable[..., Any], max_pending: int = 2):
+        self.write_func = write_func
+        self.error: Optional[BaseException] = None
+        self._queue: Queue = Queue(maxsize=max(1, max_pending))
+        self._thread = Thread(
+            target=self._run, name="background-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            args = self._queue.get()
+            if args is self._STOP:
+                break
+            # 出错后继续取出剩余批次但不再写入，避免 submit 一直阻塞
+            if self.error is not None:
+                continue
+            try:
+                self.write_func(*args)
+            except BaseException as e:
+                self.error = e
+
+    def submit(self, *args):
+        """把一批结果交给写入线程，写入线程已出错时直接抛出"""
+        if self.error is not None:
+            raise self.error
+        self._queue.put(args)
+
+    def close(self):
+        """等待队列中的结果全部写完"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
 
-        if chunk_results:
-            yield chunk_results
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
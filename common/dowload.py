@@ -1,16 +1,209 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import NamedTuple, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = 30
+CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since")
+DOWNLOAD_CACHE = os.environ.get(
+    "DOWNLOAD_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ko_trading")
+)
+
+
+class Download(NamedTuple):
+    url: str
+    # 缓存中的内容文件，按 sha256 命名，调用方只读不改
+    path: str
+    sha256: str
+    # 与该 URL 上一次下载的内容相比是否有变化
+    changed: bool
+    # 本次实际传输的字节数，服务器返回 304 时为 0
+    size: int
+
+
+class DownloadCache:
+    """
+    按 URL 缓存的下载。
+
+    urls/<sha1(url)>.json 记录 URL 上次响应的 ETag / Last-Modified 和内容的 sha256，
+    objects/<sha256[:2]>/<sha256> 保存内容本身，相同内容只存一份。再次下载同一个
+    URL 时带上 If-None-Match / If-Modified-Since，服务器返回 304 时不传输文件。
+
+    所有请求共用一个带连接池的 requests.Session，连接错误和 429 / 5xx 按指数退避重试。
+    """
+
+    def __init__(
+        self,
+        root: str = DOWNLOAD_CACHE,
+        retries: int = 3,
+        backoff_factor: float = 1.0,
+        pool_size: int = 8,
+    ):
+        self.root = root
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """首次使用时创建，线程间共享"""
+        with self._lock:
+            if self._session is None:
+                retry = Retry(
+                    total=self.retries,
+                    backoff_factor=self.backoff_factor,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=("GET", "HEAD"),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    max_retries=retry,
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+        return self._session
+
+    def _record_path(self, url: str) -> str:
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, "urls", f"{name}.json")
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "objects", sha256[:2], sha256)
+
+    def _load_record(self, url: str) -> dict:
+        """URL 的缓存记录，内容文件已经不在时视为没有缓存"""
+        path = self._record_path(url)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            record = json.load(f)
+        if not os.path.exists(self.object_path(record["sha256"])):
+            return {}
+        return record
+
+    def _save_record(self, url: str, record: dict):
+        path = self._record_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def _release(self, sha256: str):
+        """没有 URL 再引用的旧内容直接删除，缓存只保留每个 URL 的最新版本"""
+        urls_dir = os.path.join(self.root, "urls")
+        for name in os.listdir(urls_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(urls_dir, name), encoding="utf-8") as f:
+                    if json.load(f).get("sha256") == sha256:
+                        return
+        try:
+            os.remove(self.object_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def fetch(
+        self, url: str, headers=None, cookies=None, timeout=DEFAULT_TIMEOUT
+    ) -> Download:
+        """下载 URL 到缓存中，失败时抛出异常"""
+        record = self._load_record(url)
+        # 条件请求头只按缓存记录设置：调用方自带的条件头可能让服务器返回 304，
+        # 而缓存中并没有对应的内容
+        request_headers = {
+            name: value
+            for name, value in (headers or {}).items()
+            if name.lower() not in CONDITIONAL_HEADERS
+        }
+        if record.get("etag"):
+            request_headers["If-None-Match"] = record["etag"]
+        if record.get("last_modified"):
+            request_headers["If-Modified-Since"] = record["last_modified"]
+
+        with self.session.get(
+            url, headers=request_headers, cookies=cookies, stream=True, timeout=timeout
+        ) as response:
+            if response.status_code == 304:
+                if not record:
+                    raise requests.HTTPError(
+                        f"{url} 返回 304，但缓存中没有该 URL 的内容", response=response
+                    )
+                sha256 = record["sha256"]
+                return Download(url, self.object_path(sha256), sha256, False, 0)
+            response.raise_for_status()
+
+            # 先写临时文件，算出 sha256 后再移动到内容文件的位置
+            objects_dir = os.path.join(self.root, "objects")
+            os.makedirs(objects_dir, exist_ok=True)
+            digest = hashlib.sha256()
+            size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=objects_dir, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        if chunk:
+                            digest.update(chunk)
+                            size += len(chunk)
+                            f.write(chunk)
+                sha256 = digest.hexdigest()
+                path = self.object_path(sha256)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self._save_record(
+                url,
+                {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "sha256": sha256,
+                },
+            )
+
+        previous = record.get("sha256")
+        if previous and previous != sha256:
+            self._release(previous)
+        return Download(url, path, sha256, sha256 != previous, size)
+
+
+download_cache = DownloadCache()
+
+
+def fetch_url(url, headers=None, cookies=None, timeout=DEFAULT_TIMEOUT) -> Download:
+    """通过默认的下载缓存下载 URL，失败时抛出异常"""
+    return download_cache.fetch(url, headers=headers, cookies=cookies, timeout=timeout)
+
 
+def download_file(
+    url, output_path, headers=None, cookies=None, timeout=DEFAULT_TIMEOUT
+) -> Optional[Download]:
+    """
+    Download file from URL to specified path.
 
-def download_file(url, output_path, headers=None, cookies=None):
-    """Download file from URL to specified path."""
+    Goes through the download cache, so an unchanged file is not transferred again.
+    Returns the Download (whose `changed` tells whether the content differs from the
+    previous download) on success, None on failure.
+    """
     try:
-        response = requests.get(url, headers=headers, cookies=cookies, stream=True)
-        response.raise_for_status()
-        with open(output_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        return True
+        result = fetch_url(url, headers=headers, cookies=cookies, timeout=timeout)
+        shutil.copyfile(result.path, output_path)
+        return result
     except Exception as e:
         print(f"Error downloading {url}: {e}")
-        return False
+        return None
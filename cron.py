@@ -3,6 +3,8 @@ import time
 from calculate.calc_indicator import run_indicator_calculate
 from database import csindex
 from database.index import run_csindex_update
+from database.materialize import run_materialize_update
+from database.parquet import run_parquet_export
 from database.shenwan import run_shenwan_industry_update
 
 if __name__ == "__main__":
@@ -13,6 +15,8 @@ if __name__ == "__main__":
 
     symbols = [s for s in csindex.query("ChinaA")["symbol"]]
     run_indicator_calculate(symbols=symbols)
+    run_materialize_update()
+    run_parquet_export()
     # run_reversal_analysis(symbols=symbols)
     end = time.time()
     print("执行时间: {:.6f} 秒".format(end - start))
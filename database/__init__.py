@@ -1,7 +1,40 @@
-from .base import db
-from .index import csindex
-from .indicator import indicator
-from .shenwan import shenwan
-from .stock import stock
+import sys
 
-__all__ = ["db", "csindex", "indicator", "shenwan", "stock"]
+from .connection import connection
+from .lazy import LazyObject, LazyPackage
+
+# 表对象都是惰性代理，import database 不会加载 pandas / duckdb，也不会建表
+db = LazyObject("database.base", "db")
+csindex = LazyObject("database.index", "csindex")
+indicator = LazyObject("database.indicator", "indicator")
+indicator_state = LazyObject("database.indicator", "indicator_state")
+indicator_wide = LazyObject("database.indicator", "indicator_wide")
+materialized_views = LazyObject("database.materialize", "materialized_views")
+parquet_store = LazyObject("database.parquet", "parquet_store")
+screener = LazyObject("database.screen", "screener")
+shenwan = LazyObject("database.shenwan", "shenwan")
+stock = LazyObject("database.stock", "stock")
+
+sys.modules[__name__].__class__ = LazyPackage
+
+
+def ensure_schema():
+    """创建所有表和视图（CREATE ... IF NOT EXISTS），写入数据之前调用一次"""
+    for table in (csindex, shenwan, indicator, indicator_state, indicator_wide):
+        table.ensure_schema()
+
+
+__all__ = [
+    "db",
+    "connection",
+    "csindex",
+    "ensure_schema",
+    "indicator",
+    "indicator_state",
+    "indicator_wide",
+    "materialized_views",
+    "parquet_store",
+    "screener",
+    "shenwan",
+    "stock",
+]
@@ -1,20 +1,30 @@
-import os
-from threading import Lock
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, Iterable, List, Optional, Union
 
 import duckdb
 import pandas as pd
+import pyarrow as pa
 
-db_path = os.environ.get("DBPATH", "")
+from database.connection import connection
 
 
 class DuckDBBase:
     table_name: str
 
     def __init__(self):
-        self.db_name = db_path
-        self.conn = duckdb.connect(self.db_name)
-        self._lock = Lock()
+        self._lock = connection.lock
+
+    @property
+    def db_name(self) -> str:
+        return connection.db_path
+
+    @property
+    def conn(self) -> duckdb.DuckDBPyConnection:
+        """所有表共享的连接，首次访问时才打开数据库"""
+        return connection.connection
+
+    def ensure_schema(self):
+        """创建本表用到的表和视图（幂等），由写入入口显式调用，导入模块时不做任何 DDL"""
 
     def _execute(self, query: str, params: tuple = ()) -> Any:
         """Execute SQL query with thread-local cursor"""
@@ -36,16 +46,71 @@ class DuckDBBase:
             return
 
         temp_view_name = f"temp_{table_name}_view"
-        self.conn.register(temp_view_name, df)
-
         query = f"INSERT INTO {table_name} SELECT * FROM {temp_view_name}"
 
         with self._lock:
+            self.conn.register(temp_view_name, df)
             self.conn.execute(query)
             self.conn.commit()
-        self.conn.unregister(temp_view_name)
+            self.conn.unregister(temp_view_name)
         return len(df)
 
+    def insert_batches(
+        self,
+        table_name: str,
+        batches: Iterable[Union[pa.RecordBatch, pa.Table, pd.DataFrame]],
+        cursor: Optional[duckdb.DuckDBPyConnection] = None,
+    ) -> int:
+        """
+        把一串 Arrow RecordBatch / DataFrame 流式写入表中，全部批次在同一个事务里提交。
+
+        批次按需从迭代器中取出，内存中只保留当前这一批；任一批次失败则整体回滚。
+        传入 cursor 时在调用方已开启的事务里写入，由调用方提交或回滚。
+        返回写入的总行数，并打印写入速度。
+        """
+        start = time.perf_counter()
+        if cursor is not None:
+            total = self._write_batches(cursor, table_name, batches)
+        else:
+            # 使用独立游标和事务，写入期间不占用共享连接的锁，其他线程可以同时查询
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN TRANSACTION")
+            try:
+                total = self._write_batches(cursor, table_name, batches)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+        elapsed = time.perf_counter() - start
+        if total:
+            print(
+                f"写入 {table_name} {total} 行，耗时 {elapsed:.2f} 秒，{total / elapsed:,.0f} 行/秒"
+            )
+        return total
+
+    @staticmethod
+    def _write_batches(
+        cursor: duckdb.DuckDBPyConnection,
+        table_name: str,
+        batches: Iterable[Union[pa.RecordBatch, pa.Table, pd.DataFrame]],
+    ) -> int:
+        temp_view_name = f"temp_{table_name}_batch"
+        total = 0
+        for batch in batches:
+            if isinstance(batch, pa.RecordBatch):
+                batch = pa.Table.from_batches([batch])
+            n_rows = len(batch)
+            if n_rows == 0:
+                continue
+            cursor.register(temp_view_name, batch)
+            cursor.execute(f"INSERT INTO {table_name} SELECT * FROM {temp_view_name}")
+            cursor.unregister(temp_view_name)
+            total += n_rows
+        return total
+
     def select(
         self,
         table_name: str,
@@ -0,0 +1,102 @@
+import os
+from threading import RLock
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    import duckdb
+
+
+class ConnectionManager:
+    """
+    进程内共享的 DuckDB 连接。
+
+    所有表对象都从这里取同一个数据库实例的游标，第一次查询时才真正打开文件。
+    子进程（fork 继承了父进程的连接）会在首次使用时重新打开自己的连接。
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        read_only: bool = False,
+        threads: Optional[int] = None,
+        memory_limit: Optional[str] = None,
+    ):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self.lock = RLock()
+        self._conn: Optional["duckdb.DuckDBPyConnection"] = None
+        self._pid: Optional[int] = None
+
+    def configure(
+        self,
+        db_path: Optional[str] = None,
+        read_only: Optional[bool] = None,
+        threads: Optional[int] = None,
+        memory_limit: Optional[str] = None,
+    ):
+        """修改连接参数，已打开的连接会被关闭，下次查询时按新参数重新打开"""
+        with self.lock:
+            self.close()
+            if db_path is not None:
+                self.db_path = db_path
+            if read_only is not None:
+                self.read_only = read_only
+            if threads is not None:
+                self.threads = threads
+            if memory_limit is not None:
+                self.memory_limit = memory_limit
+
+    def _config(self) -> Dict[str, Any]:
+        config: Dict[str, Any] = {}
+        if self.threads:
+            config["threads"] = self.threads
+        if self.memory_limit:
+            config["memory_limit"] = self.memory_limit
+        return config
+
+    @property
+    def connection(self) -> "duckdb.DuckDBPyConnection":
+        import duckdb  # 推迟到第一次查询，import database 时不加载 duckdb
+
+        with self.lock:
+            if self._conn is not None and self._pid != os.getpid():
+                # fork 出来的子进程不能使用父进程的连接，也不要关闭它
+                self._conn = None
+            if self._conn is None:
+                self._conn = duckdb.connect(
+                    os.path.expanduser(self.db_path),
+                    read_only=self.read_only,
+                    config=self._config(),
+                )
+                self._pid = os.getpid()
+            return self._conn
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None and self._pid == os.getpid()
+
+    def cursor(self) -> "duckdb.DuckDBPyConnection":
+        """返回共享数据库实例上的新游标，可在线程间独立使用"""
+        return self.connection.cursor()
+
+    def close(self):
+        with self.lock:
+            if self.is_open:
+                self._conn.close()
+            self._conn = None
+            self._pid = None
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+connection = ConnectionManager(
+    db_path=os.environ.get("DBPATH", ""),
+    read_only=os.environ.get("DUCKDB_READ_ONLY", "") in ("1", "true", "True"),
+    threads=_env_int("DUCKDB_THREADS"),
+    memory_limit=os.environ.get("DUCKDB_MEMORY_LIMIT") or None,
+)
@@ -1,10 +1,39 @@
 import os
-import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple, Union
 
 import pandas as pd
 
-from common import download_file
+from common import Download, download_cache
 from database.base import DuckDBBase
+from database.source import download_source
+
+CSINDEX_URL = os.environ.get(
+    "CSINDEX_URL",
+    "https://oss-ch.csindex.com.cn/static/html/csindex/public/uploads/file/autofile/cons/",
+)
+# 默认更新的指数：指数代码 -> 名称，成分股文件为 <指数代码>cons.xls
+CSINDEX_LIST = {
+    "930903": "全部A股",
+    "000300": "沪深300",
+    "000905": "中证500",
+    "000852": "中证1000",
+    "932000": "中证2000",
+}
+
+# Excel 列名到数据库列名的映射
+XLS_COLUMN_MAPPING = {
+    "指数英文名称Index Name(Eng)": "index_name",
+    "成份券代码Constituent Code": "code",
+    "成份券名称Constituent Name": "name",
+    "交易所英文名称Exchange(Eng)": "exchange",
+}
+# 交易所名称到简写映射
+EXCHANGE_MAPPING = {
+    "Shenzhen Stock Exchange": "SZ",
+    "Shanghai Stock Exchange": "SH",
+    "Beijing Stock Exchange": "BJ",
+}
 
 
 # 基于 DuckDBBase 的 IndexTable 类
@@ -12,6 +41,8 @@ class Index(DuckDBBase):
     def __init__(self):
         super().__init__()
         self.table_name = "raw_index_constituent"
+
+    def ensure_schema(self):
         self._create_index_table()
 
     def _create_index_table(self):
@@ -24,7 +55,27 @@ class Index(DuckDBBase):
         self.create_table(self.table_name, columns)
 
 
+def parse_csindex_xls(xls_file: str) -> pd.DataFrame:
+    """解析中证指数成分股 Excel，返回 index_name, name, symbol 三列"""
+    # 读取 Excel 文件，保留需要的列并重命名
+    df = pd.read_excel(xls_file, dtype=str)
+    data = df[list(XLS_COLUMN_MAPPING.keys())].rename(columns=XLS_COLUMN_MAPPING)
+    if data.empty:
+        raise ValueError(f"{xls_file} 中没有成分股")
+    # 替换交易所名称
+    data["exchange"] = data["exchange"].replace(EXCHANGE_MAPPING)
+    # 去除 index_name 中的空格
+    data["index_name"] = data["index_name"].str.replace(" ", "", regex=True)
+    # 生成 symbol 列（code.exchange）
+    data["symbol"] = (data["exchange"].str.lower()).str.cat(data["code"])
+    return data[["index_name", "name", "symbol"]].reset_index(drop=True)
+
+
 class CSIndex(Index):
+    def ensure_schema(self):
+        super().ensure_schema()
+        download_source.ensure_schema()
+
     def query(self, csi_name=None) -> pd.DataFrame:
         """查询 index_table 表，返回 DataFrame"""
         sql = f"SELECT * FROM {self.table_name}"
@@ -33,85 +84,146 @@ class CSIndex(Index):
 
         return self.query_df(sql)
 
-    def store_xls(self, xls_file: str):
-        """解析 Excel 文件并导入数据到 csi 表"""
-        # Excel 列名到数据库列名的映射
-        xls_column_mapping = {
-            "指数英文名称Index Name(Eng)": "index_name",
-            "成份券代码Constituent Code": "code",
-            "成份券名称Constituent Name": "name",
-            "交易所英文名称Exchange(Eng)": "exchange",
-        }
-        # 交易所名称到简写映射
-        exchange_mapping = {
-            "Shenzhen Stock Exchange": "SZ",
-            "Shanghai Stock Exchange": "SH",
-            "Beijing Stock Exchange": "BJ",
-        }
+    def replace_indexes(self, items: List[Tuple[Optional[Download], pd.DataFrame]]):
+        """
+        用解析好的成分股替换表中对应指数的数据，items 为 (下载结果, 数据)。
 
+        所有指数在同一个事务里删除、写入并记录导入的内容，任一失败整体回滚，
+        不会出现只更新了一部分指数的情况。
+        """
+        temp_view_name = f"temp_{self.table_name}_replace"
+        cursor = self.conn.cursor()
+        cursor.execute("BEGIN TRANSACTION")
         try:
-            # 读取 Excel 文件
-            df = pd.read_excel(xls_file, dtype=str)
-            # 保留需要的列
-            columns_to_keep = list(xls_column_mapping.keys())
-            data = df[columns_to_keep].copy()
-            # 重命名列
-            data.rename(columns=xls_column_mapping, inplace=True)
-            # 替换交易所名称
-            data["exchange"] = data["exchange"].replace(exchange_mapping)
-            # 去除 index_name 中的空格
-            data["index_name"] = data["index_name"].str.replace(" ", "", regex=True)
-            # 生成 symbol 列（code.exchange）
-            data["symbol"] = (data["exchange"].str.lower()).str.cat(data["code"])
-
-            # 避免重复数据
-            conditions = {"index_name": data["index_name"].iloc[0]}
-            self.delete(self.table_name, conditions)
-
-            column_order = ["index_name", "name", "symbol"]
-            data = data[column_order].copy()
-            # 插入 DataFrame 数据
-            self.insert_dataframe(self.table_name, data)
-        except Exception as e:
-            raise e
+            for download, data in items:
+                cursor.execute(
+                    f"DELETE FROM {self.table_name} WHERE index_name = ?",
+                    (data["index_name"].iloc[0],),
+                )
+                cursor.register(temp_view_name, data)
+                cursor.execute(
+                    f"INSERT INTO {self.table_name} SELECT * FROM {temp_view_name}"
+                )
+                cursor.unregister(temp_view_name)
+                if download is not None:
+                    download_source.record(cursor, download)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+
+    def store_xls(self, xls_file: str):
+        """解析 Excel 文件并导入数据到 csi 表"""
+        self.replace_indexes([(None, parse_csindex_xls(xls_file))])
 
 
 csindex = CSIndex()
 
 
-def import_csindex(index_file_name: str, temp_dir: str) -> str:
-    """
-    下载并处理单个中证指数文件。
+def parse_index_list(indexes: Union[None, str, List[str], Dict[str, str]] = None):
     """
-    csindex_url = "https://oss-ch.csindex.com.cn/static/html/csindex/public/uploads/file/autofile/cons/"
-    url = csindex_url + index_file_name
-    output_path = os.path.join(temp_dir, index_file_name)
-
-    if not download_file(url, output_path):
-        raise Exception(f"下载 {index_file_name} 失败")
+    要更新的指数 {指数代码: 名称}。
 
-    try:
-        csindex.store_xls(output_path)
-    except Exception as e:
-        raise Exception(f"处理文件时出错: {e}") from e
+    indexes 可以是字典、代码列表，或逗号分隔的字符串如 "000300,000016:上证50"；
+    未指定时读取环境变量 CSINDEX_LIST，也没有则用默认的 CSINDEX_LIST。
+    """
+    if indexes is None:
+        indexes = os.environ.get("CSINDEX_LIST") or CSINDEX_LIST
+    if isinstance(indexes, dict):
+        return {str(code): name for code, name in indexes.items()}
+    if isinstance(indexes, str):
+        indexes = indexes.split(",")
+
+    result = {}
+    for item in indexes:
+        code, _, name = str(item).strip().partition(":")
+        if code:
+            result[code] = name or CSINDEX_LIST.get(code, code)
+    return result
+
+
+def run_csindex_update(
+    indexes=None,
+    base_url: Optional[str] = None,
+    download_workers: int = 4,
+    parse_workers: int = 2,
+    timeout: float = 30,
+    force: bool = False,
+) -> Dict[str, str]:
+    """
+    更新中证指数成分股。
 
-    return index_file_name
+    1. 线程池并发下载，经过 common.download_cache，没有变化的文件不重新传输；
+    2. 与上次导入的内容相同的文件直接跳过，其余交给进程池解析 Excel；
+    3. 所有解析成功的指数在一个事务里替换。
 
+    单个指数下载或解析失败只打印错误，不影响其他指数；失败的指数没有记录
+    sha256，下次运行会重试。返回 {指数代码: 状态}。
 
-def run_csindex_update():
+    :param force: 忽略已导入的记录，全部重新解析导入
+    """
     print(f"\n{'=' * 50}\n开始更新指数成分信息")
+    csindex.ensure_schema()
+
+    index_list = parse_index_list(indexes)
+    base_url = base_url or CSINDEX_URL
+    imported = {} if force else download_source.imported()
+    status, failed = {}, set()
+
+    # 1. 并发下载
+    downloaded = {}
+    with ThreadPoolExecutor(max_workers=download_workers) as pool:
+        futures = {
+            pool.submit(
+                download_cache.fetch, f"{base_url}{code}cons.xls", timeout=timeout
+            ): code
+            for code in index_list
+        }
+        for future in as_completed(futures):
+            code = futures[future]
+            try:
+                download = future.result()
+            except Exception as e:
+                status[code] = f"下载失败: {e}"
+                failed.add(code)
+                continue
+            if imported.get(download.url) == download.sha256:
+                status[code] = "文件未变化，跳过"
+            else:
+                downloaded[code] = download
+
+    # 2. 进程池解析有变化的文件
+    parsed = {}
+    if downloaded:
+        workers = max(1, min(parse_workers, len(downloaded)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(parse_csindex_xls, download.path): code
+                for code, download in downloaded.items()
+            }
+            for future in as_completed(futures):
+                code = futures[future]
+                try:
+                    parsed[code] = (downloaded[code], future.result())
+                except Exception as e:
+                    status[code] = f"处理文件时出错: {e}"
+                    failed.add(code)
+
+    # 3. 一个事务写入
+    if parsed:
+        try:
+            csindex.replace_indexes(list(parsed.values()))
+            for code, (_, data) in parsed.items():
+                status[code] = f"导入 {len(data)} 只成分股"
+        except Exception as e:
+            for code in parsed:
+                status[code] = f"写入失败: {e}"
+                failed.add(code)
 
-    index_list = [
-        {"name": "全部A股", "file": "930903cons.xls"},
-        {"name": "沪深300", "file": "000300cons.xls"},
-        {"name": "中证500", "file": "000905cons.xls"},
-        {"name": "中证1000", "file": "000852cons.xls"},
-        {"name": "中证2000", "file": "932000cons.xls"},
-    ]
-
-    with tempfile.TemporaryDirectory() as temp_dir:
-        for index in index_list:
-            r = import_csindex(index_file_name=index["file"], temp_dir=temp_dir)
-            print(f"✅ {index['name'] + ':'} {r} 处理成功")
+    for code, name in index_list.items():
+        print(f"{'❌' if code in failed else '✅'} {name}({code}): {status[code]}")
 
     print(f"🎉 指数成分更新完成\n{'=' * 50}\n")
+    return status
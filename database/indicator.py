@@ -1,14 +1,40 @@
-from typing import Optional
+from typing import Iterable, Optional
 
+import duckdb
 import pandas as pd
 
 from database.base import DuckDBBase
 
+# 宽表中每个指标一列。成交量均线数值较大，FLOAT 的精度保留不了两位小数，用 DOUBLE
+WIDE_COLUMN_TYPES = {
+    "ma10": "FLOAT",
+    "ma20": "FLOAT",
+    "ma60": "FLOAT",
+    "ma_power_ratio": "FLOAT",
+    "ma_power_slope": "FLOAT",
+    "atr": "FLOAT",
+    "ma5_vol": "DOUBLE",
+    "ma10_vol": "DOUBLE",
+    "ma20_vol": "DOUBLE",
+    "macd": "FLOAT",
+    "signal": "FLOAT",
+    "hist": "FLOAT",
+    "adx": "FLOAT",
+    "pdi": "FLOAT",
+    "mdi": "FLOAT",
+    "bb_upper": "FLOAT",
+    "bb_middle": "FLOAT",
+    "bb_lower": "FLOAT",
+    "bb_width": "FLOAT",
+}
+
 
 class Indicator(DuckDBBase):
     def __init__(self):
         super().__init__()
         self.table_name = "calc_indicator"
+
+    def ensure_schema(self):
         self._create_indicator_table()
 
     def _create_indicator_table(self):
@@ -29,6 +55,31 @@ class Indicator(DuckDBBase):
         df = df[required_cols].copy()
         self.insert_dataframe(table_name=self.table_name, df=df)
 
+    def insert_many(
+        self,
+        frames: Iterable[pd.DataFrame],
+        cursor: Optional[duckdb.DuckDBPyConnection] = None,
+    ) -> int:
+        """
+        逐个写入多个长表 DataFrame（如每只股票一个），不先拼接成大表，空表跳过。
+
+        传入 cursor 时在调用方的事务里写入。
+        """
+        required_cols = ["date", "symbol", "indicator", "value"]
+
+        def batches():
+            for df in frames:
+                # 没有行情的股票返回空表（可能连列都没有），与 pd.concat 一样跳过
+                if df is None or df.empty:
+                    continue
+                if not set(required_cols).issubset(df.columns):
+                    raise ValueError(f"DataFrame 必须包含 {required_cols} 四列")
+                yield df[required_cols]
+
+        return self.insert_batches(
+            table_name=self.table_name, batches=batches(), cursor=cursor
+        )
+
     def delete_symbols(self, symbols):
         symbol_str = ", ".join([f"'{s}'" for s in symbols])
         sql = f"DELETE FROM {self.table_name} WHERE symbol in ({symbol_str})"
@@ -74,4 +125,195 @@ class Indicator(DuckDBBase):
         return self.query_df(query)
 
 
+class IndicatorState(DuckDBBase):
+    """
+    每只股票指标递推计算的状态，用于夜间增量更新时只推进新增的 K 线。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.table_name = "calc_indicator_state"
+
+    def ensure_schema(self):
+        self._create_state_table()
+
+    def _create_state_table(self):
+        """建表"""
+        columns = {
+            "symbol": "VARCHAR",
+            "date": "DATE",
+            "n_bars": "INTEGER",
+            "ema_fast": "DOUBLE",
+            "ema_slow": "DOUBLE",
+            "macd_signal": "DOUBLE",
+            "prev_high": "DOUBLE",
+            "prev_low": "DOUBLE",
+            "prev_close": "DOUBLE",
+            "tr_smooth": "DOUBLE",
+            "pdm_smooth": "DOUBLE",
+            "mdm_smooth": "DOUBLE",
+            "adx": "DOUBLE",
+            "close_tail": "DOUBLE[]",
+            "volume_tail": "DOUBLE[]",
+            "tr_tail": "DOUBLE[]",
+            "ratio_tail": "DOUBLE[]",
+        }
+        super().create_table(self.table_name, columns)
+
+    def load(self, symbols: list[str]) -> pd.DataFrame:
+        """读取指定股票的状态"""
+        query = f"""
+            SELECT * FROM {self.table_name}
+            WHERE symbol IN (SELECT UNNEST(?))
+            ORDER BY symbol
+        """
+        return self._execute(query, (list(symbols),)).fetch_df()
+
+    def save(
+        self, df: pd.DataFrame, cursor: Optional[duckdb.DuckDBPyConnection] = None
+    ):
+        """
+        覆盖写入 df 中股票的状态，删除和写入在同一个事务里，失败时旧状态保持不变。
+
+        传入 cursor 时在调用方的事务里写入，与指标数据一起提交或回滚。
+        """
+        if df.empty:
+            return
+        if cursor is not None:
+            self._replace(cursor, df)
+            return
+
+        cursor = self.conn.cursor()
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            self._replace(cursor, df)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+
+    def _replace(self, cursor: duckdb.DuckDBPyConnection, df: pd.DataFrame):
+        cursor.execute(
+            f"DELETE FROM {self.table_name} WHERE symbol IN (SELECT UNNEST(?))",
+            (df["symbol"].tolist(),),
+        )
+        self.insert_batches(table_name=self.table_name, batches=[df], cursor=cursor)
+
+    def delete_symbols(self, symbols):
+        query = f"DELETE FROM {self.table_name} WHERE symbol IN (SELECT UNNEST(?))"
+        self._execute(query, (list(symbols),))
+
+
+class IndicatorWide(DuckDBBase):
+    """
+    宽表存储：以 (symbol, date) 为键，每个指标一列。
+
+    横截面筛选只需扫描用到的列，不必对整张长表做 PIVOT。数据按 (date, symbol)
+    顺序写入，DuckDB 每个行组的 min/max（zone map）可以按日期跳过无关行组。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.table_name = "calc_indicator_wide"
+        self.long_view_name = "v_calc_indicator_long"
+
+    def ensure_schema(self):
+        self._create_wide_table()
+
+    def _create_wide_table(self):
+        """建表，并创建与 calc_indicator 同结构的长表视图"""
+        columns = {"symbol": "VARCHAR", "date": "DATE", **WIDE_COLUMN_TYPES}
+        super().create_table(self.table_name, columns)
+        self._execute(
+            f"""
+            CREATE OR REPLACE VIEW {self.long_view_name} AS
+            SELECT date, symbol, indicator, ROUND(value, 2) AS value
+            FROM (
+                UNPIVOT {self.table_name}
+                ON COLUMNS(* EXCLUDE (symbol, date))
+                INTO NAME indicator VALUE value
+            )
+            """
+        )
+
+    def indicator_columns(self) -> list[str]:
+        df = self.query_df(f"DESCRIBE {self.table_name}")
+        return [c for c in df["column_name"] if c not in ("symbol", "date")]
+
+    def ensure_columns(self, names: list[str], column_type: str = "FLOAT"):
+        """为新增的指标补充列"""
+        existing = set(self.indicator_columns())
+        for name in names:
+            if name not in existing:
+                self._execute(
+                    f'ALTER TABLE {self.table_name} ADD COLUMN "{name}" {column_type}'
+                )
+
+    def insert(
+        self, df: pd.DataFrame, cursor: Optional[duckdb.DuckDBPyConnection] = None
+    ):
+        """写入宽表，传入 cursor 时在调用方的事务里写入"""
+        if not {"symbol", "date"}.issubset(df.columns):
+            raise ValueError("DataFrame 必须包含 symbol, date 两列")
+
+        columns = ["symbol", "date"] + self.indicator_columns()
+        df = df.reindex(columns=columns).sort_values(["date", "symbol"])
+        if cursor is not None:
+            self.insert_batches(
+                table_name=self.table_name, batches=[df], cursor=cursor
+            )
+        else:
+            self.insert_dataframe(table_name=self.table_name, df=df)
+
+    def delete_symbols(self, symbols):
+        query = f"DELETE FROM {self.table_name} WHERE symbol IN (SELECT UNNEST(?))"
+        self._execute(query, (list(symbols),))
+
+    def recluster(self):
+        """按 (date, symbol) 重写整张表，全量初始化后执行可让 zone map 更有效"""
+        with self._lock:
+            self._execute(
+                f"""
+                CREATE OR REPLACE TABLE {self.table_name} AS
+                SELECT * FROM {self.table_name} ORDER BY date, symbol
+                """
+            )
+
+    def query(
+        self,
+        symbol: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """查询单只股票的指标，结果与 Indicator.query 的宽表一致，无需 PIVOT"""
+        conditions = ["symbol = ?"]
+        params = [symbol]
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+
+        query = f"""
+            SELECT * FROM {self.table_name}
+            WHERE {" AND ".join(conditions)}
+            ORDER BY date
+        """
+        return self._execute(query, tuple(params)).fetch_df()
+
+    def cross_section(self, date: str, where: Optional[str] = None) -> pd.DataFrame:
+        """
+        查询某一天全市场的指标，where 为附加的 SQL 条件，例如 "adx > 25 AND ma_power_ratio = 1"。
+        """
+        query = f"SELECT * FROM {self.table_name} WHERE date = ?"
+        if where:
+            query += f" AND ({where})"
+        return self._execute(query + " ORDER BY symbol", (date,)).fetch_df()
+
+
 indicator = Indicator()
+indicator_wide = IndicatorWide()
+indicator_state = IndicatorState()
@@ -0,0 +1,81 @@
+import importlib
+import sys
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyObject:
+    """
+    模块级单例的惰性代理：第一次访问属性时才导入所在模块并取出真实对象。
+
+    `from database import stock` 只拿到代理，不会加载 pandas / duckdb，
+    也不会打开数据库；之后所有属性访问和调用都转发给真实对象。
+
+    代理与所在子模块同名时（database.stock 中的 stock），`import database.stock as m`
+    拿到的也是代理；真实对象上没有的属性到子模块中查找，m.Stock 等照常可用。
+    """
+
+    __slots__ = ("_module_name", "_attr", "_target")
+
+    def __init__(self, module_name: str, attr: str):
+        object.__setattr__(self, "_module_name", module_name)
+        object.__setattr__(self, "_attr", attr)
+        object.__setattr__(self, "_target", None)
+
+    def _resolve(self) -> Any:
+        target = object.__getattribute__(self, "_target")
+        if target is None:
+            module_name = object.__getattribute__(self, "_module_name")
+            module = importlib.import_module(module_name)
+            target = getattr(module, object.__getattribute__(self, "_attr"))
+            object.__setattr__(self, "_target", target)
+        return target
+
+    def _shadowed_module(self) -> Optional[ModuleType]:
+        """被代理遮住的同名子模块，不同名时返回 None"""
+        module_name = object.__getattribute__(self, "_module_name")
+        if module_name.rpartition(".")[2] != object.__getattribute__(self, "_attr"):
+            return None
+        return sys.modules.get(module_name)
+
+    def __getattr__(self, name: str) -> Any:
+        target = self._resolve()
+        try:
+            return getattr(target, name)
+        except AttributeError:
+            module = self._shadowed_module()
+            if module is None or not hasattr(module, name):
+                raise
+            return getattr(module, name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._resolve(), name, value)
+
+    def __dir__(self):
+        names = set(dir(self._resolve()))
+        module = self._shadowed_module()
+        if module is not None:
+            names.update(dir(module))
+        return sorted(names)
+
+    def __repr__(self) -> str:
+        target = object.__getattribute__(self, "_target")
+        if target is None:
+            module_name = object.__getattribute__(self, "_module_name")
+            attr = object.__getattribute__(self, "_attr")
+            return f"<lazy {module_name}.{attr}>"
+        return repr(target)
+
+
+class LazyPackage(ModuleType):
+    """
+    导入子模块时，import 机制会把 `database.stock` 等属性设为子模块本身，
+    从而覆盖同名的单例代理；这里保留代理，保证 `from database import stock`
+    始终拿到的是表对象，子模块中的类和函数仍可通过代理访问（见 LazyObject）。
+    """
+
+    def __setattr__(self, name: str, value: Any):
+        current = self.__dict__.get(name)
+        if isinstance(current, LazyObject) and isinstance(value, ModuleType):
+            return
+        super().__setattr__(name, value)
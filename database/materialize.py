@@ -0,0 +1,221 @@
+import os
+import re
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from database.base import DuckDBBase
+from database.stock import stock
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "sql")
+
+# 需要物化的视图：视图名 -> (上游关系, 计算新的一行需要往前回看的行数)
+# 上游是另一个物化视图时，增量刷新直接读取它的物化表；按依赖顺序排列
+MATERIALIZED_VIEWS: Dict[str, Tuple[str, int]] = {
+    "ta_ma": ("v_qfq_stocks", 60),
+    # TR 需要昨收，14 周期均值再多回看一行
+    "ta_atr": ("v_qfq_stocks", 15),
+    "ta_volume_ratio": ("v_qfq_stocks", 5),
+    "ta_boll": ("ta_ma", 20),
+}
+
+_VIEW_PATTERN = re.compile(
+    r"CREATE\s+(?:OR\s+REPLACE\s+)?VIEW\s+(\w+)\s+AS\s+(.*?);?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+class MaterializedViews(DuckDBBase):
+    """
+    把 sql/ 下的技术指标视图物化成 mat_<视图名> 表，并按日期增量刷新。
+
+    视图本身保持不变，仍是指标的定义；每次刷新只对新增日期计算，输入只取
+    每只股票最近 lookback 行，窗口函数不再扫描全部历史。区间内有除权除息、
+    或近期行数不足以覆盖回看窗口（长期停牌）的股票整只重算。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.definitions: Dict[str, str] = {}
+
+    @staticmethod
+    def table_for(view_name: str) -> str:
+        return f"mat_{view_name}"
+
+    def load_sql(self, sql_dir: str = SQL_DIR) -> List[str]:
+        """
+        执行 sql_dir 下的全部 .sql 文件创建视图，返回创建的视图名。
+
+        视图之间有依赖（ta_boll 基于 ta_ma），执行失败的文件会在其余文件
+        执行后重试，直到全部成功或无法继续。
+        """
+        pending = {}
+        for file_name in sorted(os.listdir(sql_dir)):
+            if file_name.endswith(".sql"):
+                with open(os.path.join(sql_dir, file_name), encoding="utf-8") as f:
+                    pending[file_name] = f.read()
+
+        created = []
+        while pending:
+            errors = {}
+            n_pending = len(pending)
+            for file_name, sql in list(pending.items()):
+                try:
+                    self._execute(sql)
+                except Exception as e:
+                    errors[file_name] = e
+                    continue
+                del pending[file_name]
+                match = _VIEW_PATTERN.search(sql)
+                if match:
+                    self.definitions[match.group(1)] = match.group(2)
+                    created.append(match.group(1))
+                print(f"✅ {file_name} 执行成功")
+            # 本轮没有任何文件执行成功，说明剩下的无法靠重试解决
+            if len(pending) == n_pending:
+                for file_name, e in errors.items():
+                    print(f"❌ {file_name} 执行失败: {e}")
+                break
+        return created
+
+    def _body(self, view_name: str) -> str:
+        if view_name not in self.definitions:
+            self.load_sql()
+        return self.definitions[view_name]
+
+    def _source_sql(self, source: str, condition: str) -> str:
+        """上游关系加上过滤条件后的子查询，物化过的视图读物化表"""
+        relation = source
+        if source in MATERIALIZED_VIEWS:
+            table_name = self.table_for(source)
+            if self._table_exists(table_name):
+                relation = table_name
+        return f"(SELECT * FROM {relation} WHERE {condition})"
+
+    def _select(self, view_name: str, condition: str) -> Tuple[str, int]:
+        """
+        把视图定义中的上游关系替换为带过滤条件的子查询，
+        返回 SQL 和替换次数（条件中的参数需要按次数重复）。
+        """
+        source, _ = MATERIALIZED_VIEWS[view_name]
+        source_sql = self._source_sql(source, condition)
+        body = self._body(view_name)
+        return re.subn(rf"\b{source}\b", lambda _: source_sql, body)
+
+    def _table_exists(self, table_name: str) -> bool:
+        df = self.query_df(
+            "SELECT COUNT(*) AS n FROM duckdb_tables() "
+            f"WHERE table_name = '{table_name}'"
+        )
+        return bool(df["n"].iloc[0])
+
+    def _watermark(self, table_name: str) -> Optional[str]:
+        df = self.query_df(f"SELECT MAX(date) AS latest FROM {table_name}")
+        val = df.iloc[0, 0]
+        return None if pd.isna(val) else pd.to_datetime(val).strftime("%Y-%m-%d")
+
+    def _deep_symbols(self, table_name: str, lookback: int) -> Tuple[str, List[str]]:
+        """
+        返回回看窗口的起始日期（留出一倍余量容纳零星停牌），以及在该日期之后
+        行数仍不足 lookback、但更早还有数据的股票（长期停牌），这些股票只能整只重算。
+        """
+        df = self.query_df(
+            f"""
+            SELECT date FROM (SELECT DISTINCT date FROM {table_name})
+            ORDER BY date DESC LIMIT 1 OFFSET {lookback * 2 - 1}
+            """
+        )
+        if df.empty:
+            return "1900-01-01", []
+        floor = pd.to_datetime(df.iloc[0, 0]).strftime("%Y-%m-%d")
+        df = self.query_df(
+            f"""
+            SELECT symbol FROM {table_name}
+            GROUP BY symbol
+            HAVING COUNT(*) FILTER (WHERE date >= '{floor}') < {lookback}
+               AND MIN(date) < '{floor}'
+            """
+        )
+        return floor, df["symbol"].tolist()
+
+    def refresh_view(self, view_name: str, full: bool = False) -> int:
+        """刷新单个物化视图，返回写入的行数"""
+        table_name = self.table_for(view_name)
+        _, lookback = MATERIALIZED_VIEWS[view_name]
+
+        cursor = self.conn.cursor()
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            watermark = None
+            if not full and self._table_exists(table_name):
+                watermark = self._watermark(table_name)
+
+            if watermark is None:
+                sql, _ = self._select(view_name, "TRUE")
+                cursor.execute(
+                    f"CREATE OR REPLACE TABLE {table_name} AS "
+                    f"SELECT * FROM ({sql}) ORDER BY date, symbol"
+                )
+                n_rows = cursor.execute(
+                    f"SELECT COUNT(*) FROM {table_name}"
+                ).fetchone()[0]
+                cursor.execute("COMMIT")
+                print(f"✅ {table_name} 全量构建 {n_rows} 行")
+                return n_rows
+
+            next_date = (pd.to_datetime(watermark) + timedelta(days=1)).strftime(
+                "%Y-%m-%d"
+            )
+            floor, rebuild = self._deep_symbols(table_name, lookback)
+            xdxr_symbols = stock.list_stocks_with_xdxr(start_date=next_date)
+            rebuild = sorted(set(rebuild) | set(xdxr_symbols))
+
+            n_rows = 0
+            if rebuild:
+                cursor.execute(
+                    f"DELETE FROM {table_name} WHERE symbol IN (SELECT UNNEST(?))",
+                    (rebuild,),
+                )
+                sql, n = self._select(view_name, "symbol IN (SELECT UNNEST(?))")
+                n_rows += cursor.execute(
+                    f"INSERT INTO {table_name} "
+                    f"SELECT * FROM ({sql}) ORDER BY date, symbol",
+                    (rebuild,) * n,
+                ).fetchone()[0]
+
+            sql, n = self._select(
+                view_name, "date >= ? AND symbol NOT IN (SELECT UNNEST(?))"
+            )
+            n_rows += cursor.execute(
+                f"INSERT INTO {table_name} "
+                f"SELECT * FROM ({sql}) WHERE date > ? ORDER BY date, symbol",
+                (floor, rebuild) * n + (watermark,),
+            ).fetchone()[0]
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+
+        print(
+            f"✅ {table_name} 增量刷新 {n_rows} 行，其中 {len(rebuild)} 只股票整只重算"
+        )
+        return n_rows
+
+    def refresh(self, view_names: Optional[List[str]] = None, full: bool = False):
+        """按依赖顺序刷新物化视图"""
+        for view_name in MATERIALIZED_VIEWS:
+            if view_names is None or view_name in view_names:
+                self.refresh_view(view_name, full=full)
+
+
+materialized_views = MaterializedViews()
+
+
+def run_materialize_update():
+    print(f"\n{'=' * 50}\n开始刷新物化指标视图")
+    materialized_views.load_sql()
+    materialized_views.refresh()
+    print(f"🎉 物化指标视图刷新完成\n{'=' * 50}\n")
@@ -0,0 +1,315 @@
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+from database.base import DuckDBBase
+from database.stock import stock
+
+# 导出的数据集：数据集名 -> (关系, 除权除息后历史数据是否可能变化)
+# 可能变化的数据集在区间内有除权除息时，比对除权股票在各分区的数据，
+# 只重写不一致的分区；其余分区不动，新数据照常追加
+PARQUET_DATASETS: Dict[str, Tuple[str, bool]] = {
+    "qfq_stocks": ("v_qfq_stocks", True),
+    "adjust_factor": ("raw_adjust_factor", True),
+    "indicator": ("calc_indicator", True),
+}
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _date_literal(value: str) -> str:
+    return _literal(pd.to_datetime(value).strftime("%Y-%m-%d"))
+
+
+def _files(root: str, dataset: str) -> str:
+    return os.path.join(root, dataset, "*", "*", "*.parquet")
+
+
+def _partitions(base: str) -> List[str]:
+    """base 下的分区目录，形如 year=2024/month=6"""
+    if not os.path.isdir(base):
+        return []
+    return [
+        os.path.join(year_dir, month_dir)
+        for year_dir in sorted(os.listdir(base))
+        for month_dir in sorted(os.listdir(os.path.join(base, year_dir)))
+    ]
+
+
+def _has_files(root: str, dataset: str) -> bool:
+    base = os.path.join(root, dataset)
+    return os.path.isdir(base) and any(
+        name.endswith(".parquet")
+        for _, _, names in os.walk(base)
+        for name in names
+    )
+
+
+class ParquetStore(DuckDBBase):
+    """
+    把行情和指标导出成按 year/month 分区的 Parquet（hive 目录结构，zstd 压缩），
+    每个分区一个文件，文件内按 (symbol, date) 排序。
+
+    研究任务和其他机器通过 read_parquet_dataset 读取导出结果，不需要打开
+    DuckDB 数据库文件，也就不会与写入进程争用文件锁。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.root = os.environ.get("PARQUET_ROOT", "")
+
+    def watermark(self, dataset: str, root: Optional[str] = None) -> Optional[str]:
+        """已导出数据的最新日期，没有导出过返回 None"""
+        root = root or self.root
+        if not _has_files(root, dataset):
+            return None
+        val = duckdb.sql(
+            f"SELECT MAX(date) FROM read_parquet({_literal(_files(root, dataset))}, "
+            "hive_partitioning = true)"
+        ).fetchone()[0]
+        return None if val is None else pd.to_datetime(val).strftime("%Y-%m-%d")
+
+    def _changed_partitions(
+        self, relation: str, dataset: str, root: str, symbols: List[str]
+    ) -> List[Tuple[int, int]]:
+        """
+        symbols 在哪些 (year, month) 分区中的数据与已导出的不一致。
+
+        两边各做一次聚合：每个分区内这些股票的行数和逐行哈希的异或，
+        只读取这几只股票的数据，不需要重写就能找出变化的分区。
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"SELECT * FROM {relation} LIMIT 0")
+            # 多列 HASH 按列线性组合，同一列在偶数行上的相同变化会在异或中抵消，
+            # 再套一层 HASH 打散
+            row_hash = f"HASH(HASH({', '.join(d[0] for d in cursor.description)}))"
+            query = f"""
+                SELECT YEAR(date), MONTH(date), COUNT(*), BIT_XOR({row_hash})
+                FROM {{source}}
+                WHERE symbol IN (SELECT UNNEST(?))
+                GROUP BY ALL
+            """
+            current = set(
+                cursor.execute(query.format(source=relation), (symbols,)).fetchall()
+            )
+        files = _literal(_files(root, dataset))
+        exported_source = f"read_parquet({files}, hive_partitioning = true)"
+        with duckdb.connect() as conn:
+            result = conn.execute(query.format(source=exported_source), (symbols,))
+            exported = set(result.fetchall())
+        return sorted({(year, month) for year, month, _, _ in current ^ exported})
+
+    def _copy(self, relation: str, target: str, condition: str) -> int:
+        """
+        把 relation 中满足条件的行按 year/month 分区写到 target 目录。
+
+        DuckDB 的 PARTITION_BY 并行写入不保证文件内的行序：先一次扫描分区写出，
+        再逐个分区按 (symbol, date) 重排，读取时行组统计信息更紧凑。
+        """
+        unsorted = target + ".unsorted"
+        shutil.rmtree(unsorted, ignore_errors=True)
+        with self.conn.cursor() as cursor:
+            n_rows = cursor.execute(
+                f"""
+                COPY (
+                    SELECT *, YEAR(date) AS year, MONTH(date) AS month
+                    FROM {relation}
+                    WHERE {condition}
+                ) TO {_literal(unsorted)} (
+                    FORMAT PARQUET,
+                    COMPRESSION ZSTD,
+                    PARTITION_BY (year, month)
+                )
+                """
+            ).fetchone()[0]
+
+        try:
+            # 重排只读写 Parquet 文件，用独立的内存连接，不占用数据库连接
+            with duckdb.connect() as conn:
+                for partition in _partitions(unsorted):
+                    src = os.path.join(unsorted, partition, "*.parquet")
+                    os.makedirs(os.path.join(target, partition), exist_ok=True)
+                    dst = os.path.join(target, partition, "data_0.parquet")
+                    conn.execute(
+                        f"""
+                        COPY (
+                            SELECT * FROM read_parquet({_literal(src)})
+                            ORDER BY symbol, date
+                        ) TO {_literal(dst)} (FORMAT PARQUET, COMPRESSION ZSTD)
+                        """
+                    )
+        finally:
+            shutil.rmtree(unsorted, ignore_errors=True)
+        return n_rows
+
+    def export_dataset(
+        self, dataset: str, root: Optional[str] = None, full: bool = False
+    ) -> int:
+        """
+        导出单个数据集，返回写入的行数。
+
+        增量导出时从已导出数据最新日期所在的月份开始重写（该月分区可能不完整），
+        更早的分区只重写除权除息股票数据有变化的那些；新数据先写到临时目录，
+        再逐个分区替换，读取方不会看到写了一半的分区。
+        """
+        root = root or self.root
+        if not root:
+            raise ValueError("未指定 Parquet 导出目录（root 参数或 PARQUET_ROOT）")
+        relation, adjusted = PARQUET_DATASETS[dataset]
+        target = os.path.join(root, dataset)
+
+        watermark = None if full else self.watermark(dataset, root)
+        changed: List[Tuple[int, int]] = []
+        if watermark is not None and adjusted:
+            next_date = (pd.to_datetime(watermark) + pd.Timedelta(days=1)).strftime(
+                "%Y-%m-%d"
+            )
+            xdxr_symbols = stock.list_stocks_with_xdxr(start_date=next_date)
+            if xdxr_symbols:
+                changed = self._changed_partitions(
+                    relation, dataset, root, xdxr_symbols
+                )
+                print(
+                    f"{dataset}: {len(xdxr_symbols)} 只股票除权除息，"
+                    f"{len(changed)} 个分区需要重写"
+                )
+
+        if watermark is None:
+            condition = "TRUE"
+        else:
+            month_start = pd.to_datetime(watermark).replace(day=1)
+            condition = f"date >= {_date_literal(str(month_start.date()))}"
+            if changed:
+                months = ", ".join(str(year * 100 + month) for year, month in changed)
+                condition = (
+                    f"{condition} OR YEAR(date) * 100 + MONTH(date) IN ({months})"
+                )
+
+        staging = target + ".staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(root, exist_ok=True)
+        try:
+            n_rows = self._copy(relation, staging, condition)
+            written = set(_partitions(staging))
+            self._swap_in(staging, target, replace_all=watermark is None)
+            # 重写后没有数据的分区（股票被删除等）直接移除
+            for year, month in changed:
+                partition = os.path.join(f"year={year}", f"month={month}")
+                if partition not in written:
+                    shutil.rmtree(os.path.join(target, partition), ignore_errors=True)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        mode = "全量" if watermark is None else "增量"
+        print(f"✅ {dataset} {mode}导出 {n_rows} 行 -> {target}")
+        return n_rows
+
+    @staticmethod
+    def _swap_in(staging: str, target: str, replace_all: bool):
+        """用临时目录中的分区替换目标目录中的同名分区"""
+        if replace_all:
+            old = target + ".old"
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.isdir(target):
+                os.rename(target, old)
+            if os.path.isdir(staging):
+                os.rename(staging, target)
+            else:
+                os.makedirs(target, exist_ok=True)
+            shutil.rmtree(old, ignore_errors=True)
+            return
+
+        for partition in _partitions(staging):
+            dst = os.path.join(target, partition)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.rmtree(dst, ignore_errors=True)
+            os.rename(os.path.join(staging, partition), dst)
+
+    def export(
+        self,
+        datasets: Optional[Sequence[str]] = None,
+        root: Optional[str] = None,
+        full: bool = False,
+    ) -> Dict[str, int]:
+        """导出多个数据集，默认全部"""
+        names = list(PARQUET_DATASETS) if datasets is None else list(datasets)
+        unknown = [n for n in names if n not in PARQUET_DATASETS]
+        if unknown:
+            raise ValueError(f"未定义的数据集: {unknown}")
+        return {name: self.export_dataset(name, root, full) for name in names}
+
+
+parquet_store = ParquetStore()
+
+
+def read_parquet_dataset(
+    dataset: str,
+    root: Optional[str] = None,
+    columns: Optional[Sequence[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    symbols: Optional[Sequence[str]] = None,
+    where: Optional[str] = None,
+    as_: str = "pandas",
+):
+    """
+    读取导出的数据集，不访问 DuckDB 数据库文件。
+
+    日期范围同时换算成 year/month 条件，不相关的分区目录直接跳过；
+    日期、股票和 where 条件下推到 Parquet 扫描，按行组统计信息过滤。
+
+    :param columns: 返回的列，默认全部（不含分区列）
+    :param where: 附加的 SQL 条件，例如 "indicator = 'adx' AND value > 25"
+    :param as_: "pandas" 或 "arrow"
+    """
+    root = root or parquet_store.root
+    if not _has_files(root, dataset):
+        raise FileNotFoundError(f"{os.path.join(root, dataset)} 下没有 Parquet 文件")
+    if as_ not in ("pandas", "arrow"):
+        raise ValueError(f"不支持的返回格式: {as_}")
+
+    conditions: List[str] = []
+    params: list = []
+    if start_date:
+        start = pd.to_datetime(start_date)
+        conditions.append(f"date >= {_date_literal(start_date)}")
+        conditions.append(f"year * 100 + month >= {start.year * 100 + start.month}")
+    if end_date:
+        end = pd.to_datetime(end_date)
+        conditions.append(f"date <= {_date_literal(end_date)}")
+        conditions.append(f"year * 100 + month <= {end.year * 100 + end.month}")
+    if symbols is not None:
+        conditions.append("symbol IN (SELECT UNNEST(?))")
+        params.append(list(symbols))
+    if where:
+        conditions.append(f"({where})")
+
+    select = ", ".join(columns) if columns else "* EXCLUDE (year, month)"
+    query = f"""
+        SELECT {select}
+        FROM read_parquet({_literal(_files(root, dataset))}, hive_partitioning = true)
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY symbol, date
+    """
+    with duckdb.connect() as conn:
+        result = conn.execute(query, params)
+        if as_ == "arrow":
+            table: pa.Table = result.fetch_arrow_table()
+            return table
+        return result.fetch_df()
+
+
+def run_parquet_export(root: Optional[str] = None):
+    root = root or parquet_store.root
+    if not root:
+        print("未设置 PARQUET_ROOT，跳过 Parquet 导出")
+        return
+    print(f"\n{'=' * 50}\n开始导出 Parquet 数据集")
+    parquet_store.export(root=root)
+    print(f"🎉 Parquet 导出完成\n{'=' * 50}\n")
@@ -0,0 +1,265 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from database.base import DuckDBBase
+from database.index import csindex
+from database.indicator import indicator, indicator_wide
+from database.shenwan import shenwan
+from database.stock import stock
+
+# 可以 join 的表：名称 -> (关系, 可选列)；stock 只取筛选当天的行情
+JOIN_TABLES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "shenwan": (
+        shenwan.table_name,
+        ("class_code", "l1_class", "l2_class", "l3_class"),
+    ),
+    "stock": (
+        stock.qfq_table_name,
+        ("open", "high", "low", "close", "volume", "amount", "turnover"),
+    ),
+}
+# 不指定列时 join 的默认列
+JOIN_DEFAULT_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "shenwan": ("l1_class", "l2_class", "l3_class"),
+    "stock": ("close",),
+}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_IDENTIFIER = re.compile(r"\b[A-Za-z_][A-Za-z0-9_]*\b")
+
+
+def _identifiers(*expressions: Optional[str]) -> set:
+    """表达式里出现的标识符（去掉字符串字面量）"""
+    names = set()
+    for expr in expressions:
+        if expr:
+            names.update(_IDENTIFIER.findall(_STRING_LITERAL.sub("", expr)))
+    return names
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class Screener(DuckDBBase):
+    """
+    横截面选股：把筛选条件、行业 / 指数 join 和排序编译成一条 DuckDB 查询。
+
+    日期条件直接下推到指标表的扫描上，宽表按 (date, symbol) 排序，
+    zone map 可以跳过其他日期的行组；长表只读取用到的指标。
+    """
+
+    def _table_exists(self, table_name: str) -> bool:
+        df = self.query_df(
+            "SELECT COUNT(*) AS n FROM duckdb_tables() "
+            f"WHERE table_name = '{table_name}'"
+        )
+        return bool(df["n"].iloc[0])
+
+    def _has_date(self, table_name: str, date: str) -> bool:
+        return bool(
+            self._execute(
+                f"SELECT EXISTS (SELECT 1 FROM {table_name} WHERE date = ?)", (date,)
+            ).fetchone()[0]
+        )
+
+    def _pick_source(self, source: str, date: Optional[str]) -> Tuple[str, str]:
+        """确定指标来源（wide / long）和筛选日期"""
+        if source not in ("auto", "wide", "long"):
+            raise ValueError(f"不支持的指标来源: {source}")
+
+        candidates = ["wide", "long"] if source == "auto" else [source]
+        for kind in candidates:
+            table = indicator_wide if kind == "wide" else indicator
+            if not self._table_exists(table.table_name):
+                continue
+            day = date or table.get_latest_date()
+            if day is None:
+                continue
+            if source != "auto" or self._has_date(table.table_name, day):
+                return kind, day
+        raise ValueError(f"没有 {date or '最新日期'} 的指标数据")
+
+    def _indicator_names(self, kind: str, date: str) -> List[str]:
+        if kind == "wide":
+            return indicator_wide.indicator_columns()
+        return [
+            row[0]
+            for row in self._execute(
+                f"SELECT DISTINCT indicator FROM {indicator.table_name} "
+                "WHERE date = ? ORDER BY indicator",
+                (date,),
+            ).fetchall()
+        ]
+
+    @staticmethod
+    def _indicator_sql(kind: str, names: List[str]) -> str:
+        """当天指标的宽表子查询，只取 names 中的指标"""
+        if kind == "wide":
+            columns = ", ".join(_quote(n) for n in names)
+            select = "symbol, date" + (f", {columns}" if columns else "")
+            return f"SELECT {select} FROM {indicator_wide.table_name} WHERE date = ?"
+
+        # 长表：按需做条件聚合，不对整张表 PIVOT
+        aggregates = "".join(
+            f", FIRST(value) FILTER (WHERE indicator = {_literal(n)}) AS {_quote(n)}"
+            for n in names
+        )
+        wanted = ", ".join(_literal(n) for n in names) or "NULL"
+        return f"""
+            SELECT symbol, date{aggregates}
+            FROM {indicator.table_name}
+            WHERE date = ? AND indicator IN ({wanted})
+            GROUP BY symbol, date
+        """
+
+    @staticmethod
+    def _parse_join(join: Sequence[str]) -> Tuple[Dict[str, List[str]], List[str]]:
+        """
+        解析 join 配置，返回 ({表名: 列}, 指数名)。
+
+        - "shenwan" / "shenwan.l1_class"：申万行业分类
+        - "stock" / "stock.close"：当天的前复权行情
+        - "csindex.CSI300"：只保留该指数的成分股；"csindex" 则附加所属指数列表
+        """
+        tables: Dict[str, List[str]] = {}
+        index_names: List[str] = []
+        for item in join:
+            name, _, column = item.partition(".")
+            if name == "csindex":
+                if column:
+                    index_names.append(column)
+                else:
+                    tables.setdefault("csindex", [])
+                continue
+            if name not in JOIN_TABLES:
+                raise ValueError(f"不支持 join 的表: {name}")
+            _, available = JOIN_TABLES[name]
+            columns = [column] if column else list(JOIN_DEFAULT_COLUMNS[name])
+            unknown = [c for c in columns if c not in available]
+            if unknown:
+                raise ValueError(f"{name} 没有列: {unknown}")
+            selected = tables.setdefault(name, [])
+            selected.extend(c for c in columns if c not in selected)
+        return tables, index_names
+
+    def compile(
+        self,
+        date: Optional[str] = None,
+        where: Optional[str] = None,
+        join: Sequence[str] = (),
+        rank_by: Optional[str] = None,
+        ascending: bool = False,
+        top: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+        source: str = "auto",
+    ) -> Tuple[str, tuple]:
+        """生成 screen 执行的 SQL 和参数，参数含义见 screen"""
+        kind, date = self._pick_source(source, date)
+        available = self._indicator_names(kind, date)
+        if columns is None:
+            names = list(available)
+        else:
+            unknown = [c for c in columns if c not in available]
+            if unknown:
+                raise ValueError(f"{date} 没有这些指标: {unknown}")
+            names = list(columns)
+        # 条件和排序中用到、但未列出的指标也要取出来
+        referenced = _identifiers(where, rank_by)
+        names += [n for n in available if n in referenced and n not in names]
+
+        tables, index_names = self._parse_join(join)
+        select = ["i.*"]
+        joins = []
+        params: list = [date]
+        for name, cols in tables.items():
+            alias = f"j_{name}"
+            if name == "csindex":
+                select.append(f"{alias}.index_names")
+                joins.append(
+                    f"""
+                    LEFT JOIN (
+                        SELECT symbol, LIST(DISTINCT index_name ORDER BY index_name)
+                            AS index_names
+                        FROM {csindex.table_name} GROUP BY symbol
+                    ) {alias} ON {alias}.symbol = i.symbol
+                    """
+                )
+                continue
+            relation, _ = JOIN_TABLES[name]
+            select.extend(f"{alias}.{_quote(c)}" for c in cols)
+            if name == "stock":
+                relation = f"(SELECT * FROM {relation} WHERE date = ?)"
+                params.append(date)
+            joins.append(f"LEFT JOIN {relation} {alias} ON {alias}.symbol = i.symbol")
+
+        conditions = []
+        if index_names:
+            conditions.append(
+                f"i.symbol IN (SELECT symbol FROM {csindex.table_name} "
+                "WHERE index_name IN (SELECT UNNEST(?)))"
+            )
+            params.append(index_names)
+
+        query = f"""
+            SELECT {", ".join(select)}
+            FROM ({self._indicator_sql(kind, names)}) i
+            {" ".join(joins)}
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        """
+        # 外层再套一层，where / rank_by 可以直接使用指标名和 join 进来的列名
+        query = f"SELECT * FROM ({query})"
+        if where:
+            query += f" WHERE ({where})"
+        if rank_by:
+            order = "ASC" if ascending else "DESC"
+            query += f" ORDER BY {rank_by} {order} NULLS LAST, symbol"
+        else:
+            query += " ORDER BY symbol"
+        if top is not None:
+            query += f" LIMIT {int(top)}"
+        return query, tuple(params)
+
+    def screen(
+        self,
+        date: Optional[str] = None,
+        where: Optional[str] = None,
+        join: Sequence[str] = (),
+        rank_by: Optional[str] = None,
+        ascending: bool = False,
+        top: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+        source: str = "auto",
+    ) -> pd.DataFrame:
+        """
+        全市场某一天的指标筛选，例如：
+
+            screener.screen(
+                "2024-06-28",
+                where="adx > 25 AND ma_power_ratio = 1 AND l1_class = '电子'",
+                join=["shenwan.l1_class", "csindex.CSI300"],
+                rank_by="adx",
+                top=50,
+            )
+
+        :param date: 筛选日期，默认为指标表中的最新日期
+        :param where: SQL 条件，可使用指标名和 join 进来的列名
+        :param join: 要关联的表，写法见 _parse_join
+        :param rank_by: 排序表达式，默认降序，ascending=True 时升序
+        :param top: 只返回排名前 top 的股票
+        :param columns: 输出的指标，默认全部；where / rank_by 用到的指标会自动加入
+        :param source: "wide" 读宽表，"long" 读长表，"auto" 优先用有当天数据的宽表
+        """
+        query, params = self.compile(
+            date, where, join, rank_by, ascending, top, columns, source
+        )
+        return self._execute(query, params).fetch_df()
+
+
+screener = Screener()
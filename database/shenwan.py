@@ -1,10 +1,10 @@
-import os
-import tempfile
+from typing import Optional
 
 import pandas as pd
 
-from common import download_file, generate_symbol
+from common import Download, download_cache, generate_symbol
 from database.base import DuckDBBase
+from database.source import download_source
 
 
 # 基于 DuckDBBase 的 SW类
@@ -12,7 +12,10 @@ class ShenWan(DuckDBBase):
     def __init__(self):
         super().__init__()
         self.table_name = "raw_shenwan_industry"
+
+    def ensure_schema(self):
         self._create_shenwan_table()
+        download_source.ensure_schema()
 
     def _create_shenwan_table(self):
         """创建表"""
@@ -28,7 +31,8 @@ class ShenWan(DuckDBBase):
     def query(self) -> pd.DataFrame:
         return self.select(table_name=self.table_name)
 
-    def store_stock_class(self, xls_file: str):
+    def store_stock_class(self, xls_file: str, download: Optional[Download] = None):
+        """解析 Excel 并整表替换，download 不为空时在同一个事务里记录导入的内容"""
         # Excel 列名到数据库列名的映射
         xls_column_mapping = {
             "股票代码": "code",
@@ -56,8 +60,26 @@ class ShenWan(DuckDBBase):
                 how="left",
             )
             data.dropna(inplace=True)
-            self.truncate_table(self.table_name)
-            self.insert_dataframe(self.table_name, data)
+            data = data[["symbol", "class_code", "l1_class", "l2_class", "l3_class"]]
+
+            temp_view_name = f"temp_{self.table_name}_replace"
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN TRANSACTION")
+            try:
+                cursor.execute(f"DELETE FROM {self.table_name}")
+                cursor.register(temp_view_name, data)
+                cursor.execute(
+                    f"INSERT INTO {self.table_name} SELECT * FROM {temp_view_name}"
+                )
+                cursor.unregister(temp_view_name)
+                if download is not None:
+                    download_source.record(cursor, download)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
 
         except Exception as e:
             raise e
@@ -66,25 +88,30 @@ class ShenWan(DuckDBBase):
 shenwan = ShenWan()
 
 
-def run_shenwan_industry_update():
+def run_shenwan_industry_update(force: bool = False):
+    """
+    更新申万行业分类。文件经过 common.download_cache 下载，内容和上次导入的一样时
+    不重新导入；force 为 True 时总是重新导入。
+    """
     print(f"\n{'=' * 50}\n开始更新申万行业信息")
-    with tempfile.TemporaryDirectory() as temp_dir:
-        os.makedirs(temp_dir, exist_ok=True)
-        url = "https://www.swsresearch.com/swindex/pdf/SwClass2021/StockClassifyUse_stock.xls"
-        file_name = "sw_stock_class.xls"
-        headers = {
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Content-Type": "application/json",
-        }
+    shenwan.ensure_schema()
+    url = "https://www.swsresearch.com/swindex/pdf/SwClass2021/StockClassifyUse_stock.xls"
+    file_name = "sw_stock_class.xls"
+    headers = {
+        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+        "Content-Type": "application/json",
+    }
 
-        output_path = os.path.join(temp_dir, file_name)
-        if download_file(url, output_path, headers=headers):
-            try:
-                shenwan.store_stock_class(xls_file=output_path)
-            except Exception as e:
-                raise e
+    try:
+        download = download_cache.fetch(url, headers=headers)
+    except Exception as e:
+        print(f"❌ 文件下载失败：{file_name} {e}")
+    else:
+        if not force and download_source.is_imported(download):
+            print(f"✅ {file_name} 未变化，跳过导入")
         else:
-            print(f"❌ 文件下载失败：{file_name}")
+            shenwan.store_stock_class(xls_file=download.path, download=download)
+            print(f"✅ {file_name} 导入成功")
 
     print(f"🎉 申万行业信息更新完成\n{'=' * 50}\n")
 
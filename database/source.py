@@ -0,0 +1,46 @@
+from typing import Dict
+
+import duckdb
+
+from common import Download
+from database.base import DuckDBBase
+
+
+class DownloadSource(DuckDBBase):
+    """
+    记录每个下载地址最近一次成功导入的内容 sha256。
+
+    下载缓存只知道内容和上一次下载相比有没有变化；导入失败、或者换了一个数据库时，
+    以这里的记录为准，内容没变且已经导入过的文件才跳过。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.table_name = "raw_download_source"
+
+    def ensure_schema(self):
+        columns = {
+            "url": "varchar",
+            "sha256": "varchar",
+            "updated_at": "timestamp",
+        }
+        self.create_table(self.table_name, columns)
+
+    def imported(self) -> Dict[str, str]:
+        """{下载地址: 已导入内容的 sha256}"""
+        df = self.query_df(f"SELECT url, sha256 FROM {self.table_name}")
+        return dict(zip(df["url"], df["sha256"]))
+
+    def is_imported(self, download: Download) -> bool:
+        return self.imported().get(download.url) == download.sha256
+
+    def record(self, cursor: duckdb.DuckDBPyConnection, download: Download):
+        """在调用方的事务里记录导入的内容，和数据一起提交或回滚"""
+        cursor.execute(f"DELETE FROM {self.table_name} WHERE url = ?", (download.url,))
+        cursor.execute(
+            f"INSERT INTO {self.table_name} VALUES (?, ?, now())",
+            (download.url, download.sha256),
+        )
+
+
+download_source = DownloadSource()
@@ -1,7 +1,9 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from dateutil.relativedelta import relativedelta
 
 from common import generate_symbol
@@ -44,6 +46,73 @@ class Stock(DuckDBBase):
 
         return self.query_df(query)
 
+    def query_many(
+        self,
+        symbols: Optional[Sequence[str]],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+        as_: str = "pandas",
+    ) -> Any:
+        """
+        一次参数化查询取出多只股票的前复权行情，结果按 (symbol, date) 排序。
+        symbols 为 None 时取全部股票。
+
+        as_:
+            - "pandas": 以 (symbol, date) 为 MultiIndex 的 DataFrame
+            - "arrow": pyarrow.Table
+            - "numpy": dict，symbols / offsets 描述每只股票的区间
+              [offsets[i], offsets[i + 1])，其余键为 date 和各数据列的 NumPy 数组
+        """
+        if as_ not in ("pandas", "arrow", "numpy"):
+            raise ValueError(f"不支持的返回类型: {as_}")
+
+        if columns is None:
+            fields = "*"
+        else:
+            extra = [c for c in columns if c not in ("symbol", "date")]
+            fields = ", ".join(["symbol", "date", *extra])
+        conditions = ["TRUE"]
+        params: List[Any] = []
+        if symbols is not None:
+            conditions.append("symbol IN (SELECT UNNEST(?))")
+            params.append(list(symbols))
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+
+        query = f"""
+            SELECT {fields}
+            FROM {self.qfq_table_name}
+            WHERE {" AND ".join(conditions)}
+            ORDER BY symbol, date
+        """
+        with self.conn.cursor() as cursor:
+            table = cursor.execute(query, tuple(params)).fetch_arrow_table()
+
+        if as_ == "arrow":
+            return table
+        if as_ == "pandas":
+            df = table.to_pandas(date_as_object=False)
+            return df.set_index(["symbol", "date"])
+
+        # 合并成单个 chunk 后，无空值的数值列转换为 NumPy 时不再复制
+        table = table.combine_chunks()
+        names, offsets = symbol_offsets(table.column("symbol"))
+        result: Dict[str, Any] = {"symbols": names, "offsets": offsets}
+        for name in table.column_names:
+            if name == "symbol":
+                continue
+            column = table.column(name)
+            values = column.chunk(0) if column.num_chunks else column
+            result[name] = values.to_numpy(zero_copy_only=False)
+        if len(result["date"]):
+            result["date"] = result["date"].astype("datetime64[D]", copy=False)
+        return result
+
     def list_new_stocks(self, years_ago=2):
         """
         查询新股：最近两年（从当前日期起）开始有记录的股票。
@@ -82,4 +151,21 @@ class Stock(DuckDBBase):
         return symbols
 
 
+def symbol_offsets(symbol_column: pa.ChunkedArray) -> Tuple[List[str], np.ndarray]:
+    """
+    对按 symbol 排好序的列求出每只股票的区间，返回 (symbols, offsets)，
+    第 i 只股票占据 [offsets[i], offsets[i + 1])。
+    """
+    if len(symbol_column) == 0:
+        return [], np.zeros(1, dtype=np.int64)
+
+    encoded = symbol_column.combine_chunks().dictionary_encode()
+    codes = encoded.indices.to_numpy()
+    # 编码发生变化的位置就是区间边界
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    offsets = np.concatenate(([0], starts, [len(codes)])).astype(np.int64)
+    dictionary = encoded.dictionary.to_pylist()
+    return [dictionary[c] for c in codes[offsets[:-1]]], offsets
+
+
 stock = Stock()
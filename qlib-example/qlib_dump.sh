@@ -1,10 +1,8 @@
 #!/bin/bash
 
 # 配置路径
-TDX_EXPORT=${TDX_EXPORT:-"/tmp/aabb"}
-DATA_CSV_PATH="$TDX_EXPORT/data"
-FACTOR_CSV_PATH="$TDX_EXPORT/factor"
 QLIB_HOME=${QLIB_HOME:-"$HOME/Documents/qlib"}
+DB_PATH=${DBPATH:-"tdx.db"}
 
 # 参数检查
 if [ $# -lt 1 ]; then
@@ -14,30 +12,18 @@ fi
 
 MODE=$1
 
-run_dump() {
-    local mode=$1
-    local path=$2
-    local fields=$3
-
-    echo "Running $mode on $path with fields: $fields"
-    uv run scripts/dump_bin.py $mode \
-        --data_path "$path" \
-        --qlib_dir "$QLIB_HOME" \
-        --symbol_field_name symbol \
-        --date_field_name date \
-        --include_fields "$fields"
-}
-
 case "$MODE" in
     init)
-        # 初始化
-        run_dump dump_all "$DATA_CSV_PATH" "open,close,high,low,volume,amount,turnover"
-        run_dump dump_all "$FACTOR_CSV_PATH" "factor"
+        # 初始化：直接从 DuckDB 生成，不需要先 export_for_qlib
+        uv run scripts/dump_duckdb.py dump_all \
+            --db_path "$DB_PATH" \
+            --qlib_dir "$QLIB_HOME"
         ;;
     update)
-        # 更新
-        run_dump dump_update "$DATA_CSV_PATH" "open,close,high,low,volume,amount,turnover"
-        run_dump dump_all "$FACTOR_CSV_PATH" "factor"
+        # 更新：只读取 all.txt 中各股票结束日期之后的数据，追加到已有 .bin
+        uv run scripts/dump_duckdb.py dump_update \
+            --db_path "$DB_PATH" \
+            --qlib_dir "$QLIB_HOME"
         ;;
     *)
         echo "Unknown mode: $MODE"
@@ -0,0 +1,246 @@
+"""
+不经过 qlib.init 直接读取 Qlib 数据目录。
+
+每个 features/<symbol>/<field>.day.bin 用 np.memmap 只读映射：第一个 float32 是
+起始日期在交易日历中的下标，其后是逐日数值，读取时不复制数据。BinPanel 把多只
+股票拼成 (symbol × date) 的二维数组，某个字段第一次被访问时才真正读盘，校验和
+临时分析可以直接按磁盘带宽扫完整个数据目录。
+
+用法：
+    python bin_reader.py show --qlib_dir ~/.qlib/qlib_data/cn_data --symbol SH600000
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import fire
+import numpy as np
+import pandas as pd
+from qlib.utils import code_to_fname, fname_to_code
+
+CALENDARS_DIR_NAME = "calendars"
+FEATURES_DIR_NAME = "features"
+INSTRUMENTS_DIR_NAME = "instruments"
+INSTRUMENTS_SEP = "\t"
+
+
+def read_bin(path: Path) -> Tuple[int, np.ndarray]:
+    """返回 (起始日期在日历中的下标, 只读 memmap 数组)"""
+    path = Path(path)
+    n_values = path.stat().st_size // 4 - 1
+    with path.open("rb") as fp:
+        start = int(np.fromfile(fp, dtype="<f", count=1)[0])
+    if n_values <= 0:
+        return start, np.empty(0, dtype="<f")
+    return start, np.memmap(path, dtype="<f", mode="r", offset=4, shape=(n_values,))
+
+
+class QlibBinReader:
+    def __init__(self, qlib_dir: str, freq: str = "day"):
+        self.qlib_dir = Path(qlib_dir).expanduser()
+        self.freq = freq
+        self._calendar: Optional[np.ndarray] = None
+
+    @property
+    def calendar(self) -> np.ndarray:
+        """交易日历，datetime64[D]"""
+        if self._calendar is None:
+            path = self.qlib_dir.joinpath(CALENDARS_DIR_NAME, f"{self.freq}.txt")
+            self._calendar = np.loadtxt(path, dtype="datetime64[D]", ndmin=1)
+        return self._calendar
+
+    def instruments(self, market: str = "all") -> Dict[str, Tuple[str, str]]:
+        """instruments/<market>.txt：{SYMBOL: (开始日期, 结束日期)}"""
+        path = self.qlib_dir.joinpath(INSTRUMENTS_DIR_NAME, f"{market}.txt")
+        result = {}
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split(INSTRUMENTS_SEP)
+                if len(parts) == 3:
+                    result[parts[0]] = (parts[1], parts[2])
+        return result
+
+    def symbols(self) -> List[str]:
+        """features 目录下的全部股票，大写，与 instruments 中的写法一致"""
+        features = self.qlib_dir.joinpath(FEATURES_DIR_NAME)
+        return sorted(
+            fname_to_code(d.name).upper() for d in features.iterdir() if d.is_dir()
+        )
+
+    def feature_dir(self, symbol: str) -> Path:
+        fname = code_to_fname(symbol.lower()).lower()
+        return self.qlib_dir.joinpath(FEATURES_DIR_NAME, fname)
+
+    def bin_path(self, symbol: str, field: str) -> Path:
+        return self.feature_dir(symbol).joinpath(f"{field.lower()}.{self.freq}.bin")
+
+    def fields(self, symbol: Optional[str] = None) -> List[str]:
+        """某只股票（默认第一只）已有的字段"""
+        symbol = symbol or self.symbols()[0]
+        suffix = f".{self.freq}.bin"
+        return sorted(
+            p.name[: -len(suffix)]
+            for p in self.feature_dir(symbol).glob(f"*{suffix}")
+        )
+
+    def series(self, symbol: str, field: str) -> Tuple[int, np.ndarray]:
+        """单个字段的 (起始下标, memmap)，文件不存在时抛出 FileNotFoundError"""
+        return read_bin(self.bin_path(symbol, field))
+
+    def _date_range(
+        self, start_date: Optional[str], end_date: Optional[str]
+    ) -> Tuple[int, int]:
+        """日期区间在日历中的下标范围 [first, last)"""
+        calendar = self.calendar
+        first, last = 0, len(calendar)
+        if start_date is not None:
+            first = np.searchsorted(calendar, np.datetime64(start_date, "D"))
+        if end_date is not None:
+            last = np.searchsorted(calendar, np.datetime64(end_date, "D"), "right")
+        return int(first), int(last)
+
+    def features(
+        self,
+        symbol: str,
+        fields: Optional[Sequence[str]] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """单只股票的 DataFrame，相当于 D.features([symbol], ["$field", ...])"""
+        panel = self.panel(fields, [symbol], start_date, end_date)
+        return panel.to_frame().droplevel("instrument")
+
+    def panel(
+        self,
+        fields: Optional[Sequence[str]] = None,
+        symbols: Optional[Sequence[str]] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+    ) -> "BinPanel":
+        """多只股票的 (symbol × date) 面板，默认全部股票、全部字段、整个日历"""
+        if isinstance(fields, str):
+            fields = fields.split(",")
+        symbols = self.symbols() if symbols is None else [s.upper() for s in symbols]
+        fields = self.fields(symbols[0]) if fields is None else list(fields)
+        first, last = self._date_range(start_date, end_date)
+        return BinPanel(self, symbols, [f.strip() for f in fields], first, last)
+
+
+class BinPanel:
+    """
+    (symbol × date) 面板，panel[field] 返回 float32 二维数组，缺失为 NaN。
+
+    每个字段第一次访问时才从 memmap 拷贝到二维数组并缓存；
+    spans 记录每只股票在区间内有数据的列范围 [begin, end)。
+    """
+
+    def __init__(
+        self,
+        reader: QlibBinReader,
+        symbols: List[str],
+        fields: List[str],
+        first: int,
+        last: int,
+    ):
+        self.reader = reader
+        self.symbols = symbols
+        self.fields = fields
+        self.first = first
+        self.last = last
+        self.dates = reader.calendar[first:last]
+        self._values: Dict[str, np.ndarray] = {}
+        self._spans: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.fields
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        if field not in self.fields:
+            raise KeyError(field)
+        if field not in self._values:
+            self._values[field] = self._materialize(field)
+        return self._values[field]
+
+    def _clip(self, start: int, n_values: int) -> Tuple[int, int]:
+        """文件覆盖的下标 [start, start + n) 与面板区间的交集"""
+        return max(start, self.first), min(start + n_values, self.last)
+
+    def _materialize(self, field: str) -> np.ndarray:
+        out = np.full((len(self.symbols), len(self.dates)), np.nan, dtype="<f")
+        for i, symbol in enumerate(self.symbols):
+            path = self.reader.bin_path(symbol, field)
+            if not path.exists():
+                continue
+            start, values = read_bin(path)
+            lo, hi = self._clip(start, len(values))
+            if lo < hi:
+                out[i, lo - self.first : hi - self.first] = values[
+                    lo - start : hi - start
+                ]
+        return out
+
+    @property
+    def spans(self) -> np.ndarray:
+        """每只股票各字段文件覆盖范围的并集，只读文件头，不读数据"""
+        if self._spans is None:
+            spans = np.zeros((len(self.symbols), 2), dtype=np.int64)
+            for i, symbol in enumerate(self.symbols):
+                begin, end = self.last, self.first
+                for field in self.fields:
+                    path = self.reader.bin_path(symbol, field)
+                    if not path.exists():
+                        continue
+                    with path.open("rb") as fp:
+                        start = int(np.fromfile(fp, dtype="<f", count=1)[0])
+                    lo, hi = self._clip(start, path.stat().st_size // 4 - 1)
+                    if lo < hi:
+                        begin, end = min(begin, lo), max(end, hi)
+                if begin < end:
+                    spans[i] = (begin - self.first, end - self.first)
+            self._spans = spans
+        return self._spans
+
+    def to_frame(self, fields: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        转成以 (instrument, datetime) 为索引的长表，与 D.features 的输出一致：
+        每只股票只保留自己有数据的日期区间。
+        """
+        fields = self.fields if fields is None else list(fields)
+        spans = self.spans
+        lengths = spans[:, 1] - spans[:, 0]
+        rows = np.concatenate(
+            [np.full(n, i, dtype=np.int64) for i, n in enumerate(lengths)]
+            + [np.empty(0, dtype=np.int64)]
+        )
+        cols = np.concatenate(
+            [np.arange(b, e, dtype=np.int64) for b, e in spans]
+            + [np.empty(0, dtype=np.int64)]
+        )
+        index = pd.MultiIndex.from_arrays(
+            [
+                np.asarray(self.symbols, dtype=object)[rows],
+                pd.DatetimeIndex(self.dates[cols]),
+            ],
+            names=["instrument", "datetime"],
+        )
+        return pd.DataFrame({f: self[f][rows, cols] for f in fields}, index=index)
+
+
+def show(
+    qlib_dir: str,
+    symbol: str,
+    fields=None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    freq: str = "day",
+):
+    """打印单只股票的数据"""
+    reader = QlibBinReader(qlib_dir, freq)
+    print(reader.features(symbol, fields, start_date, end_date))
+
+
+if __name__ == "__main__":
+    fire.Fire({"show": show})
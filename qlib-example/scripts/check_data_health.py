@@ -1,202 +1,301 @@
 from loguru import logger
 import os
-from typing import Optional
+from typing import Dict, Iterator, List, Optional
 
 import fire
+import numpy as np
 import pandas as pd
-import qlib
 from tqdm import tqdm
 
-from qlib.data import D
+REQUIRED_COLUMNS = ["open", "high", "low", "close", "volume"]
+FACTOR_COLUMN = "factor"
+# index instruments have no adjust factor
+FACTOR_EXEMPT = ("000300", "000903", "000905")
+REPORT_COLUMNS = ["instrument", "problem", "column", "count", "date", "value"]
+
+
+class Chunk:
+    """A batch of instruments stacked into symbol-contiguous columns.
+
+    Instrument ``i`` occupies rows ``[offsets[i], offsets[i + 1])`` of every column,
+    sorted by date. Columns absent from the source are all-NaN.
+    """
+
+    def __init__(self, df: pd.DataFrame, missing_columns: Dict[str, List[str]]):
+        codes, symbols = pd.factorize(df["instrument"], sort=False)
+        starts = np.flatnonzero(np.diff(codes)) + 1
+        self.symbols: List[str] = list(symbols)
+        self.offsets = np.concatenate(([0], starts, [len(df)])).astype(np.int64)
+        self.dates = pd.to_datetime(df["date"]).to_numpy()
+        self.columns = {
+            c: df[c].to_numpy(dtype=np.float64) if c in df.columns else np.full(len(df), np.nan)
+            for c in REQUIRED_COLUMNS + [FACTOR_COLUMN]
+        }
+        self.missing_columns = missing_columns
+
+    def segment_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.symbols)), np.diff(self.offsets))
 
 
 class DataHealthChecker:
-    """Checks a dataset for data completeness and correctness. The data will be converted to a pd.DataFrame and checked for the following problems:
+    """Checks a dataset for data completeness and correctness. The data will be streamed in chunks of
+    instruments stacked into one columnar panel and checked with vectorized per-instrument reductions:
     - any of the columns ["open", "high", "low", "close", "volume"] are missing
     - any data is missing
     - any step change in the OHLCV columns is above a threshold (default: 0.5 for price, 3 for volume)
     - any factor is missing
+
+    The data source is one of a directory of csv files, a qlib data directory (read from the .bin files
+    directly, without ``qlib.init``) or a DuckDB database.
     """
 
     def __init__(
         self,
         csv_path=None,
         qlib_dir=None,
+        db_path=None,
         freq="day",
         large_step_threshold_price=0.5,
         large_step_threshold_volume=3,
         missing_data_num=0,
+        data_table="raw_stocks_daily",
+        factor_table="raw_adjust_factor",
+        chunk_rows=2_000_000,
     ):
-        assert csv_path or qlib_dir, "One of csv_path or qlib_dir should be provided."
-        assert not (csv_path and qlib_dir), "Only one of csv_path or qlib_dir should be provided."
+        sources = [s for s in (csv_path, qlib_dir, db_path) if s]
+        assert sources, "One of csv_path, qlib_dir or db_path should be provided."
+        assert len(sources) == 1, "Only one of csv_path, qlib_dir or db_path should be provided."
+        if csv_path:
+            assert os.path.isdir(csv_path), f"{csv_path} should be a directory."
 
-        self.data = {}
-        self.problems = {}
+        self.csv_path = csv_path
+        self.qlib_dir = qlib_dir
+        self.db_path = db_path
         self.freq = freq
         self.large_step_threshold_price = large_step_threshold_price
         self.large_step_threshold_volume = large_step_threshold_volume
         self.missing_data_num = missing_data_num
+        self.data_table = data_table
+        self.factor_table = factor_table
+        self.chunk_rows = chunk_rows
+        self.n_instruments = 0
+        self._report: Optional[pd.DataFrame] = None
 
-        if csv_path:
-            assert os.path.isdir(csv_path), f"{csv_path} should be a directory."
-            files = [f for f in os.listdir(csv_path) if f.endswith(".csv")]
-            for filename in tqdm(files, desc="Loading data"):
-                df = pd.read_csv(os.path.join(csv_path, filename))
-                self.data[filename] = df
-
-        elif qlib_dir:
-            qlib.init(provider_uri=qlib_dir)
-            self.load_qlib_data()
-
-    def load_qlib_data(self):
-        instruments = D.instruments(market="all")
-        instrument_list = D.list_instruments(instruments=instruments, as_list=True, freq=self.freq)
-        required_fields = ["$open", "$close", "$low", "$high", "$volume", "$factor"]
-        for instrument in instrument_list:
-            df = D.features([instrument], required_fields, freq=self.freq)
-            df.rename(
-                columns={
-                    "$open": "open",
-                    "$close": "close",
-                    "$low": "low",
-                    "$high": "high",
-                    "$volume": "volume",
-                    "$factor": "factor",
-                },
-                inplace=True,
+    def iter_chunks(self) -> Iterator[Chunk]:
+        if self.csv_path:
+            return self._iter_csv_chunks()
+        if self.qlib_dir:
+            return self._iter_qlib_chunks()
+        return self._iter_duckdb_chunks()
+
+    def _iter_csv_chunks(self) -> Iterator[Chunk]:
+        """Read csv files one at a time, keeping only the checked columns, until ``chunk_rows`` rows."""
+        files = sorted(f for f in os.listdir(self.csv_path) if f.endswith(".csv"))
+        wanted = set(REQUIRED_COLUMNS + [FACTOR_COLUMN, "date"])
+        frames, missing_columns, n_rows = [], {}, 0
+        for filename in tqdm(files, desc="Loading data"):
+            df = pd.read_csv(os.path.join(self.csv_path, filename), usecols=lambda c: c in wanted)
+            missing_columns[filename] = [c for c in REQUIRED_COLUMNS + [FACTOR_COLUMN] if c not in df.columns]
+            frames.append(df.assign(instrument=filename))
+            n_rows += len(df)
+            if n_rows >= self.chunk_rows:
+                yield Chunk(pd.concat(frames, ignore_index=True), missing_columns)
+                frames, missing_columns, n_rows = [], {}, 0
+        if frames:
+            yield Chunk(pd.concat(frames, ignore_index=True), missing_columns)
+
+    def _iter_qlib_chunks(self) -> Iterator[Chunk]:
+        from bin_reader import QlibBinReader
+
+        reader = QlibBinReader(self.qlib_dir, self.freq)
+        symbols = reader.symbols()
+        per_chunk = max(1, self.chunk_rows // max(1, len(reader.calendar)))
+        for i in tqdm(range(0, len(symbols), per_chunk), desc="Loading data"):
+            chunk_symbols = symbols[i : i + per_chunk]
+            # missing .bin files are filled with NaN per instrument and reported through missing_columns
+            df = reader.panel(REQUIRED_COLUMNS + [FACTOR_COLUMN], chunk_symbols).to_frame().reset_index()
+            df = df.rename(columns={"datetime": "date"})
+            missing_columns = {
+                s: [c for c in REQUIRED_COLUMNS + [FACTOR_COLUMN] if not reader.bin_path(s, c).exists()]
+                for s in chunk_symbols
+            }
+            yield Chunk(df, missing_columns)
+
+    def _iter_duckdb_chunks(self) -> Iterator[Chunk]:
+        """Stream ``data_table`` joined with ``factor_table`` ordered by (symbol, date)."""
+        import duckdb
+
+        conn = duckdb.connect(os.path.expanduser(self.db_path), read_only=True)
+        try:
+            reader = conn.execute(
+                f"""
+                SELECT d.symbol AS instrument, d.date, {", ".join(f"d.{c}" for c in REQUIRED_COLUMNS)},
+                    f.{FACTOR_COLUMN}
+                FROM {self.data_table} d
+                LEFT JOIN {self.factor_table} f ON f.symbol = d.symbol AND f.date = d.date
+                ORDER BY d.symbol, d.date
+                """
+            ).fetch_record_batch(self.chunk_rows)
+            pending = None
+            for batch in reader:
+                df = batch.to_pandas()
+                if pending is not None:
+                    df = pd.concat([pending, df], ignore_index=True)
+                if df.empty:
+                    continue
+                # the last instrument may continue in the next batch
+                last = df["instrument"].iloc[-1]
+                is_last = (df["instrument"] == last).to_numpy()
+                pending = df[is_last]
+                if not is_last.all():
+                    yield Chunk(df[~is_last].reset_index(drop=True), {})
+            if pending is not None and not pending.empty:
+                yield Chunk(pending.reset_index(drop=True), {})
+        finally:
+            conn.close()
+
+    def _missing_data(self, chunk: Chunk) -> pd.DataFrame:
+        starts = chunk.offsets[:-1]
+        counts = {c: np.add.reduceat(np.isnan(chunk.columns[c]), starts) for c in REQUIRED_COLUMNS}
+        stacked = np.column_stack([counts[c] for c in REQUIRED_COLUMNS])
+        rows, cols = np.nonzero(stacked > self.missing_data_num)
+        return pd.DataFrame(
+            {
+                "instrument": np.asarray(chunk.symbols, dtype=object)[rows],
+                "problem": "missing_data",
+                "column": np.asarray(REQUIRED_COLUMNS, dtype=object)[cols],
+                "count": stacked[rows, cols],
+            }
+        )
+
+    def _large_step_changes(self, chunk: Chunk) -> pd.DataFrame:
+        segment = chunk.segment_ids()
+        symbols = np.asarray(chunk.symbols, dtype=object)
+        frames = []
+        for col in REQUIRED_COLUMNS:
+            x = chunk.columns[col]
+            threshold = self.large_step_threshold_volume if col == "volume" else self.large_step_threshold_price
+            with np.errstate(divide="ignore", invalid="ignore"):
+                pct_change = np.abs(x[1:] / x[:-1] - 1)
+            # the first row of every instrument has no previous value
+            pct_change = np.concatenate(([np.nan], pct_change))
+            pct_change[chunk.offsets[:-1]] = np.nan
+            exceed = np.flatnonzero(pct_change > threshold)
+            if len(exceed) == 0:
+                continue
+            ids, first = np.unique(segment[exceed], return_index=True)
+            largest = np.fmax.reduceat(np.nan_to_num(pct_change, nan=-np.inf), chunk.offsets[:-1])
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "instrument": symbols[ids],
+                        "problem": "large_step",
+                        "column": col,
+                        "count": np.bincount(segment[exceed])[ids],
+                        "date": chunk.dates[exceed[first]],
+                        "value": largest[ids],
+                    }
+                )
             )
-            self.data[instrument] = df
-        print(df)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=REPORT_COLUMNS)
+
+    def _missing_columns(self, chunk: Chunk) -> pd.DataFrame:
+        rows = [
+            (symbol, col)
+            for symbol, cols in chunk.missing_columns.items()
+            for col in cols
+            if col in REQUIRED_COLUMNS
+        ]
+        return pd.DataFrame(
+            {
+                "instrument": [r[0] for r in rows],
+                "problem": "missing_column",
+                "column": [r[1] for r in rows],
+            }
+        )
+
+    def _missing_factor(self, chunk: Chunk) -> pd.DataFrame:
+        present = np.add.reduceat(~np.isnan(chunk.columns[FACTOR_COLUMN]), chunk.offsets[:-1])
+        symbols = np.asarray(chunk.symbols, dtype=object)
+        exempt = np.array([any(code in s for code in FACTOR_EXEMPT) for s in chunk.symbols], dtype=bool)
+        ids = np.flatnonzero((present == 0) & ~exempt)
+        return pd.DataFrame(
+            {
+                "instrument": symbols[ids],
+                "problem": [
+                    "missing_factor_col"
+                    if FACTOR_COLUMN in chunk.missing_columns.get(s, [])
+                    else "missing_factor_data"
+                    for s in symbols[ids]
+                ],
+                "column": FACTOR_COLUMN,
+            }
+        )
+
+    def report(self) -> pd.DataFrame:
+        """Run every check in one pass over the data and return a single report table."""
+        if self._report is None:
+            frames = []
+            self.n_instruments = 0
+            checks = (self._missing_columns, self._missing_data, self._large_step_changes, self._missing_factor)
+            for chunk in self.iter_chunks():
+                self.n_instruments += len(chunk.symbols)
+                for check in checks:
+                    frame = check(chunk)
+                    if not frame.empty:
+                        frames.append(frame)
+            report = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=REPORT_COLUMNS)
+            report = report.reindex(columns=REPORT_COLUMNS).astype({"count": "Int64"})
+            self._report = report.set_index("instrument")
+        return self._report
+
+    def _problems(self, *problems: str) -> Optional[pd.DataFrame]:
+        report = self.report()
+        result = report[report["problem"].isin(problems)].dropna(axis=1, how="all")
+        return result if not result.empty else None
 
     def check_missing_data(self) -> Optional[pd.DataFrame]:
         """Check if any data is missing in the DataFrame."""
-        result_dict = {
-            "instruments": [],
-            "open": [],
-            "high": [],
-            "low": [],
-            "close": [],
-            "volume": [],
-        }
-        for filename, df in self.data.items():
-            missing_data_columns = df.isnull().sum()[df.isnull().sum() > self.missing_data_num].index.tolist()
-            if len(missing_data_columns) > 0:
-                result_dict["instruments"].append(filename)
-                result_dict["open"].append(df.isnull().sum()["open"])
-                result_dict["high"].append(df.isnull().sum()["high"])
-                result_dict["low"].append(df.isnull().sum()["low"])
-                result_dict["close"].append(df.isnull().sum()["close"])
-                result_dict["volume"].append(df.isnull().sum()["volume"])
-
-        result_df = pd.DataFrame(result_dict).set_index("instruments")
-        if not result_df.empty:
-            return result_df
-        else:
+        result = self._problems("missing_data")
+        if result is None:
             logger.info(f"✅ There are no missing data.")
-            return None
+        return result
 
     def check_large_step_changes(self) -> Optional[pd.DataFrame]:
         """Check if there are any large step changes above the threshold in the OHLCV columns."""
-        result_dict = {
-            "instruments": [],
-            "col_name": [],
-            "date": [],
-            "pct_change": [],
-        }
-        for filename, df in self.data.items():
-            affected_columns = []
-            for col in ["open", "high", "low", "close", "volume"]:
-                if col in df.columns:
-                    pct_change = df[col].pct_change(fill_method=None).abs()
-                    threshold = self.large_step_threshold_volume if col == "volume" else self.large_step_threshold_price
-                    if pct_change.max() > threshold:
-                        large_steps = pct_change[pct_change > threshold]
-                        result_dict["instruments"].append(filename)
-                        result_dict["col_name"].append(col)
-                        result_dict["date"].append(large_steps.index.to_list()[0][1].strftime("%Y-%m-%d"))
-                        result_dict["pct_change"].append(pct_change.max())
-                        affected_columns.append(col)
-
-        result_df = pd.DataFrame(result_dict).set_index("instruments")
-        if not result_df.empty:
-            return result_df
-        else:
+        result = self._problems("large_step")
+        if result is None:
             logger.info(f"✅ There are no large step changes in the OHLCV column above the threshold.")
-            return None
+        return result
 
     def check_required_columns(self) -> Optional[pd.DataFrame]:
         """Check if any of the required columns (OLHCV) are missing in the DataFrame."""
-        required_columns = ["open", "high", "low", "close", "volume"]
-        result_dict = {
-            "instruments": [],
-            "missing_col": [],
-        }
-        for filename, df in self.data.items():
-            if not all(column in df.columns for column in required_columns):
-                missing_required_columns = [column for column in required_columns if column not in df.columns]
-                result_dict["instruments"].append(filename)
-                result_dict["missing_col"] += missing_required_columns
-
-        result_df = pd.DataFrame(result_dict).set_index("instruments")
-        if not result_df.empty:
-            return result_df
-        else:
+        result = self._problems("missing_column")
+        if result is None:
             logger.info(f"✅ The columns (OLHCV) are complete and not missing.")
-            return None
+        return result
 
     def check_missing_factor(self) -> Optional[pd.DataFrame]:
         """Check if the 'factor' column is missing in the DataFrame."""
-        result_dict = {
-            "instruments": [],
-            "missing_factor_col": [],
-            "missing_factor_data": [],
-        }
-        for filename, df in self.data.items():
-            if "000300" in filename or "000903" in filename or "000905" in filename:
-                continue
-            if "factor" not in df.columns:
-                result_dict["instruments"].append(filename)
-                result_dict["missing_factor_col"].append(True)
-            if df["factor"].isnull().all():
-                if filename in result_dict["instruments"]:
-                    result_dict["missing_factor_data"].append(True)
-                else:
-                    result_dict["instruments"].append(filename)
-                    result_dict["missing_factor_col"].append(False)
-                    result_dict["missing_factor_data"].append(True)
-
-        result_df = pd.DataFrame(result_dict).set_index("instruments")
-        if not result_df.empty:
-            return result_df
-        else:
+        result = self._problems("missing_factor_col", "missing_factor_data")
+        if result is None:
             logger.info(f"✅ The `factor` column already exists and is not empty.")
-            return None
+        return result
 
     def check_data(self):
-        check_missing_data_result = self.check_missing_data()
-        check_large_step_changes_result = self.check_large_step_changes()
-        check_required_columns_result = self.check_required_columns()
-        check_missing_factor_result = self.check_missing_factor()
-        if (
-            check_large_step_changes_result is not None
-            or check_large_step_changes_result is not None
-            or check_required_columns_result is not None
-            or check_missing_factor_result is not None
-        ):
-            print(f"\nSummary of data health check ({len(self.data)} files checked):")
+        results = [
+            ("There is missing data.", self.check_missing_data()),
+            ("The OHLCV column has large step changes.", self.check_large_step_changes()),
+            ("Columns (OLHCV) are missing.", self.check_required_columns()),
+            ("The factor column does not exist or is empty", self.check_missing_factor()),
+        ]
+        if any(result is not None for _, result in results):
+            print(f"\nSummary of data health check ({self.n_instruments} instruments checked):")
             print("-------------------------------------------------")
-            if isinstance(check_missing_data_result, pd.DataFrame):
-                logger.warning(f"There is missing data.")
-                print(check_missing_data_result)
-            if isinstance(check_large_step_changes_result, pd.DataFrame):
-                logger.warning(f"The OHLCV column has large step changes.")
-                print(check_large_step_changes_result)
-            if isinstance(check_required_columns_result, pd.DataFrame):
-                logger.warning(f"Columns (OLHCV) are missing.")
-                print(check_required_columns_result)
-            if isinstance(check_missing_factor_result, pd.DataFrame):
-                logger.warning(f"The factor column does not exist or is empty")
-                print(check_missing_factor_result)
+            for message, result in results:
+                if result is not None:
+                    logger.warning(message)
+                    print(result)
 
 
 if __name__ == "__main__":
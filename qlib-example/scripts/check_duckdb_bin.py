@@ -0,0 +1,255 @@
+"""
+校验 Qlib .bin 与 DuckDB 源数据是否一致，替代 check_dump_bin.py。
+
+check_dump_bin.py 每只股票要调一次 D.features、读一次 CSV、reindex 后再跑一遍
+datacompy.Compare，校验比生成还慢。这里按 (symbol, date) 流式读取 DuckDB，用
+dump_duckdb 相同的方式对齐到交易日历，再与 memmap 读出的 .bin 直接做 np.isclose，
+只报告不一致的 股票 / 字段 / 日期区间。
+
+每只股票校验通过后记录两份指纹：DuckDB 中该股票所有行的哈希，以及各 .bin 的
+大小和修改时间。下次运行时两者都没变的股票直接跳过，日常只需校验当天更新过的股票。
+
+用法：
+    python check_duckdb_bin.py check --db_path tdx.db --qlib_dir ~/.qlib/qlib_data/cn_data
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+import fire
+import numpy as np
+import pandas as pd
+from qlib.utils import fname_to_code
+
+from bin_reader import read_bin
+from dump_duckdb import (
+    DATA_FIELDS,
+    DATA_TABLE,
+    FACTOR_FIELDS,
+    FACTOR_TABLE,
+    FEATURES_DIR_NAME,
+    _parse_fields,
+    align_to_calendar,
+    bin_path,
+    feature_dir,
+    iter_symbols,
+    load_calendar,
+)
+
+STATE_FILE_NAME = ".check_duckdb_bin.json"
+RESULT_COLUMNS = ["symbol", "field", "start_date", "end_date", "days", "reason"]
+
+
+def source_fingerprints(
+    conn: duckdb.DuckDBPyConnection, table: str, fields: Sequence[str]
+) -> Dict[str, str]:
+    """
+    每只股票所有行的指纹：行数和逐行哈希的异或，一条聚合查询算完。
+
+    多列 HASH 按列线性组合，同一列在偶数行上的相同变化（如整段复权因子乘以
+    同一个数）会在异或中抵消，所以再套一层 HASH 打散。
+    """
+    columns = ", ".join(("date",) + tuple(fields))
+    rows = conn.execute(
+        f"""
+        SELECT symbol, COUNT(*) || ':' || BIT_XOR(HASH(HASH({columns})))
+        FROM {table}
+        GROUP BY symbol
+        """
+    ).fetchall()
+    return {symbol: fingerprint for symbol, fingerprint in rows}
+
+
+def bin_fingerprint(features_dir: Path, fields: Sequence[str], freq: str) -> List:
+    """各字段 .bin 的 (大小, 修改时间)，文件不存在为 None"""
+    result = []
+    for field in fields:
+        path = bin_path(features_dir, field, freq)
+        if path.exists():
+            stat = path.stat()
+            result.append([stat.st_size, stat.st_mtime_ns])
+        else:
+            result.append(None)
+    return result
+
+
+def mismatch_ranges(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """布尔数组中连续为 True 的区间 [begin, end)"""
+    if not mask.any():
+        return []
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def compare_symbol(
+    start: int,
+    expected: Dict[str, np.ndarray],
+    features_dir: Path,
+    freq: str,
+    rtol: float,
+    atol: float,
+) -> List[Tuple[str, int, int, str]]:
+    """
+    比较一只股票对齐后的源数据和 .bin，返回不一致的 (字段, 起始下标, 结束下标, 原因)。
+
+    两边覆盖的日期不同时，在并集上比较，只有一边有值的日期也算不一致。
+    """
+    problems = []
+    for field, source in expected.items():
+        path = bin_path(features_dir, field, freq)
+        if not path.exists():
+            problems.append((field, start, start + len(source), "missing bin"))
+            continue
+        bin_start, values = read_bin(path)
+        begin = min(start, bin_start)
+        end = max(start + len(source), bin_start + len(values))
+        a = np.full(end - begin, np.nan, dtype="<f")
+        b = np.full(end - begin, np.nan, dtype="<f")
+        a[start - begin : start - begin + len(source)] = source
+        b[bin_start - begin : bin_start - begin + len(values)] = values
+        mismatch = ~np.isclose(a, b, rtol=rtol, atol=atol, equal_nan=True)
+        for lo, hi in mismatch_ranges(mismatch):
+            problems.append((field, begin + lo, begin + hi, "value"))
+    return problems
+
+
+def _load_state(path: Path) -> Dict[str, dict]:
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(path: Path, state: Dict[str, dict]):
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _check_table(
+    conn: duckdb.DuckDBPyConnection,
+    qlib_path: Path,
+    calendar: np.ndarray,
+    table: str,
+    fields: Sequence[str],
+    freq: str,
+    state: Dict[str, dict],
+    full: bool,
+    rtol: float,
+    atol: float,
+    batch_rows: int,
+) -> List[tuple]:
+    """校验一张表，返回不一致的记录，并更新 state 中校验通过的股票"""
+    fingerprints = source_fingerprints(conn, table, fields)
+    todo = []
+    for symbol, fingerprint in fingerprints.items():
+        saved = state.get(symbol, {}).get(table)
+        bins = bin_fingerprint(feature_dir(qlib_path, symbol), fields, freq)
+        if full or saved != [fingerprint, bins]:
+            todo.append(symbol)
+    print(f"{table}: {len(fingerprints)} 只股票，{len(todo)} 只需要校验")
+
+    results = []
+    if todo:
+        query = f"""
+            SELECT symbol, date, {", ".join(fields)}
+            FROM {table}
+            WHERE symbol IN (SELECT UNNEST(?))
+            ORDER BY symbol, date
+        """
+        for symbol, dates, values in iter_symbols(
+            conn, query, [todo], fields=fields, batch_rows=batch_rows
+        ):
+            features_dir = feature_dir(qlib_path, symbol)
+            start, expected = align_to_calendar(calendar, dates, values)
+            if start < 0:
+                continue
+            problems = compare_symbol(start, expected, features_dir, freq, rtol, atol)
+            for field, lo, hi, reason in problems:
+                results.append(
+                    (symbol, field, calendar[lo], calendar[hi - 1], hi - lo, reason)
+                )
+            entry = state.setdefault(symbol, {})
+            if problems:
+                entry.pop(table, None)
+            else:
+                entry[table] = [
+                    fingerprints[symbol],
+                    bin_fingerprint(features_dir, fields, freq),
+                ]
+
+    # .bin 中有、源数据中已经没有的股票
+    features = qlib_path.joinpath(FEATURES_DIR_NAME)
+    for features_dir in sorted(features.iterdir()):
+        symbol = fname_to_code(features_dir.name)
+        if symbol in fingerprints:
+            continue
+        for field in fields:
+            if bin_path(features_dir, field, freq).exists():
+                results.append((symbol, field, None, None, 0, "not in source"))
+                state.get(symbol, {}).pop(table, None)
+    return results
+
+
+def check(
+    db_path: str,
+    qlib_dir: str,
+    data_fields=DATA_FIELDS,
+    factor_fields=FACTOR_FIELDS,
+    data_table: str = DATA_TABLE,
+    factor_table: str = FACTOR_TABLE,
+    freq: str = "day",
+    full: bool = False,
+    state_file: Optional[str] = None,
+    rtol: float = 1e-5,
+    atol: float = 1e-8,
+    batch_rows: int = 1_000_000,
+) -> pd.DataFrame:
+    """
+    校验 qlib_dir 中的 .bin 与 DuckDB 是否一致，返回不一致的区间。
+
+    :param full: 忽略上次的校验记录，全部重新校验
+    :param state_file: 校验记录保存的位置，默认在 qlib_dir 下
+    """
+    qlib_path = Path(qlib_dir).expanduser()
+    state_path = Path(state_file) if state_file else qlib_path.joinpath(STATE_FILE_NAME)
+    state = _load_state(state_path)
+    calendar = load_calendar(qlib_path, freq)
+
+    results = []
+    conn = duckdb.connect(str(Path(db_path).expanduser()), read_only=True)
+    try:
+        for table, fields in (
+            (data_table, _parse_fields(data_fields)),
+            (factor_table, _parse_fields(factor_fields)),
+        ):
+            if fields:
+                results += _check_table(
+                    conn, qlib_path, calendar, table, fields, freq, state, full,
+                    rtol, atol, batch_rows,
+                )  # fmt: skip
+    finally:
+        conn.close()
+
+    _save_state(state_path, {k: v for k, v in state.items() if v})
+    df = pd.DataFrame(results, columns=RESULT_COLUMNS)
+    if df.empty:
+        print("✅ .bin 与 DuckDB 数据一致")
+    else:
+        print(f"❌ {df['symbol'].nunique()} 只股票有 {len(df)} 处不一致:")
+        print(df.to_string(index=False))
+    return df
+
+
+def _check_cli(**kwargs):
+    """命令行入口，有不一致时以非零状态退出"""
+    if not check(**kwargs).empty:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    fire.Fire({"check": _check_cli})
@@ -0,0 +1,506 @@
+"""
+直接从 DuckDB 生成 Qlib 的 .bin 数据，不经过 CSV。
+
+export_for_qlib + dump_bin.py 的流程是 DuckDB → 大 CSV → awk 拆成每只股票一个
+CSV → pandas 逐个解析 → .bin，整段历史要在文本格式里来回三遍。这里按
+(symbol, date) 顺序用 Arrow 流式读取 raw_stocks_daily / raw_adjust_factor，
+每凑齐一只股票就用 NumPy 对齐交易日历并写出，不产生任何中间文件。
+
+输出与 dump_bin.py dump_all 完全一致：
+    calendars/day.txt                交易日历，每行一个日期
+    instruments/all.txt              SYMBOL<TAB>开始日期<TAB>结束日期
+    features/<symbol>/<field>.day.bin  little-endian float32，
+                                       第一个数是起始日期在日历中的下标，其后为逐日数值
+
+dump_update 读取 instruments/all.txt 中每只股票的结束日期作为水位线，只向 DuckDB
+查询水位线之后的行，直接追加到已有 .bin 的末尾，内存占用只与单只股票的新增行数有关。
+复权因子只重写历史确实变化了的股票（水位线之后有除权除息，或水位线当天的因子
+与 factor.day.bin 最后一个值不同），其余股票同样只追加。
+
+用法：
+    python dump_duckdb.py dump_all --db_path tdx.db --qlib_dir ~/.qlib/qlib_data/cn_data
+    python dump_duckdb.py dump_update --db_path tdx.db --qlib_dir ~/.qlib/qlib_data/cn_data
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import duckdb
+import fire
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from qlib.utils import code_to_fname, fname_to_code
+
+DATA_TABLE = "raw_stocks_daily"
+FACTOR_TABLE = "raw_adjust_factor"
+DATA_FIELDS = ("open", "close", "high", "low", "volume", "amount", "turnover")
+FACTOR_FIELDS = ("factor",)
+XDXR_TABLE = "v_xdxr"
+
+CALENDARS_DIR_NAME = "calendars"
+FEATURES_DIR_NAME = "features"
+INSTRUMENTS_DIR_NAME = "instruments"
+INSTRUMENTS_FILE_NAME = "all.txt"
+INSTRUMENTS_SEP = "\t"
+DAILY_FORMAT = "%Y-%m-%d"
+
+SymbolData = Tuple[str, np.ndarray, Dict[str, np.ndarray]]
+
+
+def _parse_fields(fields) -> Tuple[str, ...]:
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return tuple(f.strip() for f in fields if f.strip())
+
+
+def iter_symbols(
+    conn: duckdb.DuckDBPyConnection,
+    query: str,
+    params: Sequence = (),
+    fields: Sequence[str] = DATA_FIELDS,
+    batch_rows: int = 1_000_000,
+) -> Iterator[SymbolData]:
+    """
+    流式执行按 (symbol, date) 排序的查询，逐只股票返回 (symbol, dates, {field: values})。
+
+    内存中只保留当前批次和跨批次的最后一只股票。
+    """
+    reader = conn.execute(query, list(params)).fetch_record_batch(batch_rows)
+    pending = None
+    for batch in reader:
+        table = pa.Table.from_batches([batch])
+        if pending is not None:
+            table = pa.concat_tables([pending, table])
+        if table.num_rows == 0:
+            continue
+        symbols = table.column("symbol").to_numpy(zero_copy_only=False)
+        bounds = np.concatenate(
+            ([0], np.flatnonzero(symbols[1:] != symbols[:-1]) + 1, [len(symbols)])
+        )
+        # 最后一只股票可能还没读完，留到下一批
+        for start, end in zip(bounds[:-2], bounds[1:-1]):
+            yield _symbol_data(table.slice(start, end - start), symbols[start], fields)
+        pending = table.slice(bounds[-2])
+    if pending is not None and pending.num_rows:
+        symbol = pending.column("symbol")[0].as_py()
+        yield _symbol_data(pending, symbol, fields)
+
+
+def _symbol_data(table: pa.Table, symbol: str, fields: Sequence[str]) -> SymbolData:
+    dates = table.column("date").to_numpy().astype("datetime64[D]")
+    values = {
+        f: table.column(f).to_numpy(zero_copy_only=False)
+        for f in fields
+        if f in table.column_names
+    }
+    return str(symbol), dates, values
+
+
+def feature_dir(qlib_dir: Path, symbol: str) -> Path:
+    code = fname_to_code(symbol.lower())
+    return qlib_dir.joinpath(FEATURES_DIR_NAME, code_to_fname(code).lower())
+
+
+def bin_path(features_dir: Path, field: str, freq: str = "day") -> Path:
+    return features_dir.joinpath(f"{field.lower()}.{freq}.bin")
+
+
+def align_to_calendar(
+    calendar: np.ndarray, dates: np.ndarray, values: Dict[str, np.ndarray]
+) -> Tuple[int, Dict[str, np.ndarray]]:
+    """
+    把一只股票的数据对齐到日历上 [首个日期, 最后日期] 区间，缺失的交易日为 NaN。
+
+    与 dump_bin.py 相同：重复日期保留第一行，不在日历中的日期丢弃。
+    返回 (起始日期在日历中的下标, {field: float32 数组})。
+    """
+    _, first = np.unique(dates, return_index=True)
+    first.sort()
+    dates = dates[first]
+    idx = np.searchsorted(calendar, dates)
+    in_calendar = (idx < len(calendar)) & (
+        calendar[np.minimum(idx, len(calendar) - 1)] == dates
+    )
+    idx, first = idx[in_calendar], first[in_calendar]
+    if len(idx) == 0:
+        return -1, {}
+
+    start = int(idx.min())
+    length = int(idx.max()) - start + 1
+    aligned = {}
+    for field, v in values.items():
+        out = np.full(length, np.nan, dtype="<f")
+        out[idx - start] = np.asarray(v, dtype=np.float64)[first]
+        aligned[field] = out
+    return start, aligned
+
+
+def write_bins(
+    features_dir: Path,
+    calendar: np.ndarray,
+    dates: np.ndarray,
+    values: Dict[str, np.ndarray],
+    freq: str = "day",
+) -> bool:
+    """整只股票重写各字段的 .bin，没有可写的数据返回 False"""
+    start, aligned = align_to_calendar(calendar, dates, values)
+    if start < 0:
+        return False
+    features_dir.mkdir(parents=True, exist_ok=True)
+    for field, data in aligned.items():
+        with bin_path(features_dir, field, freq).open("wb") as fp:
+            np.array([start], dtype="<f").tofile(fp)
+            data.tofile(fp)
+    return True
+
+
+def bin_tail(path: Path) -> Tuple[int, float]:
+    """.bin 最后一个值在日历中的下标和该值，只读文件头和最后 4 个字节"""
+    n_values = path.stat().st_size // 4 - 1
+    with path.open("rb") as fp:
+        start = int(np.fromfile(fp, dtype="<f", count=1)[0])
+        if n_values <= 0:
+            return start - 1, np.nan
+        fp.seek(-4, os.SEEK_END)
+        last = float(np.fromfile(fp, dtype="<f", count=1)[0])
+    return start + n_values - 1, last
+
+
+def append_bins(
+    features_dir: Path,
+    calendar: np.ndarray,
+    dates: np.ndarray,
+    values: Dict[str, np.ndarray],
+    freq: str = "day",
+) -> bool:
+    """
+    把新数据追加到已有 .bin 的末尾。
+
+    文件末尾之后、新数据之前的交易日（停牌）补 NaN，结果与全量 dump_all 一致；
+    已经写过的日期跳过，还没有 .bin 的字段整体写入。
+    """
+    start, aligned = align_to_calendar(calendar, dates, values)
+    if start < 0:
+        return False
+    features_dir.mkdir(parents=True, exist_ok=True)
+    for field, data in aligned.items():
+        path = bin_path(features_dir, field, freq)
+        if not path.exists():
+            with path.open("wb") as fp:
+                np.array([start], dtype="<f").tofile(fp)
+                data.tofile(fp)
+            continue
+
+        next_index = bin_tail(path)[0] + 1
+        if start >= next_index:
+            data = np.concatenate(
+                [np.full(start - next_index, np.nan, dtype="<f"), data]
+            )
+        else:
+            data = data[next_index - start :]
+        if len(data):
+            with path.open("ab") as fp:
+                data.tofile(fp)
+    return True
+
+
+def save_calendar(qlib_dir: Path, calendar: np.ndarray, freq: str = "day"):
+    path = qlib_dir.joinpath(CALENDARS_DIR_NAME)
+    path.mkdir(parents=True, exist_ok=True)
+    lines = np.datetime_as_string(calendar, unit="D")
+    np.savetxt(path.joinpath(f"{freq}.txt"), lines, fmt="%s", encoding="utf-8")
+
+
+def save_instruments(qlib_dir: Path, instruments: Dict[str, Tuple[str, str]]):
+    path = qlib_dir.joinpath(INSTRUMENTS_DIR_NAME)
+    path.mkdir(parents=True, exist_ok=True)
+    lines = [
+        INSTRUMENTS_SEP.join((symbol, start, end))
+        for symbol, (start, end) in instruments.items()
+    ]
+    np.savetxt(
+        path.joinpath(INSTRUMENTS_FILE_NAME), lines, fmt="%s", encoding="utf-8"
+    )
+
+
+def load_calendar(qlib_dir: Path, freq: str = "day") -> np.ndarray:
+    path = qlib_dir.joinpath(CALENDARS_DIR_NAME, f"{freq}.txt")
+    return np.loadtxt(path, dtype="datetime64[D]", ndmin=1)
+
+
+def load_instruments(qlib_dir: Path) -> Dict[str, Tuple[str, str]]:
+    path = qlib_dir.joinpath(INSTRUMENTS_DIR_NAME, INSTRUMENTS_FILE_NAME)
+    instruments = {}
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split(INSTRUMENTS_SEP)
+            if len(parts) == 3:
+                instruments[parts[0]] = (parts[1], parts[2])
+    return instruments
+
+
+def _instrument_name(symbol: str) -> str:
+    return fname_to_code(symbol.lower()).upper()
+
+
+def _date_str(date: np.datetime64) -> str:
+    return str(np.datetime64(date, "D"))
+
+
+def read_calendar(conn: duckdb.DuckDBPyConnection, table: str) -> np.ndarray:
+    rows = conn.execute(f"SELECT DISTINCT date FROM {table} ORDER BY date")
+    return rows.fetch_arrow_table().column("date").to_numpy().astype("datetime64[D]")
+
+
+def _dump_table(
+    conn: duckdb.DuckDBPyConnection,
+    qlib_path: Path,
+    calendar: np.ndarray,
+    table: str,
+    fields: Sequence[str],
+    freq: str,
+    batch_rows: int,
+    instruments: Optional[Dict[str, Tuple[str, str]]] = None,
+    watermarks: Optional[pa.Table] = None,
+):
+    """
+    把 table 中的 fields 写成 .bin。
+
+    watermarks 为 None 时全量重写；否则是 (symbol, end_date) 表，只查询每只股票
+    end_date 之后的行追加到已有文件，不在表中的股票视为新股全量写入。
+    instruments 不为 None 时同时更新其中的起止日期。
+    """
+    columns = ", ".join(f"d.{f}" for f in fields)
+    if watermarks is None:
+        query = f"SELECT d.symbol, d.date, {columns} FROM {table} d"
+    else:
+        conn.register("qlib_watermarks", watermarks)
+        query = f"""
+            SELECT d.symbol, d.date, {columns}
+            FROM {table} d
+            LEFT JOIN qlib_watermarks w ON d.symbol = w.symbol
+            WHERE w.symbol IS NULL OR d.date > w.end_date
+        """
+    known = set() if watermarks is None else set(watermarks["symbol"].to_pylist())
+
+    n_written = n_appended = 0
+    for symbol, dates, values in iter_symbols(
+        conn, query + " ORDER BY d.symbol, d.date", fields=fields, batch_rows=batch_rows
+    ):
+        features_dir = feature_dir(qlib_path, symbol)
+        if symbol in known:
+            done = append_bins(features_dir, calendar, dates, values, freq)
+            n_appended += done
+        else:
+            done = write_bins(features_dir, calendar, dates, values, freq)
+            n_written += done
+        if done and instruments is not None:
+            name = _instrument_name(symbol)
+            start = instruments[name][0] if name in instruments else dates.min()
+            instruments[name] = (_date_str(start), _date_str(dates.max()))
+
+    if watermarks is not None:
+        conn.unregister("qlib_watermarks")
+        print(f"✅ {table}: {n_appended} 只股票追加，{n_written} 只股票整体写入")
+    else:
+        print(f"✅ {table}: {n_written} 只股票写入 {', '.join(fields)}")
+
+
+def bin_watermarks(
+    qlib_path: Path, calendar: np.ndarray, field: str, freq: str = "day"
+) -> pa.Table:
+    """
+    已有 <field>.bin 的水位线：(symbol, end_date, last_value)。
+
+    calendar 必须以生成这些文件时的日历为前缀。
+    """
+    symbols, end_dates, last_values = [], [], []
+    features = qlib_path.joinpath(FEATURES_DIR_NAME)
+    for features_dir in sorted(features.iterdir()) if features.exists() else ():
+        path = bin_path(features_dir, field, freq)
+        if not path.exists():
+            continue
+        end, last = bin_tail(path)
+        if end < 0:
+            continue
+        symbols.append(fname_to_code(features_dir.name).lower())
+        end_dates.append(calendar[end])
+        last_values.append(last)
+    return pa.table(
+        {
+            "symbol": pa.array(symbols, pa.string()),
+            "end_date": pa.array(np.array(end_dates, dtype="datetime64[D]")),
+            "last_value": pa.array(np.array(last_values, dtype="<f")),
+        }
+    )
+
+
+def changed_factor_symbols(
+    conn: duckdb.DuckDBPyConnection,
+    watermarks: pa.Table,
+    factor_table: str,
+    field: str,
+    xdxr_table: str,
+    end_date: str,
+) -> List[str]:
+    """
+    复权因子历史发生变化、需要整体重写的股票：
+
+    - 水位线之后到 end_date 之间有除权除息记录
+    - 水位线当天 DuckDB 中的因子与 .bin 最后一个值不一致（或已不存在），
+      覆盖 tdx2db 重新计算了历史因子的情况
+    """
+    conn.register("qlib_factor_watermarks", watermarks)
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT w.symbol
+            FROM qlib_factor_watermarks w
+            LEFT JOIN {factor_table} f ON f.symbol = w.symbol AND f.date = w.end_date
+            WHERE f.{field}::FLOAT IS DISTINCT FROM w.last_value
+            UNION
+            SELECT w.symbol
+            FROM qlib_factor_watermarks w
+            JOIN {xdxr_table} x ON x.code = substr(w.symbol, 3)
+            WHERE x.date > w.end_date AND x.date <= ?
+            ORDER BY symbol
+            """,
+            [end_date],
+        ).fetchall()
+    finally:
+        conn.unregister("qlib_factor_watermarks")
+    return [row[0] for row in rows]
+
+
+def dump_all(
+    db_path: str,
+    qlib_dir: str,
+    data_fields=DATA_FIELDS,
+    factor_fields=FACTOR_FIELDS,
+    data_table: str = DATA_TABLE,
+    factor_table: str = FACTOR_TABLE,
+    freq: str = "day",
+    batch_rows: int = 1_000_000,
+):
+    """
+    全量生成 Qlib 数据目录，等价于 qlib_dump.sh init。
+
+    日历取 data_table 中出现过的全部日期，复权因子对齐到同一日历。
+    """
+    qlib_path = Path(qlib_dir).expanduser()
+    data_fields = _parse_fields(data_fields)
+    factor_fields = _parse_fields(factor_fields)
+    conn = duckdb.connect(str(Path(db_path).expanduser()), read_only=True)
+    try:
+        calendar = read_calendar(conn, data_table)
+        print(f"交易日历 {len(calendar)} 天: {calendar[0]} - {calendar[-1]}")
+
+        instruments: Dict[str, Tuple[str, str]] = {}
+        if data_fields:
+            _dump_table(
+                conn, qlib_path, calendar, data_table, data_fields, freq, batch_rows,
+                instruments=instruments,
+            )  # fmt: skip
+        if factor_fields:
+            _dump_table(
+                conn, qlib_path, calendar, factor_table, factor_fields, freq, batch_rows
+            )
+    finally:
+        conn.close()
+
+    save_calendar(qlib_path, calendar, freq)
+    save_instruments(qlib_path, instruments)
+    print(f"🎉 Qlib 数据已生成: {qlib_path}")
+
+
+def dump_update(
+    db_path: str,
+    qlib_dir: str,
+    data_fields=DATA_FIELDS,
+    factor_fields=FACTOR_FIELDS,
+    data_table: str = DATA_TABLE,
+    factor_table: str = FACTOR_TABLE,
+    xdxr_table: str = XDXR_TABLE,
+    freq: str = "day",
+    batch_rows: int = 1_000_000,
+):
+    """
+    增量更新已有的 Qlib 数据目录，等价于 qlib_dump.sh update。
+
+    日历只追加晚于 day.txt 最后一天的日期；每只股票只查询 all.txt 中结束日期
+    之后的行。复权因子的水位线取自各自的 .bin，历史有变化的股票整体重写，
+    其余只追加新的因子值。
+    """
+    qlib_path = Path(qlib_dir).expanduser()
+    data_fields = _parse_fields(data_fields)
+    factor_fields = _parse_fields(factor_fields)
+    old_calendar = load_calendar(qlib_path, freq)
+    instruments = load_instruments(qlib_path)
+
+    conn = duckdb.connect(str(Path(db_path).expanduser()), read_only=True)
+    try:
+        new_dates = (
+            conn.execute(
+                f"SELECT DISTINCT date FROM {data_table} WHERE date > ? ORDER BY date",
+                [_date_str(old_calendar[-1])],
+            )
+            .fetch_arrow_table()
+            .column("date")
+            .to_numpy()
+            .astype("datetime64[D]")
+        )
+        calendar = np.concatenate([old_calendar, new_dates])
+        if len(new_dates):
+            print(f"新增 {len(new_dates)} 个交易日: {new_dates[0]} - {new_dates[-1]}")
+        else:
+            print(f"没有新的交易日: {old_calendar[-1]}")
+
+        watermarks = pa.table(
+            {
+                "symbol": [name.lower() for name in instruments],
+                "end_date": pa.array(
+                    np.array([end for _, end in instruments.values()], "datetime64[D]")
+                ),
+            }
+        )
+        if data_fields:
+            _dump_table(
+                conn, qlib_path, calendar, data_table, data_fields, freq, batch_rows,
+                instruments=instruments, watermarks=watermarks,
+            )  # fmt: skip
+        if factor_fields:
+            factor_watermarks = bin_watermarks(
+                qlib_path, old_calendar, factor_fields[0], freq
+            )
+            changed = changed_factor_symbols(
+                conn,
+                factor_watermarks,
+                factor_table,
+                factor_fields[0],
+                xdxr_table,
+                _date_str(calendar[-1]),
+            )
+            print(f"{len(changed)} 只股票复权因子历史有变化，整体重写")
+            # 不在水位线表中的股票会被当作新股整体写入
+            changed_mask = pc.is_in(
+                factor_watermarks["symbol"], pa.array(changed, pa.string())
+            )
+            appended = factor_watermarks.filter(pc.invert(changed_mask))
+            appended = appended.select(["symbol", "end_date"])
+            _dump_table(
+                conn, qlib_path, calendar, factor_table, factor_fields, freq, batch_rows,
+                watermarks=appended,
+            )  # fmt: skip
+    finally:
+        conn.close()
+
+    # 特征写完后再更新日历和股票列表，中途失败时旧的元数据仍然有效
+    save_instruments(qlib_path, dict(sorted(instruments.items())))
+    save_calendar(qlib_path, calendar, freq)
+    print(f"🎉 Qlib 数据已更新: {qlib_path}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"dump_all": dump_all, "dump_update": dump_update})
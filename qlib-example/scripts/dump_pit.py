@@ -14,10 +14,11 @@ from functools import partial
 from concurrent.futures import ProcessPoolExecutor
 
 import fire
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from loguru import logger
-from qlib.utils import fname_to_code, get_period_offset
+from qlib.utils import fname_to_code
 from qlib.config import C
 
 
@@ -47,6 +48,18 @@ class DumpPitData:
     PERIOD_DTYPE_SIZE = struct.calcsize(PERIOD_DTYPE)
     DATA_DTYPE_SIZE = struct.calcsize(DATA_DTYPE)
 
+    # numpy equivalents of the struct formats above, used to build and write whole files at once
+    INDEX_RECORD_DTYPE = np.dtype(INDEX_DTYPE)
+    DATA_RECORD_DTYPE = np.dtype(
+        [
+            ("date", C.pit_record_type["date"]),
+            ("period", C.pit_record_type["period"]),
+            ("value", C.pit_record_type["value"]),
+            ("_next", C.pit_record_type["index"]),
+        ]
+    )
+    assert DATA_RECORD_DTYPE.itemsize == DATA_DTYPE_SIZE
+
     UPDATE_MODE = "update"
     ALL_MODE = "all"
 
@@ -182,86 +195,107 @@ class DumpPitData:
         if df.empty:
             logger.warning(f"{symbol} file is empty")
             return
+        quarterly = interval == self.INTERVAL_quarterly
         for field in self.get_dump_fields(df):
-            df_sub = df.query(f'{self.field_column_name}=="{field}"').sort_values(self.date_column_name)
+            df_sub = df[df[self.field_column_name] == field].sort_values(self.date_column_name, kind="stable")
             if df_sub.empty:
                 logger.warning(f"field {field} of {symbol} is empty")
                 continue
             data_file, index_file = self.get_filenames(symbol, field, interval)
 
-            ## calculate first & last period
-            start_year = df_sub[self.period_column_name].min()
-            end_year = df_sub[self.period_column_name].max()
-            if interval == self.INTERVAL_quarterly:
-                start_year //= 100
-                end_year //= 100
-
-            # adjust `first_year` if existing data found
-            if not overwrite and index_file.exists():
-                with open(index_file, "rb") as fi:
-                    (first_year,) = struct.unpack(self.PERIOD_DTYPE, fi.read(self.PERIOD_DTYPE_SIZE))
-                    n_years = len(fi.read()) // self.INDEX_DTYPE_SIZE
-                    if interval == self.INTERVAL_quarterly:
-                        n_years //= 4
-                    start_year = first_year + n_years
+            # load the existing index (and the date watermark of the data file) unless overwriting
+            append = not overwrite and index_file.exists()
+            existing = None
+            if append:
+                index = np.fromfile(index_file, dtype=self.INDEX_RECORD_DTYPE)
+                first_year, index = int(index[0]), index[1:]
+                if data_file.exists() and data_file.stat().st_size > 0:
+                    existing = np.memmap(data_file, dtype=self.DATA_RECORD_DTYPE, mode="r+")
+                    # remove overlapped data
+                    df_sub = df_sub[df_sub[self.date_column_name] > existing["date"][-1]]
             else:
-                with open(index_file, "wb") as f:
-                    f.write(struct.pack(self.PERIOD_DTYPE, start_year))
-                first_year = start_year
-
-            # if data already exists, continue to the next field
-            if start_year > end_year:
+                index = np.empty(0, dtype=self.INDEX_RECORD_DTYPE)
+                first_year = df_sub[self.period_column_name].min()
+                if quarterly:
+                    first_year //= 100
+
+            periods = df_sub[self.period_column_name].to_numpy(dtype=np.int64)
+            offsets = self._period_offsets(periods, first_year, quarterly)
+            if (offsets < 0).any():
+                logger.warning(f"{symbol}-{field} has periods before {first_year}, skip them")
+                df_sub, periods, offsets = df_sub[offsets >= 0], periods[offsets >= 0], offsets[offsets >= 0]
+            if df_sub.empty:
                 logger.warning(f"{symbol}-{field} data already exists, continue to the next field")
                 continue
 
-            # dump index filled with NA
-            with open(index_file, "ab") as fi:
-                for year in range(start_year, end_year + 1):
-                    if interval == self.INTERVAL_quarterly:
-                        fi.write(struct.pack(self.INDEX_DTYPE * 4, *[self.NA_INDEX] * 4))
-                    else:
-                        fi.write(struct.pack(self.INDEX_DTYPE, self.NA_INDEX))
-
-            # if data already exists, remove overlapped data
-            if not overwrite and data_file.exists():
-                with open(data_file, "rb") as fd:
-                    fd.seek(-self.DATA_DTYPE_SIZE, 2)
-                    last_date, _, _, _ = struct.unpack(self.DATA_DTYPE, fd.read())
-                df_sub = df_sub.query(f"{self.date_column_name}>{last_date}")
-            # otherwise,
-            # 1) truncate existing file or create a new file with `wb+` if overwrite,
-            # 2) or append existing file or create a new file with `ab+` if not overwrite
-            else:
-                with open(data_file, "wb+" if overwrite else "ab+"):
-                    pass
-
-            with open(data_file, "rb+") as fd, open(index_file, "rb+") as fi:
-                # update index if needed
-                for i, row in df_sub.iterrows():
-                    # get index
-                    offset = get_period_offset(first_year, row.period, interval == self.INTERVAL_quarterly)
-
-                    fi.seek(self.PERIOD_DTYPE_SIZE + self.INDEX_DTYPE_SIZE * offset)
-                    (cur_index,) = struct.unpack(self.INDEX_DTYPE, fi.read(self.INDEX_DTYPE_SIZE))
-
-                    # Case I: new data => update `_next` with current index
-                    if cur_index == self.NA_INDEX:
-                        fi.seek(self.PERIOD_DTYPE_SIZE + self.INDEX_DTYPE_SIZE * offset)
-                        fi.write(struct.pack(self.INDEX_DTYPE, fd.tell()))
-                    # Case II: previous data exists => find and update the last `_next`
-                    else:
-                        _cur_fd = fd.tell()
-                        prev_index = self.NA_INDEX
-                        while cur_index != self.NA_INDEX:  # NOTE: first iter always != NA_INDEX
-                            fd.seek(cur_index + self.DATA_DTYPE_SIZE - self.INDEX_DTYPE_SIZE)
-                            prev_index = cur_index
-                            (cur_index,) = struct.unpack(self.INDEX_DTYPE, fd.read(self.INDEX_DTYPE_SIZE))
-                        fd.seek(prev_index + self.DATA_DTYPE_SIZE - self.INDEX_DTYPE_SIZE)
-                        fd.write(struct.pack(self.INDEX_DTYPE, _cur_fd))  # NOTE: add _next pointer
-                        fd.seek(_cur_fd)
-
-                    # dump data
-                    fd.write(struct.pack(self.DATA_DTYPE, row.date, row.period, row.value, self.NA_INDEX))
+            # extend the index with NA up to the last year
+            n_slots = int(offsets.max()) + 1
+            if quarterly:
+                n_slots = (n_slots + 3) // 4 * 4
+            if len(index) < n_slots:
+                index = np.concatenate([index, np.full(n_slots - len(index), self.NA_INDEX, self.INDEX_RECORD_DTYPE)])
+
+            base = 0 if existing is None else len(existing) * self.DATA_DTYPE_SIZE
+            records, heads, head_positions = self._build_records(df_sub, offsets, base)
+
+            # link the new chains: either to the index (new period) or to the tail of the existing chain
+            linked = index[heads] != self.NA_INDEX
+            index[heads[~linked]] = head_positions[~linked]
+            if linked.any():
+                tails = self._chain_tails(existing, first_year, quarterly, heads[linked])
+                existing["_next"][tails] = head_positions[linked]
+                existing.flush()
+            del existing
+
+            with open(data_file, "ab" if base else "wb") as fd:
+                records.tofile(fd)
+            with open(index_file, "wb") as fi:
+                np.array([first_year], dtype=self.PERIOD_DTYPE).tofile(fi)
+                index.tofile(fi)
+
+    @staticmethod
+    def _period_offsets(periods: np.ndarray, first_year: int, quarterly: bool) -> np.ndarray:
+        """Vectorized ``qlib.utils.get_period_offset``."""
+        if quarterly:
+            return (periods // 100 - first_year) * 4 + periods % 100 - 1
+        return periods - first_year
+
+    def _build_records(self, df_sub: pd.DataFrame, offsets: np.ndarray, base: int):
+        """Build the data records of ``df_sub`` (sorted by date) to be written at byte ``base``.
+
+        Revisions of the same period are chained through ``_next`` in date order: a stable sort on the
+        period offset groups the records of each period while keeping their date order.
+
+        Returns the records, and the index slot and byte position of the first record of each period.
+        """
+        n = len(df_sub)
+        positions = base + np.arange(n, dtype=np.int64) * self.DATA_DTYPE_SIZE
+        if n and positions[-1] >= self.NA_INDEX:
+            raise ValueError("PIT data file is too large for the index type")
+        records = np.empty(n, dtype=self.DATA_RECORD_DTYPE)
+        records["date"] = df_sub[self.date_column_name].to_numpy()
+        records["period"] = df_sub[self.period_column_name].to_numpy()
+        records["value"] = df_sub[self.value_column_name].to_numpy()
+        records["_next"] = self.NA_INDEX
+
+        order = np.argsort(offsets, kind="stable")
+        same = offsets[order[1:]] == offsets[order[:-1]]
+        records["_next"][order[:-1][same]] = positions[order[1:][same]]
+        first = order[np.concatenate(([True], ~same))]
+        return records, offsets[first], positions[first]
+
+    def _chain_tails(self, existing: np.ndarray, first_year: int, quarterly: bool, slots: np.ndarray) -> np.ndarray:
+        """Record numbers of the last existing revision of each slot.
+
+        Every revision is appended after the previous one of its period, so the tail of a chain is the last
+        record of that period in the file.
+        """
+        offsets = self._period_offsets(existing["period"].astype(np.int64), first_year, quarterly)
+        last = np.full(int(max(offsets.max(), slots.max())) + 1, -1, dtype=np.int64)
+        np.maximum.at(last, offsets, np.arange(len(offsets)))
+        tails = last[slots]
+        assert (tails >= 0).all(), "PIT index points to a period missing from the data file"
+        return tails
 
     def dump(self, interval="quarterly", overwrite=False):
         logger.info("start dump pit data......")
@@ -0,0 +1,107 @@
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculate.calc_indicator import run_indicator_calculate
+from database import indicator, indicator_state
+from database.connection import connection
+from database.indicator import IndicatorState
+
+SYMBOLS = ["sh600000", "sh600001", "sz000001", "sz000002"]
+SPLIT_DATE = "2020-02-28"
+
+
+def _make_db(path: str) -> pd.DataFrame:
+    """随机行情，SPLIT_DATE 之后的部分另外返回，模拟之后新到的 K 线"""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2019-01-01", "2020-04-30")
+    frames = []
+    for symbol in SYMBOLS:
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+        open_ = close * (1 + rng.normal(0, 0.005, len(dates)))
+        frames.append(
+            pd.DataFrame(
+                {
+                    "symbol": symbol,
+                    "date": dates.date,
+                    "open": open_,
+                    "high": np.maximum(open_, close) * 1.01,
+                    "low": np.minimum(open_, close) * 0.99,
+                    "close": close,
+                    "volume": rng.integers(1000, 100000, len(dates)).astype(float),
+                }
+            )
+        )
+    bars = pd.concat(frames, ignore_index=True)
+    bars["amount"] = bars["volume"] * bars["close"]
+    bars["turnover"] = 0.01
+
+    initial = bars[bars["date"] <= pd.Timestamp(SPLIT_DATE).date()]
+    with duckdb.connect(path) as conn:
+        conn.execute("CREATE TABLE raw_stocks_daily AS SELECT * FROM initial")
+        conn.execute(
+            """
+            CREATE TABLE raw_adjust_factor AS
+            SELECT symbol, date, 1.0 AS factor FROM initial
+            """
+        )
+        conn.execute(
+            """
+            CREATE VIEW v_qfq_stocks AS
+            SELECT s.symbol, s.date, s.open * f.factor AS open,
+                   s.high * f.factor AS high, s.low * f.factor AS low,
+                   s.close * f.factor AS close, s.volume, s.amount, s.turnover
+            FROM raw_stocks_daily s JOIN raw_adjust_factor f USING (symbol, date)
+            """
+        )
+        conn.execute("CREATE TABLE raw_xdxr (code VARCHAR, date DATE, category INT)")
+        conn.execute("CREATE VIEW v_xdxr AS SELECT * FROM raw_xdxr")
+    return bars[bars["date"] > pd.Timestamp(SPLIT_DATE).date()]
+
+
+@pytest.fixture
+def scratch_db(tmp_path):
+    path = str(tmp_path / "test.db")
+    new_bars = _make_db(path)
+    old_path = connection.db_path
+    connection.configure(db_path=path)
+    yield new_bars
+    connection.configure(db_path=old_path)
+
+
+def test_state_write_failure_does_not_duplicate_indicators(scratch_db, monkeypatch):
+    run_indicator_calculate(symbols=SYMBOLS)
+
+    new_bars = scratch_db
+    with connection.connection.cursor() as cursor:
+        cursor.execute("INSERT INTO raw_stocks_daily SELECT * FROM new_bars")
+        cursor.execute(
+            "INSERT INTO raw_adjust_factor SELECT symbol, date, 1.0 FROM new_bars"
+        )
+
+    replace = IndicatorState._replace
+    calls = []
+
+    def fail_once(self, cursor, df):
+        calls.append(len(df))
+        if len(calls) == 1:
+            raise RuntimeError("simulated state write failure")
+        return replace(self, cursor, df)
+
+    monkeypatch.setattr(IndicatorState, "_replace", fail_once)
+    run_indicator_calculate(symbols=SYMBOLS)
+
+    n_rows, n_keys, latest = indicator.query_df(
+        f"""
+        SELECT COUNT(*), COUNT(DISTINCT (symbol, date, indicator)), MAX(date)
+        FROM {indicator.table_name}
+        """
+    ).iloc[0]
+    assert len(calls) > 1
+    assert n_rows == n_keys
+    assert pd.Timestamp(latest) == pd.Timestamp(new_bars["date"].max())
+
+    state = indicator_state.load(SYMBOLS)
+    assert set(state["symbol"]) == set(SYMBOLS)
+    assert (pd.to_datetime(state["date"]) == pd.Timestamp(latest)).all()